@@ -0,0 +1,173 @@
+"""Partition interactions by created_at and add the user_recent_likes rollup
+
+Revision ID: 8e4a1c7b3f52
+Revises: 5b7e2c9d1a43
+Create Date: 2026-10-19 19:04:12.331907
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8e4a1c7b3f52'
+down_revision: Union[str, Sequence[str], None] = '5b7e2c9d1a43'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Most recent likes kept per user in user_recent_likes (models.RECENT_LIKES_PER_USER)
+RECENT_LIKES_PER_USER = 50
+# Monthly partitions created ahead of the current month (app/partitions.py creates later ones)
+MONTHS_AHEAD = 3
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # 1. Move the current table aside. The id sequence is kept and handed over to the new table.
+    op.execute("ALTER TABLE interactions RENAME TO interactions_unpartitioned")
+    op.execute("ALTER INDEX interactions_pkey RENAME TO interactions_unpartitioned_pkey")
+    op.execute("ALTER SEQUENCE interactions_id_seq OWNED BY NONE")
+
+    # 2. The partitioned table. Its primary key has to include the partition key.
+    op.execute("""
+        CREATE TABLE interactions (
+            id integer NOT NULL DEFAULT nextval('interactions_id_seq'),
+            user_id uuid NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+            movie_id integer NOT NULL REFERENCES movies (id) ON DELETE CASCADE,
+            interaction_type varchar NOT NULL,
+            created_at timestamp with time zone NOT NULL DEFAULT now(),
+            CONSTRAINT interactions_pkey PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """)
+    op.execute("ALTER SEQUENCE interactions_id_seq OWNED BY interactions.id")
+
+    # 3. One partition per calendar month (UTC) from the oldest interaction to a few months
+    #    ahead, plus a default partition for anything outside them
+    op.execute("CREATE TABLE interactions_default PARTITION OF interactions DEFAULT")
+    op.execute(f"""
+        DO $$
+        DECLARE
+            month_start timestamp;
+            last_month timestamp := date_trunc('month', now() AT TIME ZONE 'UTC') + interval '{MONTHS_AHEAD} months';
+        BEGIN
+            SELECT coalesce(date_trunc('month', min(created_at) AT TIME ZONE 'UTC'),
+                            date_trunc('month', now() AT TIME ZONE 'UTC'))
+              INTO month_start FROM interactions_unpartitioned;
+            WHILE month_start <= last_month LOOP
+                EXECUTE format('CREATE TABLE %I PARTITION OF interactions FOR VALUES FROM (%L) TO (%L)',
+                               'interactions_' || to_char(month_start, '"y"YYYY"m"MM'),
+                               month_start::text || '+00', (month_start + interval '1 month')::text || '+00');
+                month_start := month_start + interval '1 month';
+            END LOOP;
+        END
+        $$
+    """)
+
+    # 4. Copy the rows, then index (building the indexes after the load is much faster)
+    op.execute("""
+        INSERT INTO interactions (id, user_id, movie_id, interaction_type, created_at)
+        SELECT id, user_id, movie_id, interaction_type, created_at FROM interactions_unpartitioned
+    """)
+    op.drop_table('interactions_unpartitioned')
+    op.create_index('ix_interactions_user_id_interaction_type_created_at', 'interactions',
+                    ['user_id', 'interaction_type', 'created_at'], unique=False)
+    op.create_index('ix_interactions_user_id_movie_id', 'interactions', ['user_id', 'movie_id'], unique=False)
+
+    # 5. Rollup of each user's most recent likes, read by crud.get_user_liked_movies
+    op.create_table('user_recent_likes',
+    sa.Column('user_id', sa.UUID(), nullable=False),
+    sa.Column('movie_id', sa.Integer(), nullable=False),
+    sa.Column('liked_at', sa.TIMESTAMP(timezone=True), nullable=False),
+    sa.ForeignKeyConstraint(['movie_id'], ['movies.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'movie_id')
+    )
+    op.create_index('ix_user_recent_likes_user_id_liked_at', 'user_recent_likes', ['user_id', 'liked_at'],
+                    unique=False)
+    op.execute(f"""
+        INSERT INTO user_recent_likes (user_id, movie_id, liked_at)
+        SELECT user_id, movie_id, liked_at FROM (
+            SELECT user_id, movie_id, max(created_at) AS liked_at,
+                   row_number() OVER (PARTITION BY user_id ORDER BY max(created_at) DESC, movie_id) AS recency
+            FROM interactions WHERE interaction_type = 'like'
+            GROUP BY user_id, movie_id
+        ) likes
+        WHERE recency <= {RECENT_LIKES_PER_USER}
+    """)
+
+    # 6. Keep the rollup up to date on every write. Setting interactions.skip_rollup = 'on'
+    #    for a transaction turns this off (bulk loads and partition moves rebuild it afterwards).
+    op.execute(f"""
+        CREATE FUNCTION maintain_user_recent_likes() RETURNS trigger AS $$
+        BEGIN
+            IF current_setting('interactions.skip_rollup', true) = 'on' THEN
+                RETURN NULL;
+            END IF;
+
+            IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.interaction_type = 'like'
+                    AND (TG_OP = 'DELETE' OR NEW.interaction_type <> 'like') THEN
+                DELETE FROM user_recent_likes WHERE user_id = OLD.user_id AND movie_id = OLD.movie_id;
+                -- A full rollup may have dropped older likes; bring the next most recent one back
+                IF (SELECT count(*) FROM user_recent_likes WHERE user_id = OLD.user_id)
+                        = {RECENT_LIKES_PER_USER} - 1 THEN
+                    INSERT INTO user_recent_likes (user_id, movie_id, liked_at)
+                    SELECT user_id, movie_id, max(created_at) FROM interactions
+                    WHERE user_id = OLD.user_id AND interaction_type = 'like'
+                    GROUP BY user_id, movie_id
+                    ORDER BY max(created_at) DESC LIMIT {RECENT_LIKES_PER_USER}
+                    ON CONFLICT (user_id, movie_id) DO NOTHING;
+                END IF;
+            END IF;
+
+            IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.interaction_type = 'like' THEN
+                INSERT INTO user_recent_likes (user_id, movie_id, liked_at)
+                VALUES (NEW.user_id, NEW.movie_id, NEW.created_at)
+                ON CONFLICT (user_id, movie_id)
+                    DO UPDATE SET liked_at = greatest(user_recent_likes.liked_at, EXCLUDED.liked_at);
+                DELETE FROM user_recent_likes
+                WHERE user_id = NEW.user_id AND movie_id IN (
+                    SELECT movie_id FROM user_recent_likes WHERE user_id = NEW.user_id
+                    ORDER BY liked_at DESC, movie_id OFFSET {RECENT_LIKES_PER_USER}
+                );
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER interactions_maintain_user_recent_likes
+        AFTER INSERT OR DELETE OR UPDATE OF interaction_type ON interactions
+        FOR EACH ROW EXECUTE FUNCTION maintain_user_recent_likes()
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER interactions_maintain_user_recent_likes ON interactions")
+    op.execute("DROP FUNCTION maintain_user_recent_likes()")
+    op.drop_index('ix_user_recent_likes_user_id_liked_at', table_name='user_recent_likes')
+    op.drop_table('user_recent_likes')
+
+    # Back to a single table, with every attached partition's rows (detached ones stay separate tables)
+    op.execute("ALTER TABLE interactions RENAME TO interactions_partitioned")
+    op.execute("ALTER INDEX interactions_pkey RENAME TO interactions_partitioned_pkey")
+    op.execute("ALTER SEQUENCE interactions_id_seq OWNED BY NONE")
+    op.execute("""
+        CREATE TABLE interactions (
+            id integer NOT NULL DEFAULT nextval('interactions_id_seq'),
+            user_id uuid NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+            movie_id integer NOT NULL REFERENCES movies (id) ON DELETE CASCADE,
+            interaction_type varchar NOT NULL,
+            created_at timestamp with time zone NOT NULL DEFAULT now(),
+            CONSTRAINT interactions_pkey PRIMARY KEY (id)
+        )
+    """)
+    op.execute("ALTER SEQUENCE interactions_id_seq OWNED BY interactions.id")
+    op.execute("""
+        INSERT INTO interactions (id, user_id, movie_id, interaction_type, created_at)
+        SELECT id, user_id, movie_id, interaction_type, created_at FROM interactions_partitioned
+    """)
+    # Dropping the parent drops its partitions too
+    op.drop_table('interactions_partitioned')
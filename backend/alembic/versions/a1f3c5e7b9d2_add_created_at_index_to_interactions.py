@@ -0,0 +1,29 @@
+"""Add created_at index to interactions
+
+Revision ID: a1f3c5e7b9d2
+Revises: 8e4a1c7b3f52
+Create Date: 2026-10-19 20:41:37.118604
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a1f3c5e7b9d2'
+down_revision: Union[str, Sequence[str], None] = '8e4a1c7b3f52'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Incremental exports read a created_at range, usually a small part of one partition
+    op.create_index('ix_interactions_created_at', 'interactions', ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_interactions_created_at', table_name='interactions')
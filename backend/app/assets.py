@@ -8,6 +8,10 @@ def get_model_assets():
     """Get the current model assets dictionary"""
     return model_assets
 
+def get_model_version():
+    """Get the version identifier of the loaded model assets, or None if nothing is loaded"""
+    return model_assets.get('model_version')
+
 def update_model_assets(new_assets):
     """Update the model assets dictionary"""
     model_assets.update(new_assets)
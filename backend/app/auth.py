@@ -1,24 +1,46 @@
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, Header, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
-from . import database, models, schemas
-from passlib.context import CryptContext
-from jose import JWTError, jwt
+from . import database, lazy, models, schemas
 from datetime import datetime, timedelta, timezone
 import os
+import secrets
+import threading
+import time
+import uuid
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Imported on first use, so CLI commands and processes that never handle a login don't pay for them
+passlib_context = lazy.module("passlib.context")
+jwt = lazy.module("jose.jwt")
+
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"))
+# How long an authenticated user record may be served from memory before it is re-read.
+# Set to 0 to disable the cache and query the database on every request.
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "30"))
+# Shared secret for the /admin endpoints, sent in the X-Admin-Token header.
+# The admin endpoints are disabled (404) when it isn't set.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
 
 # 1. Create a CryptContext instance
 #    This tells passlib which hashing algorithm to use.
 #    "bcrypt" is the recommended standard.
 #    'deprecated="auto"' will automatically handle updating hashes if we ever change the algorithm.
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+#    Created on first use, so passlib is only imported when a password is hashed or checked.
+_pwd_context = None
+_pwd_context_lock = threading.Lock()
+
+def get_pwd_context():
+    global _pwd_context
+    if _pwd_context is None:
+        with _pwd_context_lock:
+            if _pwd_context is None:
+                _pwd_context = passlib_context.CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return _pwd_context
 
 
 # 2. Function to hash a password
@@ -26,7 +48,7 @@ def hash_password(password: str):
     """
     Takes a plain-text password and returns its bcrypt hash.
     """
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 
 # 3. Function to verify a password
@@ -35,7 +57,7 @@ def verify_password(plain_password: str, hashed_password: str):
     Compares a plain-text password with a stored hash.
     Returns True if they match, False otherwise.
     """
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 # 4. Function to create a JWT access token
 def create_access_token(data: dict):
@@ -79,29 +101,131 @@ def verify_access_token(token: str, credentials_exception):
         # For now, just returning the user_id is fine.
         return user_id
     
-    except JWTError:
+    except jwt.JWTError:
         # If the token is invalid (bad signature, expired, etc.), raise an error
         raise credentials_exception
 
 
-# --- NEW: The Main "Get Current User" Dependency ---
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
+# --- Authenticated User Cache ---
+# Maps user_id -> (expires_at, detached User object). Protected endpoints hit this on
+# every request, so a short TTL saves a SELECT on the users table for most of them.
+_user_cache = {}
+_user_cache_lock = threading.Lock()
+
+
+def _get_cached_user(user_id):
+    with _user_cache_lock:
+        entry = _user_cache.get(user_id)
+        if entry is None:
+            return None
+        expires_at, user = entry
+        if expires_at < time.monotonic():
+            del _user_cache[user_id]
+            return None
+        return user
+
+
+def _cache_user(user_id, user):
+    if USER_CACHE_TTL_SECONDS <= 0:
+        return
+    with _user_cache_lock:
+        _user_cache[user_id] = (time.monotonic() + USER_CACHE_TTL_SECONDS, user)
+
+
+def invalidate_cached_user(user_id):
     """
-    A dependency that can be used in any protected endpoint.
-    It verifies the token and returns the full user object from the database.
+    Drops a user from the authenticated-user cache.
+    Call this whenever the user's row changes so the next request re-reads it.
     """
-    credentials_exception = HTTPException(
+    with _user_cache_lock:
+        _user_cache.pop(str(user_id), None)
+
+
+def clear_user_cache():
+    """Clear the whole authenticated-user cache"""
+    with _user_cache_lock:
+        _user_cache.clear()
+
+
+def _credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    
-    # Verify the token to get the user's ID
+
+
+# --- Lightweight "Get Current User ID" Dependency ---
+def get_current_user_id(token: str = Depends(oauth2_scheme)) -> uuid.UUID:
+    """
+    A dependency for protected endpoints that only need the user's ID.
+    It verifies the token and never touches the database.
+    """
+    credentials_exception = _credentials_exception()
     user_id = verify_access_token(token, credentials_exception)
+
+    try:
+        return uuid.UUID(user_id)
+    except (ValueError, TypeError, AttributeError):
+        raise credentials_exception
+
+
+# --- Read Session For The Current User ---
+def get_user_read_db(current_user_id: uuid.UUID = Depends(get_current_user_id)):
+    """
+    A dependency giving protected endpoints a read-only session for the current user's data:
+    on the read replica, or on the primary for a few seconds after the user wrote something
+    (see database.READ_YOUR_WRITES_SECONDS) so they always see their own changes.
+    """
+    db = database.session_for_user_reads(current_user_id)
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+# --- The Main "Get Current User" Dependency ---
+def get_current_user(current_user_id: uuid.UUID = Depends(get_current_user_id),
+                     db: Session = Depends(get_user_read_db)):
+    """
+    A dependency that can be used in any protected endpoint.
+    It verifies the token and returns the full user object, served from the
+    authenticated-user cache when possible and from the database otherwise.
+    Raises 401 when the token's user no longer exists.
+    """
+    user = get_user_by_id(db, current_user_id)
+    # You could add more checks here, e.g., if user.is_active is False
+    if user is None:
+        raise _credentials_exception()
+
+    return user
+
+
+def get_user_by_id(db: Session, user_id):
+    """
+    Returns the user with this ID, from the authenticated-user cache when possible.
+    Objects served from the cache are detached from any session; treat them as read-only.
+    """
+    user_id = str(user_id)
+    user = _get_cached_user(user_id)
+    if user is not None:
+        return user
     
     # Get the user from the database using the ID from the token
     user = db.query(models.User).filter(models.User.id == user_id).first()
 
-    # You could add more checks here, e.g., if user.is_active is False
+    if user is not None:
+        # Detach the user from this session so a later commit in the same request
+        # doesn't expire the attributes of the object we hand out from the cache.
+        db.expunge(user)
+        _cache_user(user_id, user)
     
-    return user
\ No newline at end of file
+    return user
+
+
+def require_admin_token(x_admin_token: str = Header(None)):
+    """Dependency guarding the /admin endpoints with the ADMIN_TOKEN shared secret"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
@@ -0,0 +1,156 @@
+# Compact columnar movie catalog
+# Built once from movies_df when the model assets load, and used on the serving path instead
+# of the DataFrame. Every column is a plain NumPy array indexed by row position: int32 years,
+# float32 ratings, int32 votes and int32 codes into the interned genre strings. tconst and
+# title are stored as UTF-8 bytes in one contiguous buffer per column with an offsets array,
+# so the catalog holds no per-row Python objects and a request only decodes the rows it returns.
+import sys
+
+import numpy as np
+
+from . import lazy
+
+pd = lazy.module("pandas")
+
+# startYear of movies without one (years are stored as int32, which has no NaN)
+MISSING_YEAR = 0
+# Ratings are stored as float32; reading them back rounds to this many decimals, which
+# restores the exact float64 value of ratings with fewer decimals (IMDb uses one)
+RATING_DECIMALS = 6
+
+
+class StringColumn:
+    """
+    Strings stored back to back as UTF-8 in one uint8 buffer; string i is
+    data[offsets[i]:offsets[i + 1]]. Missing values are flagged in `nulls` (None if there are none).
+    """
+
+    def __init__(self, values):
+        values = np.asarray(values, dtype=object)
+        null_mask = pd.isna(values)
+        encoded = [b"" if missing else str(value).encode("utf-8") for value, missing in zip(values, null_mask)]
+        lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+        self.offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.offsets[1:])
+        self.data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        self.nulls = null_mask if null_mask.any() else None
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, position):
+        if self.nulls is not None and self.nulls[position]:
+            return None
+        return self.data[self.offsets[position]:self.offsets[position + 1]].tobytes().decode("utf-8")
+
+    def take(self, positions):
+        """Decodes the strings at `positions` into a list"""
+        return [self[position] for position in positions]
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + self.offsets.nbytes + (self.nulls.nbytes if self.nulls is not None else 0)
+
+
+class MovieCatalog:
+    """
+    Read-only columnar copy of movies_df, addressed by row position.
+
+    Args:
+        movies_df: DataFrame with 'tconst', 'primaryTitle', 'startYear', 'genres',
+            'averageRating' and 'numVotes' columns.
+        indices_map: Optional mapping from 'Title (Year)' to movies_df index labels;
+            resolved to row positions once here so profile lookups skip the DataFrame.
+    """
+
+    def __init__(self, movies_df, indices_map=None):
+        self.n = len(movies_df)
+        self.tconst = StringColumn(movies_df['tconst'].to_numpy())
+        self.title = StringColumn(movies_df['primaryTitle'].to_numpy())
+
+        years = pd.to_numeric(movies_df['startYear'], errors='coerce').to_numpy(dtype=np.float64)
+        self.year = np.where(np.isnan(years), MISSING_YEAR, years).astype(np.int32)
+        self.rating = movies_df['averageRating'].to_numpy(dtype=np.float32, na_value=np.nan)
+        votes = pd.to_numeric(movies_df['numVotes'], errors='coerce')
+        # int32 has no NaN: missing counts are stored as 0 and flagged here (None if there are none)
+        missing_votes = votes.isna().to_numpy()
+        self.votes = votes.fillna(0).to_numpy().astype(np.int32)
+        self.votes_missing = missing_votes if missing_votes.any() else None
+
+        # Each distinct genres string is kept once; rows hold its code (-1 for none)
+        codes, uniques = pd.factorize(movies_df['genres'])
+        self.genre_codes = codes.astype(np.int32)
+        self.genre_values = [str(value) for value in uniques]
+
+        # Catalog-wide statistics the re-ranking stage needs, computed like the DataFrame version
+        self.vote_quantile = float(votes.quantile(0.70))
+        self.rating_mean = float(movies_df['averageRating'].mean())
+        self.year_min = float(np.nanmin(years)) if self.n and not np.isnan(years).all() else np.nan
+        self.year_max = float(np.nanmax(years)) if self.n and not np.isnan(years).all() else np.nan
+
+        self.key_positions = None
+        if indices_map is not None:
+            self.set_keys(indices_map, movies_df.index)
+
+    def set_keys(self, indices_map, df_index):
+        """Resolves indices_map's index labels to row positions (keys not in the catalog are dropped)"""
+        keys = indices_map[~indices_map.index.duplicated()]
+        positions = df_index.get_indexer(keys.to_numpy())
+        found = positions >= 0
+        # Shares the key strings with indices_map instead of copying them
+        self.key_positions = pd.Series(positions[found].astype(np.int32), index=keys.index[found])
+
+    def __len__(self):
+        return self.n
+
+    def position_of(self, title_year):
+        """
+        Row position of a 'Title (Year)' key.
+
+        Raises:
+            KeyError: If the key isn't in the catalog.
+        """
+        if self.key_positions is None:
+            raise KeyError(title_year)
+        return int(self.key_positions[title_year])
+
+    def positions_of_tconsts(self, tconsts):
+        """Row position of each tconst, -1 for tconsts not in the catalog (decodes every tconst; not for the hot path)"""
+        positions = pd.Series(np.arange(self.n), index=self.tconst.take(range(self.n)))
+        positions = positions[~positions.index.duplicated()]
+        found = positions.index.get_indexer(tconsts)
+        return np.where(found >= 0, positions.to_numpy()[found], -1)
+
+    def years(self, positions):
+        """startYear of the rows as float64, NaN where missing"""
+        years = self.year[positions].astype(np.float64)
+        years[years == MISSING_YEAR] = np.nan
+        return years
+
+    def vote_counts(self, positions):
+        """numVotes of the rows as float64, NaN where missing"""
+        votes = self.votes[positions].astype(np.float64)
+        if self.votes_missing is not None:
+            votes[self.votes_missing[positions]] = np.nan
+        return votes
+
+    def ratings(self, positions):
+        """averageRating of the rows as float64, NaN where missing"""
+        return np.round(self.rating[positions].astype(np.float64), RATING_DECIMALS)
+
+    def genres(self, positions):
+        """Genres string of each row (None where missing); the strings are shared, not copied"""
+        values = self.genre_values
+        return [values[code] if code >= 0 else None for code in self.genre_codes[positions].tolist()]
+
+    @property
+    def nbytes(self):
+        """Memory held by the columns (the key strings are shared with indices_map)"""
+        arrays = (self.year, self.rating, self.votes, self.genre_codes)
+        total = self.tconst.nbytes + self.title.nbytes + sum(a.nbytes for a in arrays)
+        if self.votes_missing is not None:
+            total += self.votes_missing.nbytes
+        total += sum(sys.getsizeof(value) for value in self.genre_values)
+        if self.key_positions is not None:
+            total += self.key_positions.to_numpy().nbytes
+        return total
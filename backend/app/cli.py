@@ -0,0 +1,345 @@
+# Command-line interface
+# Offline commands (seeding, featurization, CF training, evaluation, partition maintenance,
+# exports, the startup report). Kept out of app.main so serving never imports the modules
+# they need (scipy-based training, evaluation, featurization...); run them with
+#
+#     python -m app.main <command>
+import logging
+import os
+import time
+from typing import List
+
+import numpy as np
+import typer
+from sqlalchemy.exc import SQLAlchemyError
+
+from .model_loader import MODEL_ASSETS_DIR, load_model_assets
+from . import database, seed_db, collaborative, evaluation, catalog, recommender, sharding, featurization, lazy, startup, model_loader, partitions, export
+
+logger = logging.getLogger(__name__)
+
+cli_app = typer.Typer()
+
+
+@cli_app.command("seed-db-command")
+def seed_db_command(
+    new_only: bool = typer.Option(False, help="Only insert the movies that aren't in a non-empty table yet"),
+):
+    """
+    Command-line utility to seed the database with movie data.
+    """
+    typer.echo("Seeding process initiated...")
+    
+    # We can't use the 'model_assets' from the running app,
+    # so we'll load them fresh for this one-off command.
+    assets = load_model_assets(build_indexes=False)
+    movies_df = assets.get('movies_df')
+    
+    if movies_df is not None:
+        db = database.SessionLocal()
+        try:
+            if new_only:
+                typer.echo(f"Inserted {seed_db.seed_new_movies(db, movies_df)} new movies.")
+            else:
+                # Call our refactored seeder function
+                seed_db.seed_movies_table(db, movies_df)
+        finally:
+            db.close()
+    else:
+        typer.echo("Could not load movies_df. Aborting.")
+
+
+@cli_app.command("train-cf")
+def train_cf_command(
+    factors: int = collaborative.CF_FACTORS,
+    iterations: int = collaborative.CF_ITERATIONS,
+    regularization: float = collaborative.CF_REGULARIZATION,
+    alpha: float = collaborative.CF_ALPHA,
+    threads: int = collaborative.CF_THREADS,
+    batch_size: int = collaborative.CF_BATCH_SIZE,
+    model_dir: str = collaborative.CF_MODEL_DIR,
+):
+    """
+    Trains the implicit-ALS collaborative model on every 'like' in the interactions table
+    and saves its factors as a new versioned asset in model_dir.
+    """
+    typer.echo("Streaming likes from the interactions table...")
+    start = time.perf_counter()
+    builder = collaborative.InteractionMatrixBuilder()
+    db = database.SessionLocal()
+    try:
+        for batch in collaborative.stream_liked_pairs(db, batch_size):
+            builder.add_batch(batch)
+    finally:
+        db.close()
+
+    if len(builder) == 0:
+        typer.echo("No likes to train on. Aborting.")
+        raise typer.Exit(code=1)
+
+    matrix, user_ids, item_tconsts = builder.build()
+    typer.echo(f"Read {matrix.nnz} likes from {matrix.shape[0]} users on {matrix.shape[1]} movies "
+               f"in {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    user_factors, item_factors = collaborative.train_als(
+        matrix, factors=factors, iterations=iterations, regularization=regularization, alpha=alpha, threads=threads,
+        on_iteration=lambda i, seconds: typer.echo(f"  iteration {i + 1}/{iterations}: {seconds:.2f}s")
+    )
+    typer.echo(f"Trained {factors} factors in {time.perf_counter() - start:.1f}s on {threads} threads")
+
+    params = {"factors": factors, "iterations": iterations, "regularization": regularization, "alpha": alpha,
+              "likes": int(matrix.nnz)}
+    path = collaborative.save_model(user_ids, item_tconsts, user_factors, item_factors, params, model_dir)
+    typer.echo(f"Saved model to {path}. Restart the API to serve it.")
+
+
+@cli_app.command("featurize")
+def featurize_command(
+    input_dir: str = typer.Argument(..., help="Directory with title.basics, title.ratings and title.principals TSVs"),
+    output_dir: str = typer.Option(MODEL_ASSETS_DIR or "model_assets", help="Where the model assets are written"),
+    append: bool = typer.Option(False, help="Append the titles in input_dir that aren't in output_dir's assets yet"),
+    chunk_size: int = featurization.FEATURIZE_CHUNK_SIZE,
+    min_votes: int = featurization.FEATURIZE_MIN_VOTES,
+    people_features: int = featurization.PEOPLE_HASH_FEATURES,
+):
+    """
+    Builds movies_df, indices_map and the people and genre TF-IDF matrices from IMDb-style TSVs.
+    With --append, new titles are added as extra rows of the existing assets instead of refitting.
+    """
+    start = time.perf_counter()
+    if append:
+        try:
+            existing, vocabulary = featurization.load_assets(output_dir)
+            built, n_new = featurization.append_assets(existing, vocabulary, input_dir, chunk_size, min_votes)
+        except (FileNotFoundError, ValueError) as e:
+            typer.echo(str(e))
+            raise typer.Exit(code=1)
+        if n_new == 0:
+            typer.echo("No new titles to append.")
+            return
+        typer.echo(f"Appended {n_new} titles ({len(built['movies_df'])} in total) "
+                   f"in {time.perf_counter() - start:.1f}s")
+        if featurization.needs_refit(vocabulary):
+            typer.echo(f"Warning: {vocabulary.appended_documents} titles were appended since the last full build "
+                       f"of {vocabulary.fitted_documents}; rebuild without --append to refresh the IDF weights.")
+    else:
+        try:
+            built, vocabulary = featurization.build_assets(input_dir, chunk_size, min_votes, people_features)
+        except FileNotFoundError as e:
+            typer.echo(str(e))
+            raise typer.Exit(code=1)
+        typer.echo(f"Built {len(built['movies_df'])} titles in {time.perf_counter() - start:.1f}s")
+
+    featurization.save_assets(built, vocabulary, output_dir)
+    typer.echo(f"Assets written to {output_dir}. Point MODEL_ASSETS_DIR at it and restart the API to serve them.")
+    if append:
+        # Likes and recommendations look movies up by tconst in the movies table, so the
+        # appended titles have to be inserted there too
+        db = database.SessionLocal()
+        try:
+            inserted = seed_db.seed_new_movies(db, built['movies_df'].tail(n_new))
+            typer.echo(f"Inserted {inserted} of the appended titles into the movies table.")
+        except SQLAlchemyError as e:
+            logger.error(f"Failed to insert the appended titles: {e}")
+            typer.echo("Could not insert the appended titles into the movies table; "
+                       "run `seed-db-command --new-only` once the database is reachable.")
+            raise typer.Exit(code=1)
+        finally:
+            db.close()
+
+
+@cli_app.command("evaluate")
+def evaluate_command(
+    scorer: List[str] = typer.Option(["content", "popularity"], help=f"Scorers to compare: {', '.join(evaluation.SCORERS)}"),
+    k: List[int] = typer.Option(list(evaluation.DEFAULT_KS), help="Cut-offs for hit rate and NDCG"),
+    source: str = typer.Option("db", help="'db' (likes in the interactions table) or 'synthetic'"),
+    synthetic_users: int = 2000,
+    max_users: int = typer.Option(0, help="Evaluate a random sample of this many users (0 for all)"),
+    workers: int = 0,
+    n_candidates: int = recommender.N_CANDIDATES,
+    mmr_lambda: float = typer.Option(evaluation.DEFAULT_MMR_LAMBDA, help="Relevance/diversity trade-off of content_mmr"),
+    seed: int = 0,
+    output_dir: str = evaluation.EVALUATION_OUTPUT_DIR,
+):
+    """
+    Offline evaluation: holds out each user's last like, ranks with every scorer and reports
+    hit-rate@k, NDCG@k and per-user latency side by side.
+    """
+    loaded = load_model_assets(build_indexes=False)
+    if loaded.get('movies_df') is None:
+        typer.echo("Could not load movies_df. Aborting.")
+        raise typer.Exit(code=1)
+    loaded['movie_catalog'] = catalog.MovieCatalog(loaded['movies_df'], loaded.get('indices_map'))
+    if sharding.SCORING_SHARDS > 1:
+        loaded['scoring_shards'] = sharding.build_sharded_scorer(loaded['people_tfidf_matrix'],
+                                                                 loaded['genre_tfidf_matrix'])
+
+    if source == "synthetic":
+        histories = list(evaluation.synthetic_histories(loaded['movie_catalog'], synthetic_users, seed=seed))
+    elif source == "db":
+        db = database.SessionLocal()
+        try:
+            histories = evaluation.load_histories(db, loaded['movie_catalog'])
+        finally:
+            db.close()
+    else:
+        typer.echo(f"Unknown source '{source}'. Use 'db' or 'synthetic'.")
+        raise typer.Exit(code=1)
+
+    split = evaluation.leave_last_out(histories)
+    if max_users and len(split) > max_users:
+        sample = np.random.default_rng(seed).choice(len(split), max_users, replace=False)
+        split = [split[i] for i in sorted(sample)]
+    if not split:
+        typer.echo("No users with at least two likes to evaluate. Aborting.")
+        raise typer.Exit(code=1)
+    cf_training = None
+    if "hybrid" in scorer:
+        # The served CF model was trained on every like, held-out ones included, so the hybrid
+        # scorer gets one trained on the split instead
+        typer.echo("Training the CF model on the split, without the held-out likes...")
+        try:
+            loaded['cf_model'], cf_training = evaluation.train_split_model(histories, split, loaded['movie_catalog'],
+                                                                           seed=seed)
+        except ValueError as e:
+            typer.echo(str(e))
+            raise typer.Exit(code=1)
+    typer.echo(f"Evaluating {len(split)} users with {', '.join(scorer)}...")
+
+    start = time.perf_counter()
+    try:
+        results = evaluation.run_evaluation(split, loaded, scorer, ks=k, workers=workers, n_candidates=n_candidates,
+                                             mmr_lambda=mmr_lambda)
+    except ValueError as e:
+        typer.echo(str(e))
+        raise typer.Exit(code=1)
+    elapsed = time.perf_counter() - start
+
+    cf_model = loaded.get('cf_model')
+    run_info = {
+        "model_version": loaded.get('model_version'),
+        "cf_model_version": cf_model.version if cf_model is not None else None,
+        "cf_model_training": cf_training,
+        "source": source,
+        "seed": seed,
+        "users": len(split),
+        "split": "leave-last-out",
+        "split_digest": evaluation.split_digest(split),
+        "profile_size": evaluation.PROFILE_SIZE,
+        "scorers": list(scorer),
+        "ks": list(k),
+        "n_candidates": n_candidates,
+        "mmr_lambda": mmr_lambda,
+        "mmr_depth": recommender.MMR_DEPTH,
+        "scoring_shards": sharding.SCORING_SHARDS,
+        "cf_hybrid_weight": collaborative.CF_HYBRID_WEIGHT,
+        "workers": workers or os.cpu_count(),
+        "elapsed_seconds": elapsed,
+    }
+    typer.echo(evaluation.format_table(results, k))
+    typer.echo(f"Report written to {evaluation.write_report(results, run_info, output_dir)}")
+
+
+@cli_app.command("partitions")
+def partitions_command(
+    months_ahead: int = typer.Option(partitions.PARTITION_MONTHS_AHEAD, help="Monthly partitions to keep ready ahead"),
+    retention_months: int = typer.Option(partitions.PARTITION_RETENTION_MONTHS,
+                                         help="Months of interactions kept attached (0 keeps everything)"),
+    archive_dir: str = partitions.PARTITION_ARCHIVE_DIR,
+    detach_only: bool = typer.Option(False, help="Detach expired partitions but keep them as tables instead of archiving"),
+    rebuild_rollup: bool = typer.Option(False, help="Recompute user_recent_likes from interactions"),
+    dry_run: bool = typer.Option(False, help="Only list the partitions and what would be retired"),
+):
+    """
+    Maintains the monthly partitions of the interactions table: creates the upcoming ones and
+    detaches or archives the ones older than the retention period. Safe to run repeatedly.
+    """
+    db = database.SessionLocal()
+    try:
+        expired = partitions.expired_partitions(db, retention_months)
+        if not dry_run:
+            for name in partitions.ensure_partitions(db, months_ahead):
+                typer.echo(f"Created {name}")
+            for name in expired:
+                if detach_only:
+                    partitions.detach_partition(db, name)
+                    typer.echo(f"Detached {name}")
+                else:
+                    typer.echo(f"Archived {name} to {partitions.archive_partition(db, name, archive_dir)}")
+            if rebuild_rollup:
+                typer.echo(f"Rebuilt user_recent_likes ({partitions.rebuild_recent_likes(db)} rows)")
+        elif expired:
+            typer.echo(f"Would {'detach' if detach_only else 'archive'}: {', '.join(expired)}")
+
+        for partition in partitions.list_partitions(db):
+            typer.echo(f"  {partition['name']:<24} ~{partition['estimated_rows']:>12,} rows "
+                       f"{partition['bytes'] / 1e6:>10.1f} MB")
+    finally:
+        db.close()
+
+
+@cli_app.command("export-interactions")
+def export_interactions_command(
+    output_dir: str = export.EXPORT_DIR,
+    batch_size: int = typer.Option(export.EXPORT_BATCH_SIZE, help="Rows fetched per round trip"),
+    shard_rows: int = typer.Option(export.EXPORT_SHARD_ROWS, help="Most rows per shard file"),
+    lag_seconds: float = typer.Option(export.EXPORT_SAFETY_LAG_SECONDS,
+                                      help="Leave interactions newer than this for the next run"),
+    compress: bool = typer.Option(False, help="Write compressed shards"),
+    full: bool = typer.Option(False, help="Export everything, into a directory without a previous export"),
+):
+    """
+    Exports the interactions created since the last run, with their movie's tconst, as
+    day-partitioned .npz shards for offline jobs. Reads from the read replica when one is
+    configured, so it doesn't compete with the API for the primary.
+    """
+    db = database.ReadSessionLocal()
+    try:
+        run = export.export_interactions(db, output_dir, batch_size, shard_rows, lag_seconds, compress, full)
+    except ValueError as e:
+        typer.echo(str(e))
+        raise typer.Exit(code=1)
+    finally:
+        db.close()
+    if "seconds" not in run:
+        typer.echo(f"Nothing to export yet; the watermark stays at {run['since']}")
+        return
+    typer.echo(f"Exported {run['rows']:,} interactions ({run['since'] or 'start'} to {run['until']}) "
+               f"into {len(run['files'])} shards in {run['seconds']:.1f}s "
+               f"({run['rows'] / max(run['seconds'], 1e-9):,.0f} rows/s)")
+
+
+@cli_app.command("startup-report")
+def startup_report_command(
+    import_budget_ms: float = typer.Option(startup.STARTUP_IMPORT_BUDGET_MS, help="Budget for importing app.main"),
+    skip_assets: bool = typer.Option(False, help="Only measure the import, without loading the model assets"),
+):
+    """
+    Breaks the cold start down into import time per module, asset load time and first-request
+    warm-up per module. Exits non-zero if the import exceeds the budget or pulls in a module
+    that is meant to be imported on first use, so it can gate CI and image builds.
+    """
+    try:
+        imports = startup.measure_imports()
+    except RuntimeError as e:
+        typer.echo(str(e))
+        raise typer.Exit(code=1)
+
+    load_timings, warm_up_timings = None, None
+    if not skip_assets:
+        loaded = load_model_assets()
+        load_timings = dict(model_loader.LOAD_TIMINGS)
+        warm_up_timings = startup.warm_up(loaded)
+    typer.echo(startup.format_report(imports, load_timings, warm_up_timings, dict(lazy.import_timings),
+                                     budget_ms=import_budget_ms))
+
+    failures = []
+    if imports["total_ms"] > import_budget_ms:
+        failures.append(f"import took {imports['total_ms']:.0f} ms, over the {import_budget_ms:.0f} ms budget")
+    if imports["eager_deferred_modules"]:
+        failures.append(f"{', '.join(imports['eager_deferred_modules'])} imported eagerly")
+    if failures:
+        typer.echo("Startup check failed: " + "; ".join(failures))
+        raise typer.Exit(code=1)
+    typer.echo("Startup check passed.")
@@ -0,0 +1,102 @@
+# Cold-start recommendations from a user's favorite genres
+# Users who picked genres during onboarding but haven't liked anything yet get recommendations
+# merged from per-genre ranked lists that are precomputed when the model assets load.
+import logging
+import os
+
+import numpy as np
+import scipy.sparse as sp
+
+from . import recommender
+
+logger = logging.getLogger(__name__)
+
+# Length of each precomputed per-genre list
+GENRE_LIST_SIZE = int(os.getenv("GENRE_LIST_SIZE", "500"))
+
+# How a movie's place in a genre list is scored
+W_GENRE_AFFINITY = 0.40
+W_POPULARITY = 0.60
+
+
+def split_genres(value):
+    """Splits a comma-separated genres string (as in movies_df and users.favorite_genres) into a list"""
+    if not isinstance(value, str) or not value:
+        return []
+    return [g.strip() for g in value.split(",") if g.strip() and g.strip() != "\\N"]
+
+
+def _row_norms(matrix):
+    if sp.issparse(matrix):
+        return np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    return np.linalg.norm(np.asarray(matrix), axis=1)
+
+
+def build_genre_rankings(movies_df, genre_matrix, list_size: int = GENRE_LIST_SIZE):
+    """
+    Precomputes a ranked list of movies for every genre in the catalog.
+
+    A movie's score in a genre list blends how typical its genre vector is of that
+    genre (cosine to the mean genre_tfidf_matrix row of the genre's movies) with its
+    popularity (weighted rating).
+
+    Args:
+        movies_df: Movies DataFrame with a comma-separated 'genres' column.
+        genre_matrix: Genre TF-IDF matrix, one row per movies_df row.
+        list_size: Number of movies kept per genre.
+
+    Returns:
+        Dict mapping lowercased genre name -> (positions int32 array, scores float32 array),
+        best first.
+    """
+    popularity = np.nan_to_num(recommender.popularity_scores(movies_df))
+    norms = _row_norms(genre_matrix)
+    norms[norms == 0] = 1.0
+
+    members = {}
+    for position, value in enumerate(movies_df['genres'].to_numpy()):
+        for genre in split_genres(value):
+            members.setdefault(genre.lower(), []).append(position)
+
+    rankings = {}
+    for genre, positions in members.items():
+        positions = np.asarray(positions, dtype=np.int64)
+        vectors = genre_matrix[positions]
+        centroid = np.asarray(vectors.mean(axis=0)).ravel()
+        centroid_norm = np.linalg.norm(centroid)
+        if centroid_norm == 0:
+            affinity = np.zeros(len(positions))
+        else:
+            affinity = np.asarray(vectors @ centroid).ravel() / (norms[positions] * centroid_norm)
+
+        scores = W_GENRE_AFFINITY * affinity + W_POPULARITY * popularity[positions]
+        top = np.argsort(-scores, kind="stable")[:list_size]
+        rankings[genre] = (positions[top].astype(np.int32), scores[top].astype(np.float32))
+
+    return rankings
+
+
+def recommend_for_genres(genre_rankings, genres):
+    """
+    Merges the precomputed lists of the given genres.
+    Scores of a movie that appears in several of the lists are summed, so movies that
+    match more of the user's genres rank higher.
+
+    Args:
+        genre_rankings: Output of build_genre_rankings.
+        genres: Genre names (case-insensitive). Unknown genres are ignored.
+
+    Returns:
+        Array of ranked row positions, best first. Empty if no genre is known.
+    """
+    lists = [genre_rankings[g.lower()] for g in genres if g.lower() in genre_rankings]
+    if not lists:
+        return np.array([], dtype=np.int64)
+
+    positions = np.concatenate([p for p, _ in lists])
+    scores = np.concatenate([s for _, s in lists])
+    unique_positions, inverse = np.unique(positions, return_inverse=True)
+    merged = np.bincount(inverse, weights=scores)
+
+    order = np.argsort(-merged, kind="stable")
+    return unique_positions[order].astype(np.int64)
@@ -0,0 +1,314 @@
+# Implicit-feedback collaborative filtering (ALS)
+# Training (the `train-cf` command) streams the 'like' interactions out of the database with a
+# server-side cursor into a sparse user x item matrix, then fits user and item factors with
+# implicit ALS (Hu, Koren & Volinsky): every observed like has confidence 1 + CF_ALPHA, every
+# other pair confidence 1 with preference 0. Each half-step solves the users' (or items')
+# regularised least-squares problems with a few conjugate-gradient steps, vectorised over blocks
+# of users that run on a thread pool (sparse products and NumPy kernels release the GIL).
+# The factors are saved as a versioned .npz asset in CF_MODEL_DIR, keyed by user id and tconst.
+#
+# At serving time the newest asset is loaded with the other model assets. A request's user
+# vector is folded in from their current liked movies (one exact ALS half-step against the item
+# factors), so it is never staler than their profile; hybrid requests blend the resulting CF
+# scores into the content score of the candidates (see recommender.rerank_candidates).
+import glob
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+import scipy.sparse as sp
+
+logger = logging.getLogger(__name__)
+
+CF_FACTORS = int(os.getenv("CF_FACTORS", "64"))
+CF_ITERATIONS = int(os.getenv("CF_ITERATIONS", "15"))
+CF_REGULARIZATION = float(os.getenv("CF_REGULARIZATION", "0.05"))
+# Confidence of an observed like is 1 + CF_ALPHA
+CF_ALPHA = float(os.getenv("CF_ALPHA", "40"))
+CF_CG_STEPS = int(os.getenv("CF_CG_STEPS", "3"))
+# Threads solving blocks of users/items in parallel
+CF_THREADS = int(os.getenv("CF_THREADS", "0")) or (os.cpu_count() or 1)
+# Interactions fetched per round trip while streaming the interactions table
+CF_BATCH_SIZE = int(os.getenv("CF_BATCH_SIZE", "50000"))
+CF_MODEL_DIR = os.getenv("CF_MODEL_DIR", "cf_models")
+# Load this asset instead of the newest one in CF_MODEL_DIR
+CF_MODEL_PATH = os.getenv("CF_MODEL_PATH")
+# Weight of the CF score in hybrid rankings; the content score gets the rest
+CF_HYBRID_WEIGHT = float(os.getenv("CF_HYBRID_WEIGHT", "0.3"))
+
+MODEL_PREFIX = "cf-"
+MODEL_SUFFIX = ".npz"
+# Users or items per solver block are bounded so their gathered factor rows stay small
+_BLOCK_NNZ = 200_000
+
+
+# --- Building the interaction matrix ---
+
+class InteractionMatrixBuilder:
+    """
+    Accumulates (user_id, tconst) pairs batch by batch into compact index arrays, so the
+    interactions table never has to be held in memory as Python objects.
+    """
+
+    def __init__(self):
+        self.user_index = {}
+        self.item_index = {}
+        self.rows = array("i")
+        self.cols = array("i")
+
+    def add_batch(self, pairs):
+        """Adds an iterable of (user_id, tconst) pairs"""
+        user_index, item_index = self.user_index, self.item_index
+        for user_id, tconst in pairs:
+            self.rows.append(user_index.setdefault(user_id, len(user_index)))
+            self.cols.append(item_index.setdefault(tconst, len(item_index)))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def build(self):
+        """
+        Returns:
+            Tuple of (matrix, user_ids, item_tconsts): a float32 CSR users x items matrix
+            with a 1 for every liked pair, and the id of each row and column.
+        """
+        rows = np.frombuffer(self.rows, dtype=np.int32)
+        cols = np.frombuffer(self.cols, dtype=np.int32)
+        shape = (len(self.user_index), len(self.item_index))
+        matrix = sp.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, cols)), shape=shape)
+        matrix.sum_duplicates()
+        matrix.data[:] = 1.0
+        return matrix, list(self.user_index), list(self.item_index)
+
+
+def stream_liked_pairs(db, batch_size: int = CF_BATCH_SIZE):
+    """
+    Yields batches of (user_id, tconst) for every 'like', read through a server-side cursor
+    (yield_per) so memory doesn't grow with the size of the interactions table.
+    """
+    from sqlalchemy import select
+
+    from . import models
+
+    statement = (
+        select(models.Interaction.user_id, models.Movie.tconst)
+        .join(models.Movie, models.Movie.id == models.Interaction.movie_id)
+        .where(models.Interaction.interaction_type == 'like')
+        .execution_options(yield_per=batch_size)
+    )
+    for partition in db.execute(statement).partitions():
+        yield [(str(user_id), tconst) for user_id, tconst in partition]
+
+
+# --- Training ---
+
+def _solve_block(Cui, factors, YtY, start, stop, other, alpha, cg_steps):
+    """
+    A few conjugate-gradient steps on the rows [start, stop) of `factors`, minimising
+    sum_i c_ui (p_ui - x_u . y_i)^2 + regularization * |x_u|^2 with the other side fixed
+    (the regularization is already on YtY's diagonal).
+    """
+    block = Cui[start:stop]
+    n_rows = stop - start
+    if n_rows == 0:
+        return
+    row_of_nnz = np.repeat(np.arange(n_rows), np.diff(block.indptr))
+    Y = other[block.indices]
+    # (c_ui - 1) for the observed pairs; unobserved pairs only contribute through YtY
+    extra = np.full(len(block.indices), alpha, dtype=np.float32)
+
+    def apply_A(P):
+        s = np.einsum("ij,ij->i", Y, P[row_of_nnz]) * extra
+        return P @ YtY + sp.csr_matrix((s, block.indices, block.indptr), shape=block.shape) @ other
+
+    # b_u = sum_i c_ui p_ui y_i
+    b = sp.csr_matrix(((1.0 + extra), block.indices, block.indptr), shape=block.shape) @ other
+    # A view, so the block's rows of `factors` are updated in place
+    x = factors[start:stop]
+    r = b - apply_A(x)
+    p = r.copy()
+    rs_old = np.einsum("ij,ij->i", r, r)
+    for _ in range(cg_steps):
+        Ap = apply_A(p)
+        pAp = np.einsum("ij,ij->i", p, Ap)
+        step = np.divide(rs_old, pAp, out=np.zeros_like(rs_old), where=pAp > 0)
+        x += step[:, None] * p
+        r -= step[:, None] * Ap
+        rs_new = np.einsum("ij,ij->i", r, r)
+        beta = np.divide(rs_new, rs_old, out=np.zeros_like(rs_new), where=rs_old > 0)
+        p = r + beta[:, None] * p
+        rs_old = rs_new
+
+
+def _block_bounds(Cui):
+    """Row ranges holding about _BLOCK_NNZ non-zeros each"""
+    bounds = [0]
+    targets = np.arange(_BLOCK_NNZ, Cui.nnz, _BLOCK_NNZ)
+    bounds.extend(int(b) for b in np.searchsorted(Cui.indptr, targets))
+    bounds.append(Cui.shape[0])
+    return sorted(set(bounds))
+
+
+def _half_step(Cui, factors, other, alpha, regularization, cg_steps, executor):
+    YtY = (other.T @ other).astype(np.float32) + regularization * np.eye(other.shape[1], dtype=np.float32)
+    bounds = _block_bounds(Cui)
+    futures = [
+        executor.submit(_solve_block, Cui, factors, YtY, start, stop, other, alpha, cg_steps)
+        for start, stop in zip(bounds[:-1], bounds[1:])
+    ]
+    for future in futures:
+        future.result()
+
+
+def train_als(matrix, factors: int = CF_FACTORS, iterations: int = CF_ITERATIONS,
+              regularization: float = CF_REGULARIZATION, alpha: float = CF_ALPHA, cg_steps: int = CF_CG_STEPS,
+              threads: int = CF_THREADS, seed: int = 0, on_iteration=None):
+    """
+    Fits implicit-ALS user and item factors.
+
+    Args:
+        matrix: CSR users x items matrix with a 1 for every observed pair.
+        factors: Number of latent factors.
+        iterations: Alternating user/item passes.
+        regularization: L2 penalty on the factors.
+        alpha: Confidence of an observed pair is 1 + alpha.
+        cg_steps: Conjugate-gradient steps per solve.
+        threads: Threads solving blocks of users (or items) in parallel.
+        seed: Seed of the random initialisation.
+        on_iteration: Optional callback(iteration, seconds) after each pass.
+
+    Returns:
+        Tuple of (user_factors, item_factors) float32 arrays.
+    """
+    Cui = sp.csr_matrix(matrix, dtype=np.float32)
+    Ciu = Cui.T.tocsr()
+    rng = np.random.default_rng(seed)
+    user_factors = (rng.random((Cui.shape[0], factors), dtype=np.float32) - 0.5) * (0.01 / factors)
+    item_factors = (rng.random((Cui.shape[1], factors), dtype=np.float32) - 0.5) * (0.01 / factors)
+
+    with ThreadPoolExecutor(max_workers=max(1, threads), thread_name_prefix="als") as executor:
+        for iteration in range(iterations):
+            start = time.perf_counter()
+            _half_step(Cui, user_factors, item_factors, alpha, regularization, cg_steps, executor)
+            _half_step(Ciu, item_factors, user_factors, alpha, regularization, cg_steps, executor)
+            if on_iteration is not None:
+                on_iteration(iteration, time.perf_counter() - start)
+    return user_factors, item_factors
+
+
+# --- Model asset ---
+
+def save_model(user_ids, item_tconsts, user_factors, item_factors, params, model_dir: str = CF_MODEL_DIR):
+    """
+    Writes the factors as a versioned asset, cf-<UTC timestamp>-<digest>.npz.
+
+    Returns:
+        Path of the written file.
+    """
+    os.makedirs(model_dir, exist_ok=True)
+    digest = hashlib.sha1(user_factors.tobytes() + item_factors.tobytes()).hexdigest()[:8]
+    version = f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}-{digest}"
+    # Users are sorted by id so a user's row can be found with a binary search
+    user_keys = np.array([str(u).replace("-", "") for u in user_ids], dtype="S32")
+    order = np.argsort(user_keys)
+    path = os.path.join(model_dir, f"{MODEL_PREFIX}{version}{MODEL_SUFFIX}")
+
+    # Written under a temporary name and renamed, so a loader never sees a partial file
+    fd, tmp_path = tempfile.mkstemp(dir=model_dir, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        np.savez(
+            f,
+            version=np.array(version),
+            user_ids=user_keys[order],
+            user_factors=user_factors[order],
+            item_tconsts=np.array(item_tconsts, dtype=str),
+            item_factors=item_factors,
+            alpha=np.float32(params.get("alpha", CF_ALPHA)),
+            regularization=np.float32(params.get("regularization", CF_REGULARIZATION)),
+            params=np.array(repr(params)),
+        )
+    os.replace(tmp_path, path)
+    return path
+
+
+def latest_model_path(model_dir: str = CF_MODEL_DIR):
+    """The asset to serve: CF_MODEL_PATH if set, else the newest one in model_dir (or None)"""
+    if CF_MODEL_PATH:
+        return CF_MODEL_PATH
+    paths = sorted(glob.glob(os.path.join(model_dir, f"{MODEL_PREFIX}*{MODEL_SUFFIX}")))
+    return paths[-1] if paths else None
+
+
+class CFModel:
+    """
+    Trained factors mapped onto the movie catalog.
+
+    Args:
+        path: Path of a cf-*.npz asset written by save_model.
+        movie_catalog: catalog.MovieCatalog the item tconsts are resolved against.
+    """
+
+    def __init__(self, path, movie_catalog):
+        with np.load(path) as asset:
+            self.version = str(asset["version"])
+            # Serving folds users in from their current likes, so the trained user factors
+            # stay in the asset (for offline use) and aren't kept in memory
+            n_users = len(asset["user_ids"])
+            self.item_factors = asset["item_factors"]
+            self.alpha = float(asset["alpha"])
+            self.regularization = float(asset["regularization"])
+            item_tconsts = asset["item_tconsts"]
+
+        # Catalog row -> item factor row (-1 for movies nobody had liked at training time)
+        self.item_rows = np.full(len(movie_catalog), -1, dtype=np.int32)
+        positions = movie_catalog.positions_of_tconsts(item_tconsts)
+        known = positions >= 0
+        self.item_rows[positions[known]] = np.flatnonzero(known).astype(np.int32)
+        k = self.item_factors.shape[1]
+        Y = self.item_factors.astype(np.float64)
+        self.YtY = Y.T @ Y + self.regularization * np.eye(k)
+        logger.info(f"CF model {self.version}: {n_users} users, {known.sum()}/{len(item_tconsts)} "
+                    f"items in the catalog, {k} factors")
+
+    def fold_in(self, liked_positions):
+        """
+        User vector for a set of liked catalog rows: the exact least-squares solution against
+        the item factors, i.e. the ALS user step for a user with exactly these likes.
+
+        Returns:
+            float64 vector, or None if none of the movies has item factors.
+        """
+        rows = self.item_rows[np.asarray(liked_positions, dtype=np.int64)]
+        rows = rows[rows >= 0]
+        if len(rows) == 0:
+            return None
+        Y = self.item_factors[rows].astype(np.float64)
+        A = self.YtY + self.alpha * (Y.T @ Y)
+        b = (1.0 + self.alpha) * Y.sum(axis=0)
+        return np.linalg.solve(A, b)
+
+    def scores(self, positions, user_vector):
+        """Predicted preference of the user for catalog rows (0 for rows without item factors)"""
+        rows = self.item_rows[np.asarray(positions, dtype=np.int64)]
+        scores = np.zeros(len(rows), dtype=np.float64)
+        known = rows >= 0
+        scores[known] = self.item_factors[rows[known]] @ user_vector
+        return scores
+
+    @property
+    def nbytes(self):
+        return int(self.item_factors.nbytes + self.item_rows.nbytes + self.YtY.nbytes)
+
+
+def load_latest_model(movie_catalog):
+    """Loads the asset to serve (see latest_model_path), or returns None if there is none"""
+    path = latest_model_path()
+    if path is None:
+        return None
+    return CFModel(path, movie_catalog)
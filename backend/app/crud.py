@@ -1,5 +1,5 @@
 from sqlalchemy.orm import Session
-from . import models, schemas, auth
+from . import models, schemas, auth, database, rec_cache
 
 # --- READ Operations ---
 
@@ -52,6 +52,9 @@ def create_user(db: Session, user: schemas.UserCreate):
     #    (like the auto-generated UUID and created_at timestamp).
     db.refresh(db_user)
     
+    # 6. The replica may not have the new user yet; read them from the primary for now
+    database.mark_recent_write(db_user.id)
+    
     return db_user
 
 
@@ -69,8 +72,18 @@ def update_user_genres(db: Session, user_id: str, genres: schemas.UserUpdateGenr
         db_user.favorite_genres = ",".join(genres.genres)
         db.commit()
         db.refresh(db_user)
+        # The cached copy used by auth.get_current_user is now out of date,
+        # and so is a cold-start ranking built from the old genres
+        auth.invalidate_cached_user(user_id)
+        rec_cache.invalidate(user_id)
+        database.mark_recent_write(user_id)
     return db_user
 
+def movie_exists(db: Session, tconst: str) -> bool:
+    """Whether a movie with this tconst is in the movies table (an index-only lookup)"""
+    return db.query(models.Movie.id).filter(models.Movie.tconst == tconst).first() is not None
+
+
 def create_or_update_interaction(db: Session, user_id: str, interaction: schemas.InteractionCreate):
     """
     Creates a new interaction for a user and a movie.
@@ -101,18 +114,87 @@ def create_or_update_interaction(db: Session, user_id: str, interaction: schemas
         db.add(new_interaction)
     
     db.commit()
+    # The user's taste profile changed, so their cached ranking is out of date,
+    # and the replica may not have the change yet
+    rec_cache.invalidate(user_id)
+    database.mark_recent_write(user_id)
     # We can query for it again to return the final state
     return db.query(models.Interaction).filter(
         models.Interaction.user_id == user_id,
         models.Interaction.movie_id == movie.id
     ).first()
 
+def bulk_upsert_interactions(db: Session, interactions):
+    """
+    Writes a batch of interactions in a single transaction.
+    Existing user/movie pairs get their interaction_type updated, new pairs are inserted.
+
+    Args:
+        db (Session): The SQLAlchemy database session.
+        interactions (dict): Maps (user_id, tconst) -> interaction_type. Each pair appears once.
+
+    Returns:
+        tuple: (number of interactions written, list of (user_id, tconst) pairs whose movie doesn't exist)
+    """
+    if not interactions:
+        return 0, []
+
+    # Resolve every tconst in the batch with one query
+    tconsts = {tconst for _, tconst in interactions}
+    movie_ids = dict(
+        db.query(models.Movie.tconst, models.Movie.id).filter(models.Movie.tconst.in_(tconsts)).all()
+    )
+
+    unknown = [pair for pair in interactions if pair[1] not in movie_ids]
+    wanted = {
+        (user_id, movie_ids[tconst]): interaction_type
+        for (user_id, tconst), interaction_type in interactions.items()
+        if tconst in movie_ids
+    }
+    if not wanted:
+        return 0, unknown
+
+    # Load the existing rows for these users and movies with one query
+    user_ids = {user_id for user_id, _ in wanted}
+    existing = db.query(models.Interaction).filter(
+        models.Interaction.user_id.in_(user_ids),
+        models.Interaction.movie_id.in_({movie_id for _, movie_id in wanted})
+    ).all()
+
+    for existing_interaction in existing:
+        pair = (existing_interaction.user_id, existing_interaction.movie_id)
+        if pair in wanted:
+            existing_interaction.interaction_type = wanted.pop(pair)
+
+    db.add_all([
+        models.Interaction(user_id=user_id, movie_id=movie_id, interaction_type=interaction_type)
+        for (user_id, movie_id), interaction_type in wanted.items()
+    ])
+    db.commit()
+
+    for user_id in user_ids:
+        rec_cache.invalidate(user_id)
+        database.mark_recent_write(user_id)
+
+    return len(interactions) - len(unknown), unknown
+
 def get_user_liked_movies(db: Session, user_id: str, limit: int = 15):
     """
     Gets the most recent movies a user has 'liked'.
     This will be used to build their taste profile.
     """
-    # Query the interactions table
+    if limit <= models.RECENT_LIKES_PER_USER:
+        # The rollup holds exactly the rows we need, so no interactions partition is scanned
+        rows = db.query(models.Movie.primaryTitle, models.Movie.startYear).join(
+            models.UserRecentLike, models.UserRecentLike.movie_id == models.Movie.id
+        ).filter(
+            models.UserRecentLike.user_id == user_id
+        ).order_by(
+            models.UserRecentLike.liked_at.desc()
+        ).limit(limit).all()
+        return [f"{title} ({year})" for title, year in rows]
+
+    # Longer histories than the rollup keeps: query the interactions table
     interactions = db.query(models.Interaction).filter(
         models.Interaction.user_id == user_id,
         models.Interaction.interaction_type == 'like'
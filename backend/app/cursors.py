@@ -0,0 +1,24 @@
+# Opaque pagination cursors
+# A cursor is a small JSON payload encoded as URL-safe base64 so clients treat it as a token.
+import base64
+import json
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a pagination cursor can't be decoded."""
+
+
+def encode_cursor(payload: dict) -> str:
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise InvalidCursorError(f"Invalid cursor: {cursor!r}")
+    if not isinstance(payload, dict):
+        raise InvalidCursorError(f"Invalid cursor: {cursor!r}")
+    return payload
@@ -1,15 +1,20 @@
 import os
+import threading
+import time
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
+from . import metrics
+
 DB_USER = os.environ.get("POSTGRES_USER")
 DB_PASSWORD = os.environ.get("POSTGRES_PASSWORD")
 DB_NAME = os.environ.get("POSTGRES_DB")
 
-# The hostname 'db' is the service name we defined in our docker-compose.yml
-DB_HOST = "db" 
-DB_PORT = "5432"
+# The hostname 'db' is the service name we defined in our docker-compose.yml.
+# Override it to run the app outside of compose (e.g. against a local Postgres for load tests).
+DB_HOST = os.environ.get("POSTGRES_HOST", "db")
+DB_PORT = os.environ.get("POSTGRES_PORT", "5432")
 
 SQLALCHEMY_DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
@@ -18,6 +23,35 @@ engine = create_engine(SQLALCHEMY_DATABASE_URL)
 # Each instance of the SessionLocal class will be a new database session.
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Optional read-only replica (e.g. a streaming standby) for read-heavy paths; see get_read_db.
+# Without it, reads use the primary like everything else.
+READ_REPLICA_URL = os.environ.get("READ_REPLICA_URL")
+# How long after a write a user's own reads keep going to the primary, so they see what they
+# just wrote despite replication lag. Should comfortably exceed the replica's usual lag.
+READ_YOUR_WRITES_SECONDS = float(os.environ.get("READ_YOUR_WRITES_SECONDS", "5"))
+
+if READ_REPLICA_URL:
+    # Sessions on the replica are read-only even if the URL points at a writable server
+    read_engine = create_engine(
+        READ_REPLICA_URL,
+        pool_pre_ping=True,
+        connect_args={"options": "-c default_transaction_read_only=on"},
+    )
+else:
+    read_engine = engine
+
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+# user_id -> time.monotonic() until which their reads go to the primary.
+# This is per process: with several workers (uvicorn --workers, gunicorn), a write handled by
+# one worker doesn't protect the reads the user's next request makes on another, which can then
+# hit the replica before it has the write. Where that matters, send each user's requests to the
+# same worker (sticky sessions); raising READ_YOUR_WRITES_SECONDS doesn't help across workers.
+_recent_writes = {}
+_recent_writes_lock = threading.Lock()
+# Expired entries are dropped once the dict grows past this many users
+_RECENT_WRITES_PRUNE_SIZE = 10000
+
 # Base is a class that our ORM models will inherit from.
 Base = declarative_base()
 
@@ -27,4 +61,53 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# Dependency to get a read-only DB session, on the replica when one is configured.
+# Only for reads that may lag slightly behind the primary; per-user reads go through
+# auth.get_user_read_db so a user sees their own recent writes.
+def get_read_db():
+    db = ReadSessionLocal()
+    if has_replica():
+        metrics.observe_read_session("replica")
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def has_replica() -> bool:
+    return read_engine is not engine
+
+
+def mark_recent_write(user_id):
+    """Sends this user's reads to the primary for the next READ_YOUR_WRITES_SECONDS (in this process only)"""
+    if not has_replica() or READ_YOUR_WRITES_SECONDS <= 0:
+        return
+    now = time.monotonic()
+    with _recent_writes_lock:
+        _recent_writes[str(user_id)] = now + READ_YOUR_WRITES_SECONDS
+        if len(_recent_writes) > _RECENT_WRITES_PRUNE_SIZE:
+            for key in [key for key, until in _recent_writes.items() if until < now]:
+                del _recent_writes[key]
+
+
+def has_recent_write(user_id) -> bool:
+    """Whether this user wrote within the read-your-writes window"""
+    with _recent_writes_lock:
+        until = _recent_writes.get(str(user_id))
+    return until is not None and until >= time.monotonic()
+
+
+def session_for_user_reads(user_id):
+    """
+    A new session for reading a user's own data: on the primary if they wrote recently
+    (or there is no replica), on the replica otherwise. The caller closes it.
+    """
+    if not has_replica():
+        return SessionLocal()
+    if has_recent_write(user_id):
+        metrics.observe_read_session("primary")
+        return SessionLocal()
+    metrics.observe_read_session("replica")
+    return ReadSessionLocal()
\ No newline at end of file
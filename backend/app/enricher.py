@@ -1,36 +1,66 @@
 import os
-import requests
-import pandas as pd
 import logging
 import time
+from . import lazy, serialization, metrics, singleflight
+
+# Only needed once TMDb is called
+requests = lazy.module("requests")
 
 logger = logging.getLogger(__name__)
 
 TMDB_API_KEY = os.getenv("TMDB_API_KEY")
-TMDB_API_URL = "https://api.themoviedb.org/3"
+TMDB_API_URL = os.getenv("TMDB_API_URL", "https://api.themoviedb.org/3")
 REQUEST_TIMEOUT = 5  # seconds
 MAX_RETRIES = 1
 
-def enrich_recommendations(recommendations_df: pd.DataFrame):
+# Concurrent enrichments of the same movie share one TMDb request
+_tmdb_flight = singleflight.SingleFlight("tmdb")
+
+def enrich_recommendations(movie_catalog, positions):
     """
-    Enriches a DataFrame of movie recommendations with data from TMDb.
+    Enriches movie recommendations with data from TMDb.
     
     Args:
-        recommendations_df: DataFrame with columns including 'tconst', 'primaryTitle', etc.
+        movie_catalog: catalog.MovieCatalog the recommendations come from
+        positions: Row positions of the recommended movies, in order
     
     Returns:
         List of dictionaries with enriched movie data
     """
+    enriched_data, _ = enrich_recommendations_with_status(movie_catalog, positions)
+    return enriched_data
+
+def enrich_recommendations_with_status(movie_catalog, positions):
+    """
+    Same as enrich_recommendations, and also tells whether TMDb answered for every movie.
+    An incomplete page (TMDb down or timing out) shouldn't be cached like a complete one.
+    
+    Returns:
+        Tuple of (list of enriched movie dictionaries, True if no TMDb lookup failed)
+    """
     if not TMDB_API_KEY:
         logger.warning("TMDB_API_KEY not found. Returning recommendations without enrichment.")
         # Return basic movie data without poster_url and overview
-        return _convert_to_basic_format(recommendations_df)
+        return _convert_to_basic_format(movie_catalog, positions), True
+
+    with metrics.stage_timer("enrichment", "records"):
+        enriched_data = serialization.catalog_records(movie_catalog, positions)
+    
+    with metrics.stage_timer("enrichment", "tmdb"):
+        complete = _enrich_records(enriched_data)
+    
+    return enriched_data, complete
 
-    enriched_data = []
+def _enrich_records(enriched_data):
+    """
+    Fills in poster_url and overview of each record from TMDb, in place.
     
-    for index, row in recommendations_df.iterrows():
-        tconst = row['tconst']
-        enriched_row = _get_basic_movie_data(row)
+    Returns:
+        True if every lookup got an answer from TMDb (movies TMDb doesn't know count as answered)
+    """
+    complete = True
+    for enriched_row in enriched_data:
+        tconst = enriched_row['tconst']
         
         # Try to enrich with TMDb data
         tmdb_data = _fetch_tmdb_data(tconst)
@@ -39,54 +69,36 @@ def enrich_recommendations(recommendations_df: pd.DataFrame):
                 "poster_url": tmdb_data.get('poster_url'),
                 "overview": tmdb_data.get('overview')
             })
-        else:
+        elif tmdb_data is None:
             # TMDb failed, but we still include the movie with null enrichment
+            # (poster_url and overview are already None)
+            complete = False
             logger.debug(f"TMDb enrichment failed for {tconst}, including movie without poster/overview")
-            enriched_row.update({
-                "poster_url": None,
-                "overview": None
-            })
-        
-        enriched_data.append(enriched_row)
-    
-    return enriched_data
+    return complete
 
-def _convert_to_basic_format(recommendations_df: pd.DataFrame):
-    """Convert DataFrame to basic format when TMDb is not available"""
-    basic_data = []
-    for index, row in recommendations_df.iterrows():
-        basic_row = _get_basic_movie_data(row)
-        basic_row.update({
-            "poster_url": None,
-            "overview": None
-        })
-        basic_data.append(basic_row)
-    
-    return basic_data
-
-def _get_basic_movie_data(row):
-    """Extract basic movie data from DataFrame row"""
-    return {
-        "tconst": row['tconst'],
-        "primaryTitle": row['primaryTitle'],
-        "startYear": int(row['startYear']) if pd.notna(row['startYear']) else None,
-        "genres": row['genres'],
-        "averageRating": float(row['averageRating']) if pd.notna(row['averageRating']) else None,
-    }
+def _convert_to_basic_format(movie_catalog, positions):
+    """Convert catalog rows to basic format when TMDb is not available"""
+    return serialization.catalog_records(movie_catalog, positions)
 
 def _fetch_tmdb_data(tconst: str):
     """
-    Fetch poster and overview from TMDb API using IMDb ID
+    Fetch poster and overview from TMDb API using IMDb ID.
+    Requests for a tconst that is already being fetched wait for that request instead.
     
     Args:
         tconst: IMDb ID (e.g., 'tt1234567')
     
     Returns:
-        Dict with poster_url and overview, or None if failed
+        Dict with poster_url and overview, an empty dict if TMDb doesn't know the movie, or None if failed
     """
+    return _tmdb_flight.do(tconst, lambda: _request_tmdb_data(tconst))
+
+def _request_tmdb_data(tconst: str):
+    """Calls TMDb's find endpoint for a tconst, with retries (see _fetch_tmdb_data)"""
     search_url = f"{TMDB_API_URL}/find/{tconst}?api_key={TMDB_API_KEY}&external_source=imdb_id"
     
     for attempt in range(MAX_RETRIES + 1):
+        start = time.perf_counter()
         try:
             response = requests.get(search_url, timeout=REQUEST_TIMEOUT)
             response.raise_for_status()  # Raises an HTTPError for bad responses
@@ -95,6 +107,7 @@ def _fetch_tmdb_data(tconst: str):
             
             # TMDb's find endpoint returns results in different lists
             if data.get('movie_results') and len(data['movie_results']) > 0:
+                metrics.observe_tmdb_request("success", time.perf_counter() - start)
                 movie_info = data['movie_results'][0]
                 poster_path = movie_info.get('poster_path')
                 
@@ -104,22 +117,26 @@ def _fetch_tmdb_data(tconst: str):
                 }
             
             # No movie results found
+            metrics.observe_tmdb_request("not_found", time.perf_counter() - start)
             logger.debug(f"No TMDb results found for {tconst}")
-            return None
+            return {}
             
         except requests.exceptions.Timeout:
+            metrics.observe_tmdb_request("timeout", time.perf_counter() - start)
             logger.warning(f"TMDb API timeout for {tconst} (attempt {attempt + 1}/{MAX_RETRIES + 1})")
             if attempt < MAX_RETRIES:
                 time.sleep(0.5)  # Brief delay before retry
                 continue
             
         except requests.exceptions.RequestException as e:
+            metrics.observe_tmdb_request("error", time.perf_counter() - start)
             logger.warning(f"TMDb API error for {tconst}: {str(e)}")
             if attempt < MAX_RETRIES:
                 time.sleep(0.5)
                 continue
             
         except Exception as e:
+            metrics.observe_tmdb_request("error", time.perf_counter() - start)
             logger.error(f"Unexpected error fetching TMDb data for {tconst}: {str(e)}")
             break
     
@@ -0,0 +1,388 @@
+# Offline evaluation of ranking quality versus latency
+# Builds a leave-last-out split (each user's most recent like is held out, the likes before it
+# form their profile) from the interactions table or from a synthetic log, then runs one or more
+# scorers over every user on a process pool and reports hit-rate@k, NDCG@k and per-user scoring
+# latency side by side. Every scorer sees the same split, and each report records the model
+# versions, the scorer config and a digest of the split, so runs can be compared over time.
+# The hybrid scorer's CF model is trained here on the split's likes (train_split_model): the
+# served model has been trained on every like, including the held-out ones.
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import joblib
+import numpy as np
+
+from . import collaborative, recommender
+
+logger = logging.getLogger(__name__)
+
+EVALUATION_OUTPUT_DIR = os.getenv("EVALUATION_OUTPUT_DIR", "evaluation_results")
+# Same profile size as the recommendations route
+PROFILE_SIZE = 15
+DEFAULT_KS = (10, 20, 50)
+# Relevance/diversity trade-off of the content_mmr scorer
+DEFAULT_MMR_LAMBDA = 0.7
+
+
+# --- Splits ---
+
+def leave_last_out(histories, profile_size: int = PROFILE_SIZE):
+    """
+    Splits per-user like histories into profiles and held-out likes.
+
+    Args:
+        histories: Iterable of (user_id, likes) with likes as (profile_key, position) pairs,
+            oldest first. profile_key is the 'Title (Year)' key, position the catalog row.
+        profile_size: Most recent likes kept in each profile.
+
+    Returns:
+        List of (user_id, profile_keys, held_out_position), one per user with at least two
+        likes whose last like is in the catalog.
+    """
+    split = []
+    for user_id, likes in histories:
+        if len(likes) < 2:
+            continue
+        _, held_out = likes[-1]
+        if held_out < 0:
+            continue
+        profile = [key for key, _ in likes[:-1]][-profile_size:]
+        split.append((str(user_id), profile, int(held_out)))
+    return split
+
+
+def train_split_model(histories, split, movie_catalog, factors: int = collaborative.CF_FACTORS,
+                      iterations: int = collaborative.CF_ITERATIONS, threads: int = collaborative.CF_THREADS,
+                      seed: int = 0):
+    """
+    Trains a CF model for the hybrid scorer on the like histories minus the held-out like of
+    every user in the split, so its scores don't leak the answer.
+
+    Args:
+        histories: The histories the split was made from (a list, not a generator).
+        split: Output of leave_last_out.
+        movie_catalog: catalog.MovieCatalog the positions refer to.
+
+    Returns:
+        Tuple of (collaborative.CFModel, dict describing the training data and parameters).
+
+    Raises:
+        ValueError: If no likes are left to train on.
+    """
+    evaluated = {user_id for user_id, _, _ in split}
+    builder = collaborative.InteractionMatrixBuilder()
+    held_out = 0
+    for user_id, likes in histories:
+        user_id = str(user_id)
+        if user_id in evaluated:
+            likes = likes[:-1]
+            held_out += 1
+        # Movies outside the catalog can't be scored, so they are left out like at serving time
+        positions = [position for _, position in likes if position >= 0]
+        builder.add_batch((user_id, tconst) for tconst in movie_catalog.tconst.take(positions))
+    if len(builder) == 0:
+        raise ValueError("No likes left to train the CF model on")
+
+    matrix, user_ids, item_tconsts = builder.build()
+    user_factors, item_factors = collaborative.train_als(matrix, factors=factors, iterations=iterations,
+                                                         threads=threads, seed=seed)
+    params = {"factors": factors, "iterations": iterations, "regularization": collaborative.CF_REGULARIZATION,
+              "alpha": collaborative.CF_ALPHA, "likes": int(matrix.nnz)}
+    # Goes through the asset format so the scorer uses the exact CFModel that serving does
+    model_dir = tempfile.mkdtemp(prefix="evaluation-cf-")
+    try:
+        path = collaborative.save_model(user_ids, item_tconsts, user_factors, item_factors, params, model_dir)
+        model = collaborative.CFModel(path, movie_catalog)
+    finally:
+        shutil.rmtree(model_dir, ignore_errors=True)
+    info = dict(params, trained_on="split", held_out_likes_excluded=held_out, version=model.version)
+    return model, info
+
+
+def split_digest(split):
+    """Short digest identifying a split, so reports on the same split can be matched up"""
+    digest = hashlib.sha1()
+    for user_id, profile, held_out in split:
+        digest.update(f"{user_id}|{'|'.join(profile)}|{held_out}\n".encode())
+    return digest.hexdigest()[:12]
+
+
+def load_histories(db, movie_catalog, batch_size: int = 50000):
+    """
+    Reads every user's likes, oldest first, through a server-side cursor ordered by user and time.
+
+    Returns:
+        List of (user_id, likes) with likes as ('Title (Year)', catalog position) pairs
+        (position -1 for movies not in the catalog).
+    """
+    from sqlalchemy import select
+
+    from . import models
+
+    statement = (
+        select(models.Interaction.user_id, models.Movie.tconst, models.Movie.primaryTitle, models.Movie.startYear)
+        .join(models.Movie, models.Movie.id == models.Interaction.movie_id)
+        .where(models.Interaction.interaction_type == 'like')
+        .order_by(models.Interaction.user_id, models.Interaction.created_at, models.Interaction.id)
+        .execution_options(yield_per=batch_size)
+    )
+    histories, tconsts = [], []
+    for partition in db.execute(statement).partitions():
+        for user_id, tconst, title, year in partition:
+            if not histories or histories[-1][0] != user_id:
+                histories.append((user_id, []))
+            # Same key format as crud.get_user_liked_movies
+            histories[-1][1].append(f"{title} ({year})")
+            tconsts.append(tconst)
+
+    # Resolved in one pass, since positions_of_tconsts decodes the whole catalog
+    positions = iter(movie_catalog.positions_of_tconsts(tconsts).tolist())
+    return [(user_id, [(key, next(positions)) for key in keys]) for user_id, keys in histories]
+
+
+def synthetic_histories(movie_catalog, n_users: int, likes_per_user: int = 12, seed: int = 0):
+    """
+    Generates like histories with a learnable signal: each user sticks to one genre
+    combination and picks movies in it with probability proportional to their votes.
+    Only movies with a 'Title (Year)' key can be liked.
+    """
+    rng = np.random.default_rng(seed)
+    key_positions = movie_catalog.key_positions
+    keys = key_positions.index.to_numpy()
+    positions = key_positions.to_numpy()
+    codes = movie_catalog.genre_codes[positions]
+    votes = movie_catalog.votes[positions].astype(np.float64) + 1.0
+
+    # Genre combinations with enough movies for a full history
+    counts = np.bincount(codes[codes >= 0])
+    eligible = np.flatnonzero(counts >= likes_per_user * 2)
+    if len(eligible) == 0:
+        raise ValueError("Catalog too small for synthetic histories")
+    members = {code: np.flatnonzero(codes == code) for code in eligible}
+
+    for user in range(n_users):
+        rows = members[rng.choice(eligible)]
+        weights = votes[rows] / votes[rows].sum()
+        picked = rng.choice(rows, likes_per_user, replace=False, p=weights)
+        yield f"synthetic-{user}", [(keys[i], int(positions[i])) for i in picked]
+
+
+# --- Scorers ---
+# Each takes (profile_keys, assets, config) and returns ranked catalog positions, best first.
+
+def _content_scorer(profile, assets, config):
+    positions, _ = recommender.rank_candidates(
+        profile, assets['movie_catalog'], assets['people_tfidf_matrix'], assets['genre_tfidf_matrix'],
+        n_candidates=config['n_candidates'], shards=assets.get('scoring_shards')
+    )
+    return positions
+
+
+def _hybrid_scorer(profile, assets, config):
+    positions, _ = recommender.rank_candidates(
+        profile, assets['movie_catalog'], assets['people_tfidf_matrix'], assets['genre_tfidf_matrix'],
+        n_candidates=config['n_candidates'], shards=assets.get('scoring_shards'), cf_model=assets['cf_model']
+    )
+    return positions
+
+
+def _content_mmr_scorer(profile, assets, config):
+    positions, _ = recommender.rank_candidates(
+        profile, assets['movie_catalog'], assets['people_tfidf_matrix'], assets['genre_tfidf_matrix'],
+        n_candidates=config['n_candidates'], shards=assets.get('scoring_shards'), mmr_lambda=config['mmr_lambda']
+    )
+    return positions
+
+
+def _v_final_scorer(profile, assets, config):
+    # The legacy get_recommendations_v_final: a DataFrame of the top 20, mapped back to positions
+    df = assets['movies_df']
+    recommendations = recommender.get_recommendations_v_final(
+        profile, df, assets['people_tfidf_matrix'], assets['genre_tfidf_matrix'], assets['indices_map']
+    )
+    return df.index.get_indexer(recommendations.index)
+
+
+def _popularity_scorer(profile, assets, config):
+    # Non-personalized baseline: most popular first, minus the profile
+    liked = set()
+    for key in profile:
+        try:
+            liked.add(assets['movie_catalog'].position_of(key))
+        except KeyError:
+            continue
+    top = assets['popularity_order'][:config['max_k'] + len(liked)]
+    return np.array([p for p in top if p not in liked][:config['max_k']], dtype=np.int64)
+
+
+SCORERS = {
+    "content": _content_scorer,
+    "hybrid": _hybrid_scorer,
+    "content_mmr": _content_mmr_scorer,
+    "v_final": _v_final_scorer,
+    "popularity": _popularity_scorer,
+}
+# Assets each scorer needs beyond the catalog
+SCORER_ASSETS = {
+    "content": ['people_tfidf_matrix', 'genre_tfidf_matrix'],
+    "hybrid": ['people_tfidf_matrix', 'genre_tfidf_matrix', 'cf_model'],
+    "content_mmr": ['people_tfidf_matrix', 'genre_tfidf_matrix'],
+    "v_final": ['people_tfidf_matrix', 'genre_tfidf_matrix', 'movies_df', 'indices_map'],
+    "popularity": [],
+}
+
+
+# --- Worker process side ---
+
+_worker_assets = None
+
+
+def _init_worker(asset_path):
+    global _worker_assets
+    _worker_assets = joblib.load(asset_path, mmap_mode='r')
+
+
+def _evaluate_chunk(chunk, scorer_names, config):
+    """
+    Returns:
+        Dict of scorer name -> (ranks, latencies): the 0-based rank of each held-out movie
+        (-1 if not in the top max_k) and the seconds each scorer call took.
+    """
+    results = {}
+    for name in scorer_names:
+        scorer = SCORERS[name]
+        ranks = np.full(len(chunk), -1, dtype=np.int64)
+        latencies = np.zeros(len(chunk), dtype=np.float64)
+        for i, (_, profile, held_out) in enumerate(chunk):
+            start = time.perf_counter()
+            ranked = scorer(profile, _worker_assets, config)
+            latencies[i] = time.perf_counter() - start
+            hit = np.flatnonzero(np.asarray(ranked[:config['max_k']]) == held_out)
+            if len(hit):
+                ranks[i] = int(hit[0])
+        results[name] = (ranks, latencies)
+    return results
+
+
+# --- Reporting ---
+
+def ranking_metrics(ranks, ks):
+    """hit_rate@k and ndcg@k (one relevant item per user) from held-out ranks"""
+    ranks = np.asarray(ranks)
+    metrics = {}
+    for k in ks:
+        in_top = (ranks >= 0) & (ranks < k)
+        gains = np.zeros(len(ranks), dtype=np.float64)
+        gains[in_top] = 1.0 / np.log2(ranks[in_top] + 2)
+        metrics[f"hit_rate@{k}"] = float(in_top.mean()) if len(ranks) else 0.0
+        metrics[f"ndcg@{k}"] = float(gains.mean()) if len(ranks) else 0.0
+    return metrics
+
+
+def latency_summary(seconds):
+    """Mean and percentiles of per-user latencies, in milliseconds"""
+    values = np.asarray(seconds, dtype=np.float64) * 1000.0
+    if values.size == 0:
+        return {"count": 0}
+    return {
+        "count": int(values.size),
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "max_ms": float(values.max()),
+    }
+
+
+def run_evaluation(split, assets, scorer_names, ks=DEFAULT_KS, workers: int = 0,
+                   n_candidates: int = recommender.N_CANDIDATES, mmr_lambda: float = DEFAULT_MMR_LAMBDA,
+                   start_method: str = "spawn"):
+    """
+    Runs the scorers over every user of the split on a process pool.
+
+    Args:
+        split: Output of leave_last_out.
+        assets: Model assets; those the scorers need are written to a file the workers memory-map.
+        scorer_names: Keys of SCORERS.
+        ks: Cut-offs for hit rate and NDCG.
+        workers: Worker processes (defaults to one per core).
+        n_candidates: Candidates kept after content scoring, for the content-based scorers.
+        mmr_lambda: Relevance/diversity trade-off of the content_mmr scorer.
+
+    Returns:
+        Dict of scorer name -> {metrics, latency}.
+    """
+    unknown = [name for name in scorer_names if name not in SCORERS]
+    if unknown:
+        raise ValueError(f"Unknown scorers: {', '.join(unknown)} (available: {', '.join(SCORERS)})")
+    missing = sorted({key for name in scorer_names for key in SCORER_ASSETS[name] if assets.get(key) is None})
+    if missing:
+        raise ValueError(f"Assets needed by the scorers are not loaded: {', '.join(missing)}")
+
+    config = {"n_candidates": n_candidates, "max_k": max(ks), "mmr_lambda": mmr_lambda}
+    worker_assets = {key: assets[key] for name in scorer_names for key in SCORER_ASSETS[name]}
+    movie_catalog = worker_assets['movie_catalog'] = assets['movie_catalog']
+    if assets.get('scoring_shards') is not None:
+        worker_assets['scoring_shards'] = assets['scoring_shards']
+    if "popularity" in scorer_names:
+        popularity = recommender.weighted_rating(
+            movie_catalog.vote_counts(np.arange(len(movie_catalog))), movie_catalog.ratings(np.arange(len(movie_catalog))),
+            movie_catalog.vote_quantile, movie_catalog.rating_mean
+        )
+        worker_assets['popularity_order'] = np.argsort(-np.nan_to_num(popularity, nan=-np.inf), kind='stable')
+
+    workers = workers or os.cpu_count() or 1
+    chunk_size = max(1, len(split) // (workers * 8))
+    chunks = [split[i:i + chunk_size] for i in range(0, len(split), chunk_size)]
+
+    asset_dir = tempfile.mkdtemp(prefix="evaluation-assets-")
+    try:
+        asset_path = os.path.join(asset_dir, "assets.joblib")
+        joblib.dump(worker_assets, asset_path)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(start_method),
+                                 initializer=_init_worker, initargs=(asset_path,)) as executor:
+            chunk_results = list(executor.map(_evaluate_chunk, chunks, [scorer_names] * len(chunks),
+                                              [config] * len(chunks)))
+    finally:
+        shutil.rmtree(asset_dir, ignore_errors=True)
+
+    results = {}
+    for name in scorer_names:
+        ranks = np.concatenate([r[name][0] for r in chunk_results]) if chunk_results else np.array([])
+        latencies = np.concatenate([r[name][1] for r in chunk_results]) if chunk_results else np.array([])
+        results[name] = {"metrics": ranking_metrics(ranks, ks), "latency": latency_summary(latencies)}
+    return results
+
+
+def write_report(results, run_info, output_dir: str = EVALUATION_OUTPUT_DIR):
+    """
+    Writes an evaluation report as JSON.
+
+    Returns:
+        The path of the written file.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    timestamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    path = os.path.join(output_dir, f"evaluation_{run_info.get('model_version')}_{timestamp}.json")
+    with open(path, "w") as f:
+        json.dump({"timestamp": timestamp, "run": run_info, "scorers": results}, f, indent=2, default=str)
+    return path
+
+
+def format_table(results, ks):
+    """Side-by-side text table of the scorers' metrics and latencies"""
+    columns = [f"{metric}@{k}" for k in ks for metric in ("hit_rate", "ndcg")] + ["p50_ms", "p99_ms"]
+    lines = [f"{'scorer':<12}" + "".join(f"{c:>13}" for c in columns)]
+    for name, result in results.items():
+        values = [result["metrics"][c] for c in columns[:-2]]
+        values += [result["latency"].get("p50_ms", 0.0), result["latency"].get("p99_ms", 0.0)]
+        lines.append(f"{name:<12}" + "".join(f"{v:>13.4f}" for v in values))
+    return "\n".join(lines)
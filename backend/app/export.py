@@ -0,0 +1,304 @@
+# Interaction export for offline jobs
+# Streams interactions joined with their movie's tconst through a server-side cursor and writes
+# them as columnar .npz shards partitioned by day (UTC):
+#
+#     <output_dir>/date=YYYY-MM-DD/part-<run id>-NNNNN.npz
+#
+# Each shard holds one array per column (COLUMNS), at most EXPORT_SHARD_ROWS rows, so memory
+# stays flat whatever the size of the table. Runs are incremental: each run appends the
+# created_at range it covered and the shards it wrote to _runs.jsonl, and the next run starts
+# where the last one stopped (the watermark). Run through the `export-interactions` command,
+# which reads from the read replica when one is configured.
+import json
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from sqlalchemy import BigInteger, String, cast, func, select, text
+from sqlalchemy.orm import Session
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+# Rows fetched from the server-side cursor per round trip
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "50000"))
+# Most rows per shard file
+EXPORT_SHARD_ROWS = int(os.getenv("EXPORT_SHARD_ROWS", "1000000"))
+# Where shards, the watermark and the run log are written
+EXPORT_DIR = os.getenv("EXPORT_DIR", "interaction_exports")
+# Rows newer than this are left for the next run: created_at is the inserting transaction's
+# start time, so a row can become visible a little after rows with a later created_at
+EXPORT_SAFETY_LAG_SECONDS = float(os.getenv("EXPORT_SAFETY_LAG_SECONDS", "60"))
+
+# user_id is the UUID as 32 hex characters (like the collaborative model's user ids),
+# created_at_us is microseconds since the epoch (UTC)
+COLUMNS = ("id", "user_id", "tconst", "interaction_type", "created_at_us")
+RUNS_FILE = "_runs.jsonl"
+
+_DAY_US = 86_400_000_000
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+# --- Reading from the database ---
+
+def export_upper_bound(db: Session, lag_seconds: float = EXPORT_SAFETY_LAG_SECONDS) -> datetime:
+    """
+    Latest created_at a run can safely export up to (exclusive). On a standby it is also capped
+    at the commit time of the last replayed transaction, so rows still in flight from the
+    primary aren't skipped.
+    """
+    current = db.execute(text("""
+        SELECT CASE WHEN NOT pg_is_in_recovery() THEN now()
+                    WHEN pg_last_xact_replay_timestamp() IS NULL THEN NULL
+                    ELSE least(now(), pg_last_xact_replay_timestamp()) END
+    """)).scalar()
+    if current is None:
+        # A standby that hasn't replayed anything yet
+        return None
+    return current - timedelta(seconds=lag_seconds)
+
+
+def stream_interactions(db: Session, since: datetime = None, until: datetime = None,
+                        batch_size: int = EXPORT_BATCH_SIZE):
+    """
+    Yields batches of interactions with since <= created_at < until, in (created_at, id)
+    order, read through a server-side cursor (yield_per). Both bounds are optional.
+
+    Returns:
+        Generator of dicts of column name -> numpy array (see COLUMNS).
+    """
+    created_at = models.Interaction.created_at
+    # The UUID and timestamp are converted in the query, which is much cheaper than building
+    # a uuid.UUID and a datetime per row
+    statement = (
+        select(models.Interaction.id,
+               func.replace(cast(models.Interaction.user_id, String), '-', ''),
+               models.Movie.tconst,
+               models.Interaction.interaction_type,
+               cast(func.extract('epoch', created_at) * 1000000, BigInteger))
+        .join(models.Movie, models.Movie.id == models.Interaction.movie_id)
+        .order_by(created_at, models.Interaction.id)
+        .execution_options(yield_per=batch_size)
+    )
+    # Range conditions on created_at let the planner skip the monthly partitions outside them
+    if since is not None:
+        statement = statement.where(created_at >= since)
+    if until is not None:
+        statement = statement.where(created_at < until)
+
+    for partition in db.execute(statement).partitions():
+        ids, user_ids, tconsts, interaction_types, created_at_us = zip(*partition)
+        yield {
+            "id": np.array(ids, dtype=np.int64),
+            "user_id": np.array(user_ids, dtype="S32"),
+            "tconst": np.array(tconsts, dtype="S"),
+            "interaction_type": np.array(interaction_types, dtype="S"),
+            "created_at_us": np.array(created_at_us, dtype=np.int64),
+        }
+
+
+# --- Writing shards ---
+
+def _atomic_savez(path: str, columns, compress: bool = False):
+    # Written under a temporary name and renamed, so a reader never sees a partial shard
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            (np.savez_compressed if compress else np.savez)(f, **columns)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def day_label(day: int) -> str:
+    """YYYY-MM-DD of a day number (days since the epoch, UTC)"""
+    return (_EPOCH + timedelta(days=day)).strftime("%Y-%m-%d")
+
+
+class ShardWriter:
+    """
+    Buffers batches ordered by created_at and writes one shard per day, or several when a day
+    has more than shard_rows rows. At most shard_rows rows are held at any time.
+    """
+
+    def __init__(self, output_dir: str, run_id: str, shard_rows: int = EXPORT_SHARD_ROWS,
+                 compress: bool = False):
+        self.output_dir = output_dir
+        self.run_id = run_id
+        self.shard_rows = shard_rows
+        self.compress = compress
+        self.paths = []
+        self.rows = 0
+        self._day = None
+        self._buffer = []
+        self._buffered = 0
+
+    def write(self, batch):
+        days = batch["created_at_us"] // _DAY_US
+        # Rows are in created_at order, so each day is one contiguous run of the batch
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(days)) + 1, [len(days)]]).tolist()
+        for start, stop in zip(starts[:-1], starts[1:]):
+            day = int(days[start])
+            if day != self._day:
+                self.flush()
+                self._day = day
+            while start < stop:
+                take = min(stop - start, self.shard_rows - self._buffered)
+                self._buffer.append({name: batch[name][start:start + take] for name in COLUMNS})
+                self._buffered += take
+                start += take
+                if self._buffered >= self.shard_rows:
+                    self.flush()
+
+    def flush(self):
+        """Writes the buffered rows as a shard, if there are any"""
+        if not self._buffer:
+            return
+        columns = {name: np.concatenate([part[name] for part in self._buffer]) for name in COLUMNS}
+        path = os.path.join(self.output_dir, f"date={day_label(self._day)}",
+                            f"part-{self.run_id}-{len(self.paths):05d}.npz")
+        _atomic_savez(path, columns, self.compress)
+        self.paths.append(path)
+        self.rows += self._buffered
+        self._buffer = []
+        self._buffered = 0
+
+    def discard(self):
+        """Removes every shard written so far, e.g. after a failed run"""
+        for path in self.paths:
+            if os.path.exists(path):
+                os.unlink(path)
+        self.paths = []
+        self.rows = 0
+        self._buffer = []
+        self._buffered = 0
+
+
+# --- Run log ---
+
+def read_runs(output_dir: str = EXPORT_DIR):
+    """The runs recorded in the run log, oldest first"""
+    path = os.path.join(output_dir, RUNS_FILE)
+    if not os.path.exists(path):
+        return []
+    runs = []
+    with open(path) as f:
+        for line in f:
+            try:
+                runs.append(json.loads(line))
+            except ValueError:
+                # A line cut short by a crash; that run's shards are written again by the next one
+                continue
+    return runs
+
+
+def read_watermark(output_dir: str = EXPORT_DIR):
+    """created_at up to which interactions were exported (exclusive), or None before the first run"""
+    runs = read_runs(output_dir)
+    return datetime.fromisoformat(runs[-1]["until"]) if runs else None
+
+
+def _append_run(output_dir: str, run):
+    # The run log is the commit point of a run: shards it doesn't list don't count
+    path = os.path.join(output_dir, RUNS_FILE)
+    with open(path, "a+") as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell():
+            f.seek(f.tell() - 1)
+            if f.read(1) != "\n":
+                f.write("\n")
+        f.write(json.dumps(run) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def export_interactions(db: Session, output_dir: str = EXPORT_DIR, batch_size: int = EXPORT_BATCH_SIZE,
+                        shard_rows: int = EXPORT_SHARD_ROWS, lag_seconds: float = EXPORT_SAFETY_LAG_SECONDS,
+                        compress: bool = False, full: bool = False):
+    """
+    Exports the interactions created since the last run (or all of them on the first run or
+    with `full`) as day-partitioned shards, then moves the watermark forward.
+
+    Interactions whose type changes after they were exported (a like turned into a dislike)
+    aren't exported again; a full export into a new directory picks those changes up.
+
+    Args:
+        db: Session to read from; a standby works (long exports may need a generous
+            max_standby_streaming_delay there).
+        output_dir: Directory of the export.
+        batch_size: Rows fetched per round trip.
+        shard_rows: Most rows per shard.
+        lag_seconds: Rows created in the last lag_seconds are left for the next run.
+        compress: Write compressed shards (smaller, slower to write and read).
+        full: Ignore the watermark and export from the beginning.
+
+    Returns:
+        Dict describing the run, as recorded in the run log. It has no "seconds" when there
+        was nothing to export yet (nothing is recorded then).
+
+    Raises:
+        ValueError: If `full` is set and output_dir already holds an export.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    since = read_watermark(output_dir)
+    if full and since is not None:
+        raise ValueError(f"{output_dir} already holds an export; use a new directory for a full export")
+
+    # 1. Range of this run: [watermark, now - lag)
+    until = export_upper_bound(db, lag_seconds)
+    run_id = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    run = {"run_id": run_id, "since": since.isoformat() if since else None,
+           "until": until.isoformat() if until else None, "rows": 0, "files": []}
+    if until is None or (since is not None and until <= since):
+        logger.info(f"Nothing to export yet (watermark {run['since']}, upper bound {run['until']})")
+        return run
+
+    # 2. Stream and write, removing this run's shards if anything fails
+    writer = ShardWriter(output_dir, run_id, shard_rows, compress)
+    start = time.perf_counter()
+    try:
+        for batch in stream_interactions(db, since, until, batch_size):
+            writer.write(batch)
+        writer.flush()
+    except BaseException:
+        writer.discard()
+        raise
+    finally:
+        # Ends the read transaction, which holds back vacuum on the primary (or replay on a standby)
+        db.rollback()
+    run["seconds"] = time.perf_counter() - start
+    run["rows"] = writer.rows
+    run["files"] = [os.path.relpath(path, output_dir) for path in writer.paths]
+
+    # 3. Record the run, which also moves the watermark to `until`
+    _append_run(output_dir, run)
+    logger.info(f"Exported {writer.rows} interactions in {len(writer.paths)} shards "
+                f"({writer.rows / max(run['seconds'], 1e-9):.0f} rows/s)")
+    return run
+
+
+# --- Reading shards ---
+
+def read_shards(output_dir: str = EXPORT_DIR, since_day: str = None):
+    """
+    Yields the shards of an export in date order, as dicts of column name -> numpy array.
+    Only the shards listed in the run log are read, so a shard left over by a failed run is
+    never picked up twice.
+
+    Args:
+        output_dir: Directory of the export.
+        since_day: Skip days before this one (YYYY-MM-DD).
+    """
+    paths = [path for run in read_runs(output_dir) for path in run["files"]]
+    for path in sorted(paths):
+        if since_day is not None and path.split(os.sep)[0] < f"date={since_day}":
+            continue
+        with np.load(os.path.join(output_dir, path)) as shard:
+            yield {name: shard[name] for name in COLUMNS}
@@ -0,0 +1,382 @@
+# Catalog featurization from raw IMDb-style TSV files
+# Builds the four model assets (movies_df, indices_map and the people and genre TF-IDF matrices)
+# in the format the model loader reads, so a new catalog no longer has to be refitted outside
+# the repo. The TSVs are streamed in chunks and only the rows of selected titles are kept, so
+# memory is bounded by the catalog rather than the input (title.principals alone is tens of
+# millions of rows).
+#
+# People are hashed into a fixed number of columns and genres get append-only column ids, and
+# the IDF weights are frozen by the full build. New titles can then be appended as extra rows
+# with the same columns and weights, without changing any existing row.
+import csv
+import logging
+import os
+import tempfile
+
+import joblib
+import numpy as np
+import scipy.sparse as sp
+
+from . import lazy
+from .cold_start import split_genres
+
+pd = lazy.module("pandas")
+
+logger = logging.getLogger(__name__)
+
+# Rows read from a TSV at a time
+FEATURIZE_CHUNK_SIZE = int(os.getenv("FEATURIZE_CHUNK_SIZE", "500000"))
+# Titles need at least this many votes in title.ratings to be in the catalog
+FEATURIZE_MIN_VOTES = int(os.getenv("FEATURIZE_MIN_VOTES", "100"))
+# titleType values kept from title.basics
+FEATURIZE_TITLE_TYPES = [t.strip() for t in os.getenv("FEATURIZE_TITLE_TYPES", "movie").split(",") if t.strip()]
+# title.principals categories that count as people of a title
+PEOPLE_CATEGORIES = [c.strip() for c in os.getenv(
+    "PEOPLE_CATEGORIES", "actor,actress,director,writer,producer,composer,cinematographer,editor"
+).split(",") if c.strip()]
+# Columns people are hashed into. Collisions are rare as long as this is well above the
+# number of distinct people in the catalog.
+PEOPLE_HASH_FEATURES = int(os.getenv("PEOPLE_HASH_FEATURES", str(2 ** 20)))
+# An append warns once the rows added since the IDF was frozen exceed this share of the catalog
+FEATURIZE_REFIT_RATIO = float(os.getenv("FEATURIZE_REFIT_RATIO", "0.2"))
+
+BASICS_FILE = "title.basics.tsv"
+RATINGS_FILE = "title.ratings.tsv"
+PRINCIPALS_FILE = "title.principals.tsv"
+# Written next to the assets; the model loader doesn't read it
+VOCABULARY_FILE = "featurization_vocabulary.pkl"
+ASSET_FILES = {
+    'movies_df': 'movies_df.pkl',
+    'people_tfidf_matrix': 'people_tfidf_matrix.pkl',
+    'genre_tfidf_matrix': 'genre_tfidf_matrix.pkl',
+    'indices_map': 'indices_map.pkl',
+}
+MOVIE_COLUMNS = ['tconst', 'primaryTitle', 'startYear', 'genres', 'averageRating', 'numVotes']
+
+
+def input_path(input_dir, filename):
+    """Path of an input TSV in input_dir, gzipped or not"""
+    for candidate in (filename + ".gz", filename):
+        path = os.path.join(input_dir, candidate)
+        if os.path.isfile(path):
+            return path
+    raise FileNotFoundError(f"Neither {filename}.gz nor {filename} found in {input_dir}")
+
+
+def read_tsv_chunks(path, usecols, chunk_size: int = FEATURIZE_CHUNK_SIZE):
+    """Iterates over a TSV in DataFrames of chunk_size rows, every column as str and '\\N' as missing"""
+    return pd.read_csv(path, sep="\t", usecols=usecols, dtype=str, na_values=["\\N"], keep_default_na=False,
+                       quoting=csv.QUOTE_NONE, chunksize=chunk_size)
+
+
+def read_movies(input_dir, chunk_size: int = FEATURIZE_CHUNK_SIZE, min_votes: int = FEATURIZE_MIN_VOTES,
+                title_types=FEATURIZE_TITLE_TYPES, skip_tconsts=None):
+    """
+    Selects the catalog titles from title.basics and title.ratings.
+
+    Keeps non-adult titles of the given types with a start year and at least min_votes votes,
+    in title.basics order.
+
+    Args:
+        input_dir: Directory with the TSV files.
+        skip_tconsts: Optional set of tconsts to leave out (titles already in the catalog).
+
+    Returns:
+        DataFrame with MOVIE_COLUMNS and a RangeIndex.
+    """
+    ratings = []
+    for chunk in read_tsv_chunks(input_path(input_dir, RATINGS_FILE), ['tconst', 'averageRating', 'numVotes'],
+                                 chunk_size):
+        votes = pd.to_numeric(chunk['numVotes'], errors='coerce')
+        keep = votes >= min_votes
+        ratings.append(pd.DataFrame({
+            'averageRating': pd.to_numeric(chunk['averageRating'][keep], errors='coerce'),
+            'numVotes': votes[keep].astype(np.int64),
+        }).set_index(chunk['tconst'][keep]))
+    ratings = pd.concat(ratings) if ratings else pd.DataFrame(columns=['averageRating', 'numVotes'])
+    ratings = ratings[~ratings.index.duplicated()]
+
+    movies = []
+    columns = ['tconst', 'titleType', 'primaryTitle', 'isAdult', 'startYear', 'genres']
+    for chunk in read_tsv_chunks(input_path(input_dir, BASICS_FILE), columns, chunk_size):
+        keep = (chunk['titleType'].isin(title_types) & (chunk['isAdult'] != "1")
+                & chunk['startYear'].notna() & chunk['tconst'].isin(ratings.index))
+        if skip_tconsts:
+            keep &= ~chunk['tconst'].isin(skip_tconsts)
+        movies.append(chunk.loc[keep, ['tconst', 'primaryTitle', 'startYear', 'genres']])
+    if not movies:
+        return pd.DataFrame(columns=MOVIE_COLUMNS)
+
+    movies_df = pd.concat(movies, ignore_index=True)
+    movies_df['startYear'] = pd.to_numeric(movies_df['startYear'], errors='coerce')
+    movies_df = movies_df[~movies_df['tconst'].duplicated() & movies_df['startYear'].notna()].reset_index(drop=True)
+    movies_df['startYear'] = movies_df['startYear'].astype(np.int64)
+    movie_ratings = ratings.loc[movies_df['tconst']]
+    movies_df['averageRating'] = movie_ratings['averageRating'].to_numpy()
+    movies_df['numVotes'] = movie_ratings['numVotes'].to_numpy()
+    return movies_df[MOVIE_COLUMNS]
+
+
+def build_indices_map(movies_df):
+    """'Title (Year)' -> movies_df index label; the first title wins when two share a key"""
+    keys = movies_df['primaryTitle'].astype(str) + " (" + movies_df['startYear'].astype(str) + ")"
+    indices_map = pd.Series(movies_df.index, index=keys.to_numpy())
+    return indices_map[~indices_map.index.duplicated()]
+
+
+def _smooth_idf(n_documents, document_counts):
+    # Same formula as scikit-learn's TfidfVectorizer(smooth_idf=True)
+    return np.log((1.0 + n_documents) / (1.0 + document_counts)) + 1.0
+
+
+def _tfidf(counts, idf):
+    """Weights a CSR count matrix by idf and L2-normalises its rows (empty rows stay empty)"""
+    matrix = counts.astype(np.float64).tocsr(copy=True)
+    matrix.data *= idf[matrix.indices]
+    row_of_value = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+    norms = np.sqrt(np.bincount(row_of_value, weights=matrix.data ** 2, minlength=matrix.shape[0]))
+    matrix.data /= norms[row_of_value]
+    return matrix
+
+
+class FeatureVocabulary:
+    """
+    Column layout and IDF weights of the people and genre matrices.
+
+    People are hashed into n_people_features columns, so any new person has a column already.
+    Genres get the next free column the first time they are seen. Document frequencies keep
+    counting as titles are appended, but the IDF used to weight rows is the one frozen by the
+    last full build, so appended rows are comparable with the existing ones.
+
+    Args:
+        n_people_features: Number of hashed people columns.
+    """
+
+    def __init__(self, n_people_features: int = PEOPLE_HASH_FEATURES):
+        self.n_people_features = n_people_features
+        self.genre_columns = {}
+        self.n_documents = 0
+        self.people_document_counts = np.zeros(n_people_features, dtype=np.int64)
+        self.genre_document_counts = np.zeros(0, dtype=np.int64)
+        # Frozen by freeze_idf()
+        self.fitted_documents = 0
+        self.people_idf = None
+        self.genre_idf = None
+
+    def people_columns(self, nconsts):
+        """Hashed column of each person id (stable across processes and runs)"""
+        hashes = pd.util.hash_array(np.asarray(nconsts, dtype=object))
+        return (hashes % np.uint64(self.n_people_features)).astype(np.int64)
+
+    def genre_counts(self, genres):
+        """
+        Genre count matrix of a genres column, adding columns for genres not seen before.
+
+        Returns:
+            CSR matrix of shape (len(genres), number of genre columns).
+        """
+        rows, cols = [], []
+        for row, value in enumerate(genres):
+            for genre in split_genres(value):
+                cols.append(self.genre_columns.setdefault(genre, len(self.genre_columns)))
+                rows.append(row)
+        return sp.csr_matrix((np.ones(len(rows), dtype=np.float64), (rows, cols)),
+                             shape=(len(genres), len(self.genre_columns)))
+
+    def observe(self, people_counts, genre_counts):
+        """Adds the document frequencies of new rows"""
+        self.n_documents += people_counts.shape[0]
+        self.people_document_counts += np.bincount(people_counts.indices, minlength=self.n_people_features)
+        genre_counts_by_column = np.bincount(genre_counts.indices, minlength=len(self.genre_columns))
+        previous = self.genre_document_counts
+        self.genre_document_counts = genre_counts_by_column.astype(np.int64)
+        self.genre_document_counts[:len(previous)] += previous
+
+    def freeze_idf(self):
+        """Fixes the IDF weights at the current document frequencies"""
+        self.fitted_documents = self.n_documents
+        self.people_idf = _smooth_idf(self.n_documents, self.people_document_counts)
+        self.genre_idf = _smooth_idf(self.n_documents, self.genre_document_counts)
+
+    @property
+    def appended_documents(self):
+        """Rows appended since the IDF was frozen"""
+        return self.n_documents - self.fitted_documents
+
+    def people_tfidf(self, people_counts):
+        return _tfidf(people_counts, self.people_idf)
+
+    def genre_tfidf(self, genre_counts):
+        idf = self.genre_idf
+        if genre_counts.shape[1] > len(idf):
+            # Genres that first appeared in an append are weighted as if unseen at the freeze
+            unseen = np.zeros(genre_counts.shape[1] - len(idf), dtype=np.int64)
+            idf = np.concatenate([idf, _smooth_idf(self.fitted_documents, unseen)])
+        return _tfidf(genre_counts, idf)
+
+
+def read_people_counts(input_dir, tconsts, vocabulary, chunk_size: int = FEATURIZE_CHUNK_SIZE,
+                       categories=PEOPLE_CATEGORIES):
+    """
+    People count matrix of the given titles, streamed from title.principals.
+
+    Args:
+        tconsts: tconst of each row of the matrix.
+        vocabulary: FeatureVocabulary that hashes the people.
+
+    Returns:
+        CSR matrix of shape (len(tconsts), vocabulary.n_people_features) with how many times
+        each person is credited on each title.
+    """
+    title_rows = pd.Index(tconsts)
+    rows, cols = [], []
+    for chunk in read_tsv_chunks(input_path(input_dir, PRINCIPALS_FILE), ['tconst', 'nconst', 'category'],
+                                 chunk_size):
+        chunk = chunk[chunk['category'].isin(categories) & chunk['nconst'].notna()]
+        positions = title_rows.get_indexer(chunk['tconst'])
+        found = positions >= 0
+        rows.append(positions[found].astype(np.int32))
+        cols.append(vocabulary.people_columns(chunk['nconst'].to_numpy()[found]).astype(np.int32))
+    rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int32)
+    cols = np.concatenate(cols) if cols else np.zeros(0, dtype=np.int32)
+    counts = sp.csr_matrix((np.ones(len(rows), dtype=np.float64), (rows, cols)),
+                           shape=(len(title_rows), vocabulary.n_people_features))
+    counts.sum_duplicates()
+    return counts
+
+
+def build_assets(input_dir, chunk_size: int = FEATURIZE_CHUNK_SIZE, min_votes: int = FEATURIZE_MIN_VOTES,
+                 n_people_features: int = PEOPLE_HASH_FEATURES):
+    """
+    Full build: selects the catalog, fits the vocabulary and IDF and featurizes every title.
+
+    Returns:
+        Tuple of (assets, vocabulary). assets has the model loader's four keys.
+    """
+    movies_df = read_movies(input_dir, chunk_size, min_votes)
+    logger.info(f"Selected {len(movies_df)} titles from {input_dir}")
+
+    vocabulary = FeatureVocabulary(n_people_features)
+    people_counts = read_people_counts(input_dir, movies_df['tconst'], vocabulary, chunk_size)
+    genre_counts = vocabulary.genre_counts(movies_df['genres'].to_numpy())
+    vocabulary.observe(people_counts, genre_counts)
+    vocabulary.freeze_idf()
+    logger.info(f"Featurized {people_counts.nnz} credits and {genre_counts.nnz} genre tags "
+                f"({len(vocabulary.genre_columns)} genres)")
+
+    assets = {
+        'movies_df': movies_df,
+        'people_tfidf_matrix': vocabulary.people_tfidf(people_counts),
+        'genre_tfidf_matrix': vocabulary.genre_tfidf(genre_counts),
+        'indices_map': build_indices_map(movies_df),
+    }
+    return assets, vocabulary
+
+
+def _widen(matrix, n_columns):
+    """Same CSR matrix with extra empty columns on the right"""
+    matrix = matrix.tocsr()
+    if matrix.shape[1] == n_columns:
+        return matrix
+    return sp.csr_matrix((matrix.data, matrix.indices, matrix.indptr), shape=(matrix.shape[0], n_columns))
+
+
+def append_assets(assets, vocabulary, input_dir, chunk_size: int = FEATURIZE_CHUNK_SIZE,
+                  min_votes: int = FEATURIZE_MIN_VOTES):
+    """
+    Incremental build: appends the titles in input_dir that aren't in the catalog yet as new
+    rows, weighted with the frozen IDF. Existing rows, positions and index labels are unchanged.
+
+    Args:
+        assets: The four assets of a previous build (not modified).
+        vocabulary: The FeatureVocabulary saved with them; its document frequencies are updated.
+
+    Returns:
+        Tuple of (new assets, number of titles appended).
+
+    Raises:
+        ValueError: If the assets weren't built with this vocabulary.
+    """
+    movies_df = assets['movies_df']
+    people_matrix = assets['people_tfidf_matrix']
+    genre_matrix = assets['genre_tfidf_matrix']
+    if people_matrix.shape != (len(movies_df), vocabulary.n_people_features) or \
+            genre_matrix.shape[0] != len(movies_df) or genre_matrix.shape[1] > len(vocabulary.genre_columns):
+        raise ValueError("The assets don't match the featurization vocabulary; run a full build first")
+
+    new_df = read_movies(input_dir, chunk_size, min_votes, skip_tconsts=set(movies_df['tconst']))
+    if new_df.empty:
+        return assets, 0
+    # New rows get the index labels after the existing ones, as indices_map points at labels
+    start = int(movies_df.index.max()) + 1 if len(movies_df) else 0
+    new_df.index = pd.RangeIndex(start, start + len(new_df))
+
+    people_counts = read_people_counts(input_dir, new_df['tconst'], vocabulary, chunk_size)
+    genre_counts = vocabulary.genre_counts(new_df['genres'].to_numpy())
+    vocabulary.observe(people_counts, genre_counts)
+    n_genres = len(vocabulary.genre_columns)
+
+    new_keys = build_indices_map(new_df)
+    indices_map = assets['indices_map']
+    new_assets = {
+        'movies_df': pd.concat([movies_df, new_df[movies_df.columns]]),
+        'people_tfidf_matrix': sp.vstack([people_matrix, vocabulary.people_tfidf(people_counts)], format='csr'),
+        'genre_tfidf_matrix': sp.vstack([_widen(genre_matrix, n_genres),
+                                         _widen(vocabulary.genre_tfidf(genre_counts), n_genres)], format='csr'),
+        'indices_map': pd.concat([indices_map, new_keys[~new_keys.index.isin(indices_map.index)]]),
+    }
+    return new_assets, len(new_df)
+
+
+def needs_refit(vocabulary, refit_ratio: float = FEATURIZE_REFIT_RATIO):
+    """Whether enough titles were appended since the last full build for the frozen IDF to drift"""
+    return vocabulary.appended_documents > refit_ratio * max(1, vocabulary.fitted_documents)
+
+
+def _atomic_dump(value, path):
+    # Written under a temporary name and renamed, so a loader never sees a partial file
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    os.close(fd)
+    try:
+        joblib.dump(value, tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def save_assets(assets, vocabulary, output_dir):
+    """
+    Writes the assets under the file names the model loader expects (for MODEL_ASSETS_DIR),
+    plus the vocabulary that later appends need.
+
+    Returns:
+        List of written paths.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for asset_key, filename in ASSET_FILES.items():
+        path = os.path.join(output_dir, filename)
+        _atomic_dump(assets[asset_key], path)
+        paths.append(path)
+    path = os.path.join(output_dir, VOCABULARY_FILE)
+    _atomic_dump(vocabulary, path)
+    paths.append(path)
+    return paths
+
+
+def load_assets(assets_dir):
+    """
+    Reads the assets and vocabulary written by save_assets.
+
+    Raises:
+        FileNotFoundError: If any of the files is missing.
+    """
+    assets = {}
+    for asset_key, filename in ASSET_FILES.items():
+        assets[asset_key] = joblib.load(os.path.join(assets_dir, filename))
+    vocabulary_path = os.path.join(assets_dir, VOCABULARY_FILE)
+    if not os.path.isfile(vocabulary_path):
+        raise FileNotFoundError(f"{VOCABULARY_FILE} not found in {assets_dir}; the assets weren't built by "
+                                f"the featurize command, run a full build first")
+    return assets, joblib.load(vocabulary_path)
@@ -0,0 +1,112 @@
+# Bitset index for filtered recommendations
+# Built once from movies_df when the assets load. Each filter value maps to a packed bitset
+# over catalog rows, so a request's filters combine into a candidate mask with a few
+# bitwise ANDs over n/8 bytes instead of comparisons over the DataFrame.
+import numpy as np
+
+from .cold_start import split_genres
+
+
+def _pack(mask):
+    return np.packbits(mask)
+
+
+def _cumulative_ge_bits(values, thresholds):
+    """
+    For sorted thresholds t_0 < t_1 < ..., builds bits[i] = packed(values >= t_i).
+    Built from the top down so each bitset is one OR on top of the previous one.
+    """
+    bits = [None] * len(thresholds)
+    running = np.zeros(len(values), dtype=bool)
+    for i in range(len(thresholds) - 1, -1, -1):
+        lower = thresholds[i]
+        upper = thresholds[i + 1] if i + 1 < len(thresholds) else np.inf
+        running |= (values >= lower) & (values < upper)
+        bits[i] = _pack(running)
+    return bits
+
+
+class FilterIndex:
+    """
+    Packed bitsets over catalog rows:
+        - one per genre,
+        - one per distinct release year y, for "startYear >= y",
+        - one per distinct rating bucket r (0.1 steps, like IMDb ratings), for "averageRating >= r".
+    Year and rating ranges are then differences of two cumulative bitsets.
+    """
+
+    def __init__(self, movies_df):
+        self.n = len(movies_df)
+
+        self.genre_bits = {}
+        genre_rows = {}
+        for position, value in enumerate(movies_df['genres'].to_numpy()):
+            for genre in split_genres(value):
+                genre_rows.setdefault(genre.lower(), []).append(position)
+        for genre, rows in genre_rows.items():
+            mask = np.zeros(self.n, dtype=bool)
+            mask[rows] = True
+            self.genre_bits[genre] = _pack(mask)
+
+        years = movies_df['startYear'].to_numpy(dtype=np.float64)
+        self.year_values = np.unique(years[~np.isnan(years)])
+        self.year_ge_bits = _cumulative_ge_bits(years, self.year_values)
+
+        ratings = np.round(movies_df['averageRating'].to_numpy(dtype=np.float64), 1)
+        self.rating_values = np.unique(ratings[~np.isnan(ratings)])
+        self.rating_ge_bits = _cumulative_ge_bits(ratings, self.rating_values)
+
+        self._empty = _pack(np.zeros(self.n, dtype=bool))
+
+    @property
+    def nbytes(self):
+        return (sum(b.nbytes for b in self.genre_bits.values())
+                + sum(b.nbytes for b in self.year_ge_bits)
+                + sum(b.nbytes for b in self.rating_ge_bits))
+
+    def _ge(self, values, bits, threshold):
+        i = np.searchsorted(values, threshold - 1e-9, side="left")
+        return bits[i] if i < len(bits) else self._empty
+
+    def candidate_mask(self, genres=None, year_from=None, year_to=None, min_rating=None):
+        """
+        Combines the filters into a boolean mask over catalog rows.
+        A movie passes the genre filter if it has any of the given genres.
+
+        Returns:
+            Boolean array of length n, or None when no filter is set.
+        """
+        bits = None
+
+        def intersect(other):
+            nonlocal bits
+            bits = other if bits is None else np.bitwise_and(bits, other)
+
+        if genres:
+            any_genre = self._empty
+            for genre in genres:
+                any_genre = np.bitwise_or(any_genre, self.genre_bits.get(genre.lower(), self._empty))
+            intersect(any_genre)
+        if year_from is not None:
+            intersect(self._ge(self.year_values, self.year_ge_bits, year_from))
+        if year_to is not None:
+            too_new = self._ge(self.year_values, self.year_ge_bits, year_to + 1)
+            intersect(np.bitwise_and(self._ge(self.year_values, self.year_ge_bits, -np.inf), np.invert(too_new)))
+        if min_rating is not None:
+            intersect(self._ge(self.rating_values, self.rating_ge_bits, min_rating))
+
+        if bits is None:
+            return None
+        return np.unpackbits(bits, count=self.n).astype(bool)
+
+
+def filter_key(genres=None, year_from=None, year_to=None, min_rating=None):
+    """A canonical string for a set of filters; empty when no filter is set"""
+    parts = []
+    if genres:
+        parts.append("g=" + ",".join(sorted({g.lower() for g in genres})))
+    if year_from is not None or year_to is not None:
+        parts.append(f"y={year_from if year_from is not None else ''}-{year_to if year_to is not None else ''}")
+    if min_rating is not None:
+        parts.append(f"r={min_rating:g}")
+    return ";".join(parts)
@@ -0,0 +1,52 @@
+# HTTP conditional caching helpers
+# Routes compute a strong ETag from the inputs that determine their response (model version,
+# the user's profile, snapshot version, query parameters) and answer a matching
+# If-None-Match with 304 before doing any scoring or enrichment work.
+import hashlib
+import os
+
+from fastapi import Request, Response
+
+# Cache-Control per route. Recommendations are per user, so only the client may cache them;
+# catalog responses are the same for everyone and can be absorbed by a CDN or reverse proxy.
+RECOMMENDATIONS_CACHE_CONTROL = os.getenv("RECOMMENDATIONS_CACHE_CONTROL", "private, max-age=60")
+TRENDING_CACHE_CONTROL = os.getenv("TRENDING_CACHE_CONTROL", "public, max-age=300, stale-while-revalidate=600")
+SEARCH_CACHE_CONTROL = os.getenv("SEARCH_CACHE_CONTROL", "public, max-age=3600, stale-while-revalidate=86400")
+# Used when a catalog response has no version to build an ETag from (e.g. the DB fallback)
+UNVERSIONED_CACHE_CONTROL = os.getenv("UNVERSIONED_CACHE_CONTROL", "public, max-age=60")
+
+
+def make_etag(*parts) -> str:
+    """Builds a strong ETag from the values that determine a response"""
+    digest = hashlib.sha1("|".join(str(p) for p in parts).encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """
+    True if the request's If-None-Match header matches the ETag.
+    Uses the weak comparison RFC 9110 prescribes for If-None-Match.
+    """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in header.split(",")]
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def caching_headers(etag: str = None, cache_control: str = None, vary: str = None) -> dict:
+    headers = {}
+    if etag:
+        headers["ETag"] = etag
+    if cache_control:
+        headers["Cache-Control"] = cache_control
+    if vary:
+        headers["Vary"] = vary
+    return headers
+
+
+def not_modified(etag: str, cache_control: str = None, vary: str = None) -> Response:
+    """An empty 304 response carrying the validators the client should keep using"""
+    return Response(status_code=304, headers=caching_headers(etag, cache_control, vary))
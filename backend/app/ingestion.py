@@ -0,0 +1,276 @@
+# Write-behind ingestion of user interactions
+# In "queued" mode POST /interactions only validates and enqueues the interaction. A background
+# worker coalesces duplicate user/movie events and writes them to Postgres in batches,
+# turning one transaction per like into one transaction per batch.
+import logging
+import os
+import queue
+import threading
+import time
+from collections import defaultdict, deque
+
+from . import crud, database
+
+logger = logging.getLogger(__name__)
+
+# "sync" writes each interaction in the request (the default), "queued" uses the write-behind queue
+INTERACTION_INGEST_MODE = os.getenv("INTERACTION_INGEST_MODE", "sync")
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "10000"))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "500"))
+INGEST_FLUSH_INTERVAL_MS = int(os.getenv("INGEST_FLUSH_INTERVAL_MS", "200"))
+# How long a request waits for room in a full queue before it is rejected
+INGEST_ENQUEUE_TIMEOUT_SECONDS = float(os.getenv("INGEST_ENQUEUE_TIMEOUT_SECONDS", "0.5"))
+# Pause before retrying a batch whose write failed
+INGEST_RETRY_DELAY_MS = int(os.getenv("INGEST_RETRY_DELAY_MS", "100"))
+
+_STOP = object()
+
+
+class QueueFullError(Exception):
+    """Raised when the ingestion queue stays full for longer than the enqueue timeout."""
+
+
+class InteractionIngestor:
+    """
+    Bounded in-process queue plus a single worker thread that flushes batches.
+    A batch is flushed when it reaches batch_size distinct events or when
+    flush_interval_ms has passed since its first event, whichever comes first.
+    """
+
+    def __init__(self, session_factory=database.SessionLocal, queue_size=INGEST_QUEUE_SIZE,
+                 batch_size=INGEST_BATCH_SIZE, flush_interval_ms=INGEST_FLUSH_INTERVAL_MS):
+        self.session_factory = session_factory
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000.0
+        self._thread = None
+
+        self._stats_lock = threading.Lock()
+        self._visibility_latencies = deque(maxlen=10000)
+        self.stats = {
+            "enqueued": 0,
+            "rejected": 0,
+            "coalesced": 0,
+            "written": 0,
+            "unknown_movie": 0,
+            "batches": 0,
+            "retried_batches": 0,
+            "failed_batches": 0,
+            "dropped": 0,
+        }
+
+    # --- Producer side ---
+
+    def submit(self, user_id, tconst: str, interaction_type: str, timeout=INGEST_ENQUEUE_TIMEOUT_SECONDS):
+        """
+        Enqueues an interaction. Blocks for up to `timeout` seconds when the queue is full.
+
+        Raises:
+            QueueFullError: If there is still no room after the timeout (backpressure).
+        """
+        try:
+            self.queue.put((user_id, tconst, interaction_type, time.monotonic()), timeout=timeout)
+        except queue.Full:
+            self._bump("rejected")
+            raise QueueFullError("Interaction queue is full")
+        self._bump("enqueued")
+
+    # --- Worker side ---
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="interaction-ingestor", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=30.0):
+        """Flushes everything already enqueued, then stops the worker"""
+        if self._thread is None:
+            return
+        thread, self._thread = self._thread, None
+        if not thread.is_alive():
+            logger.error(f"Interaction ingestor worker is not running; {self.queue.qsize()} events may be lost")
+            return
+
+        # The queue is bounded, so even the stop marker may have to wait for room
+        deadline = time.monotonic() + timeout
+        try:
+            self.queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            logger.error(f"Interaction ingestor did not drain within {timeout}s; "
+                         f"{self.queue.qsize()} events may be lost")
+            return
+        thread.join(max(0.0, deadline - time.monotonic()))
+        if thread.is_alive():
+            logger.error(f"Interaction ingestor did not drain within {timeout}s; "
+                         f"{self.queue.qsize()} events may be lost")
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self.queue.get()
+            if item is _STOP:
+                break
+
+            # (user_id, tconst) -> (interaction_type, first enqueue time). Later events win.
+            batch = {}
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                user_id, tconst, interaction_type, enqueued_at = item
+                key = (user_id, tconst)
+                if key in batch:
+                    self._bump("coalesced")
+                    enqueued_at = batch[key][1]
+                batch[key] = (interaction_type, enqueued_at)
+
+                remaining = deadline - time.monotonic()
+                if len(batch) >= self.batch_size or remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+
+            self._flush(batch)
+
+        # Drain whatever arrived behind the stop marker
+        leftovers = {}
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                user_id, tconst, interaction_type, enqueued_at = item
+                leftovers[(user_id, tconst)] = (interaction_type, enqueued_at)
+        if leftovers:
+            self._flush(leftovers)
+
+    def _write(self, events):
+        """Writes {(user_id, tconst): interaction_type} in one transaction, rolled back on failure"""
+        db = self.session_factory()
+        try:
+            return crud.bulk_upsert_interactions(db, events)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _write_isolated(self, events):
+        """
+        Writes a batch that failed as a whole: one transaction per user, and one per event for
+        the users whose write still fails, so only the events that can't be written are lost.
+
+        Returns:
+            tuple: (number written, unknown-movie pairs, dropped pairs)
+        """
+        by_user = defaultdict(dict)
+        for (user_id, tconst), interaction_type in events.items():
+            by_user[user_id][(user_id, tconst)] = interaction_type
+
+        written, unknown, dropped = 0, [], []
+        for user_events in by_user.values():
+            try:
+                user_written, user_unknown = self._write(user_events)
+                written += user_written
+                unknown += user_unknown
+                continue
+            except Exception:
+                pass
+            for key, interaction_type in user_events.items():
+                try:
+                    event_written, event_unknown = self._write({key: interaction_type})
+                except Exception as e:
+                    logger.error(f"Dropped interaction {interaction_type} of user {key[0]} on {key[1]}: {str(e)}")
+                    dropped.append(key)
+                    continue
+                written += event_written
+                unknown += event_unknown
+        return written, unknown, dropped
+
+    def _flush(self, batch):
+        events = {key: interaction_type for key, (interaction_type, _) in batch.items()}
+        dropped = []
+        try:
+            written, unknown = self._write(events)
+        except Exception as e:
+            # 1. Retry the whole batch once, for transient errors (lost connection, deadlock...)
+            logger.warning(f"Failed to write batch of {len(events)} interactions, retrying: {str(e)}")
+            self._bump("retried_batches")
+            time.sleep(INGEST_RETRY_DELAY_MS / 1000.0)
+            try:
+                written, unknown = self._write(events)
+            except Exception as e:
+                # 2. Something in the batch can't be written (e.g. a user deleted since the event
+                #    was enqueued); write the rest without it
+                logger.error(f"Batch of {len(events)} interactions failed again ({str(e)}); "
+                             f"writing it user by user")
+                self._bump("failed_batches")
+                written, unknown, dropped = self._write_isolated(events)
+
+        committed_at = time.monotonic()
+        lost = set(dropped)
+        with self._stats_lock:
+            self.stats["batches"] += 1
+            self.stats["written"] += written
+            self.stats["unknown_movie"] += len(unknown)
+            self.stats["dropped"] += len(dropped)
+            self._visibility_latencies.extend(committed_at - enqueued_at
+                                              for key, (_, enqueued_at) in batch.items() if key not in lost)
+        if unknown:
+            logger.warning(f"Dropped {len(unknown)} interactions for movies not in the database")
+        if dropped:
+            logger.error(f"Dropped {len(dropped)} of {len(events)} interactions that could not be written")
+
+    # --- Stats ---
+
+    def _bump(self, name, amount=1):
+        with self._stats_lock:
+            self.stats[name] += amount
+
+    def get_stats(self):
+        """
+        Returns counters plus the enqueue-to-commit ("visibility") latency samples
+        of the most recent events, in seconds.
+        """
+        with self._stats_lock:
+            stats = dict(self.stats)
+            stats["queue_depth"] = self.queue.qsize()
+            stats["visibility_latencies"] = list(self._visibility_latencies)
+        return stats
+
+
+# --- The application's ingestor ---
+
+_ingestor = None
+
+
+def is_enabled():
+    return INTERACTION_INGEST_MODE == "queued"
+
+
+def start_ingestor():
+    """Starts the application's ingestor if queued mode is enabled"""
+    global _ingestor
+    if not is_enabled() or _ingestor is not None:
+        return
+    _ingestor = InteractionIngestor()
+    _ingestor.start()
+    logger.info(f"Interaction ingestion queue started (size={INGEST_QUEUE_SIZE}, batch={INGEST_BATCH_SIZE}, "
+                f"interval={INGEST_FLUSH_INTERVAL_MS}ms)")
+
+
+def stop_ingestor():
+    """Drains the queue into the database and stops the worker"""
+    global _ingestor
+    if _ingestor is None:
+        return
+    logger.info(f"Draining interaction ingestion queue ({_ingestor.queue.qsize()} pending)...")
+    _ingestor.stop()
+    _ingestor = None
+
+
+def get_ingestor():
+    return _ingestor
@@ -0,0 +1,50 @@
+# Deferred imports
+# Heavy dependencies that only some code paths need (pandas, passlib, jose, huggingface_hub,
+# joblib, requests)
+# are bound to module-level stand-ins that import the real module the first time one of its
+# attributes is used. Importing the app, for the API or a one-off CLI command, then doesn't
+# pay for modules it never touches. See app/startup.py for the import time report.
+import importlib
+import threading
+import time
+
+# Module name -> seconds its deferred import took, in load order
+import_timings = {}
+_lock = threading.Lock()
+
+
+class LazyModule:
+    """
+    Stands in for a module until first use.
+
+    Args:
+        name: Absolute module name, e.g. "pandas" or "passlib.context".
+    """
+
+    __slots__ = ("_name", "_module")
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        with _lock:
+            if self._module is None:
+                start = time.perf_counter()
+                module = importlib.import_module(self._name)
+                import_timings.setdefault(self._name, time.perf_counter() - start)
+                self._module = module
+        return self._module
+
+    def __getattr__(self, attr):
+        # Only called for attributes not found on the stand-in itself, i.e. the module's
+        return getattr(self._module or self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+def module(name: str) -> LazyModule:
+    """A stand-in for `import name` that defers the import to first attribute access"""
+    return LazyModule(name)
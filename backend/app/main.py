@@ -1,12 +1,14 @@
+import asyncio
 import logging
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Response
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
 from contextlib import asynccontextmanager
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from .model_loader import load_model_assets
-from . import models, database, seed_db, assets
-from .routers import router as user_router, movie_router
-import typer
+from . import models, database, assets, trending, serialization, rec_cache, ingestion, metrics, profiling, scoring_pool
+from .routers import router as user_router, movie_router, admin_router
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -20,6 +22,7 @@ async def lifespan(app: FastAPI):
         logger.info("Loading model assets...")
         loaded_assets = load_model_assets()
         assets.update_model_assets(loaded_assets)
+        metrics.record_model_asset_memory(loaded_assets)
         logger.info(f"Application startup completed. Loaded {len(loaded_assets)} model assets.")
         
         
@@ -27,25 +30,63 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.error(f"Failed to load model assets during startup: {str(e)}")
         logger.warning(" Application will start but may have limited functionality.")
+    else:
+        # Score recommendations in dedicated worker processes (when SCORING_POOL_WORKERS > 0)
+        try:
+            await asyncio.to_thread(scoring_pool.start_pool, loaded_assets)
+        except Exception as e:
+            logger.error(f"Failed to start the scoring pool: {str(e)}")
+            logger.warning("Recommendations will be scored in the request threads.")
+
+    # Build the trending snapshot in the background and keep it fresh
+    trending_task = asyncio.create_task(trending.run_refresh_loop())
+
+    # Start the write-behind interaction queue (only in queued ingestion mode)
+    ingestion.start_ingestor()
     
     yield
     
     # This code runs on shutdown
     logger.info("Application shutdown initiated...")
+    # Flush queued interactions before anything else goes away
+    await asyncio.to_thread(ingestion.stop_ingestor)
+    trending_task.cancel()
+    # Wait for the refresh loop to stop, so it can't publish a snapshot after it is cleared
+    try:
+        await trending_task
+    except asyncio.CancelledError:
+        pass
+    await asyncio.to_thread(scoring_pool.stop_pool)
+    trending.clear_trending_snapshot()
+    rec_cache.clear()
     assets.clear_model_assets()
     logger.info("Application shutdown completed.")
 
 
-cli_app = typer.Typer()
-
 # Create the FastAPI app instance with the lifespan manager
 app = FastAPI(
     title="Grapho Recommendation Engine API",
     description="A FastAPI-based recommendation engine for movies",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
+# Compress larger payloads (e.g. deep recommendation pages) for clients that accept gzip
+if serialization.GZIP_MINIMUM_SIZE > 0:
+    app.add_middleware(GZipMiddleware, minimum_size=serialization.GZIP_MINIMUM_SIZE)
+
+# Opt-in sampling profiler for slow requests
+if profiling.PROFILING_ENABLED:
+    app.add_middleware(profiling.ProfilingMiddleware)
+
+# Added last so it is outermost and its latencies include the other middleware
+if metrics.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+    metrics.instrument_engine(database.engine)
+    if database.has_replica():
+        metrics.instrument_engine(database.read_engine)
+
 # Dependency to get a DB session
 def get_db():
     db = database.SessionLocal()
@@ -57,6 +98,7 @@ def get_db():
 # Include the routers
 app.include_router(user_router)
 app.include_router(movie_router)
+app.include_router(admin_router)
 
 @app.get("/db-check")
 def database_check(db: Session = Depends(get_db)):
@@ -84,6 +126,12 @@ def read_root():
         "loaded_assets": list(model_assets.keys()) if model_assets else []
     }
 
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    """Prometheus scrape endpoint"""
+    body, content_type = metrics.render_metrics()
+    return Response(content=body, media_type=content_type)
+
 @app.get("/health")
 def health_check():
     model_assets = assets.get_model_assets()
@@ -94,30 +142,9 @@ def health_check():
     }
 
 
-@cli_app.command("seed-db-command")
-def seed_db_command():
-    """
-    Command-line utility to seed the database with movie data.
-    """
-    typer.echo("Seeding process initiated...")
-    
-    # We can't use the 'model_assets' from the running app,
-    # so we'll load them fresh for this one-off command.
-    assets = load_model_assets()
-    movies_df = assets.get('movies_df')
-    
-    if movies_df is not None:
-        db = database.SessionLocal()
-        try:
-            # Call our refactored seeder function
-            seed_db.seed_movies_table(db, movies_df)
-        finally:
-            db.close()
-    else:
-        typer.echo("Could not load movies_df. Aborting.")
-
-
 if __name__ == "__main__":
+    # The commands live in app.cli, so serving never imports the offline modules they need
+    from .cli import cli_app
     cli_app()
 # You will add your other endpoints here later, for example:
 # @app.get("/recommendations/{movie_id}")
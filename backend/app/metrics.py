@@ -0,0 +1,296 @@
+# Prometheus metrics
+# Request latency per route, stage timings of the recommendation and enrichment pipelines,
+# DB query counts/durations, outbound TMDb calls, coalesced duplicate computations and model
+# asset memory, exposed at /metrics.
+# Everything here is a few dict lookups and a perf_counter() per observation, so it's meant
+# to stay on in production; set METRICS_ENABLED=false to turn it off entirely.
+import logging
+import os
+import sys
+import time
+from contextlib import nullcontext
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+# Set by prometheus_client users running several worker processes; metrics are then
+# aggregated across workers from files in this directory
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+# Stages run in milliseconds, so they need finer buckets than whole requests
+_STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+)
+STAGE_LATENCY = Histogram(
+    "pipeline_stage_duration_seconds",
+    "Time spent in each stage of the recommendation and enrichment pipelines",
+    ["pipeline", "stage"],
+    buckets=_STAGE_BUCKETS,
+)
+DB_QUERIES = Counter(
+    "db_queries_total",
+    "SQL statements executed, by statement type",
+    ["operation"],
+)
+DB_QUERY_LATENCY = Histogram(
+    "db_query_duration_seconds",
+    "SQL statement execution time, by statement type",
+    ["operation"],
+    buckets=_STAGE_BUCKETS,
+)
+TMDB_REQUESTS = Counter(
+    "tmdb_requests_total",
+    "Outbound TMDb API requests, by outcome",
+    ["outcome"],
+)
+TMDB_REQUEST_LATENCY = Histogram(
+    "tmdb_request_duration_seconds",
+    "Outbound TMDb API request latency",
+    buckets=_STAGE_BUCKETS,
+)
+SCORING_QUEUE_WAIT = Histogram(
+    "scoring_queue_wait_seconds",
+    "Time scoring requests wait for a scoring pool worker",
+    buckets=_STAGE_BUCKETS,
+)
+SCORING_EXECUTION = Histogram(
+    "scoring_execution_seconds",
+    "Time a scoring pool worker spends ranking candidates",
+    buckets=_STAGE_BUCKETS,
+)
+SCORING_PENDING = Gauge(
+    "scoring_pending_requests",
+    "Scoring requests waiting for or running in the scoring pool",
+    multiprocess_mode="livesum",
+)
+SCORING_REJECTED = Counter(
+    "scoring_rejected_total",
+    "Scoring requests rejected because the scoring pool was saturated",
+)
+SINGLEFLIGHT_CALLS = Counter(
+    "singleflight_calls_total",
+    "Calls through a request-coalescing group: 'executed' ran the computation, "
+    "'coalesced' waited for an identical one already in flight",
+    ["group", "outcome"],
+)
+DB_READ_SESSIONS = Counter(
+    "db_read_sessions_total",
+    "Sessions opened for read-only paths, by the server they read from "
+    "('replica', or 'primary' inside a user's read-your-writes window)",
+    ["target"],
+)
+MODEL_ASSET_BYTES = Gauge(
+    "model_asset_bytes",
+    "Approximate memory held by each loaded model asset",
+    ["asset"],
+    multiprocess_mode="max",
+)
+
+_SQL_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH"}
+
+# Histogram children by label values, so hot paths skip prometheus_client's label validation
+_stage_children = {}
+# In scoring pool workers, stage timings are collected here and sent back with the result
+# (see start_stage_collection), since a worker's own registry is never scraped
+_stage_collector = None
+
+
+class _Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class _CollectingTimer:
+    __slots__ = ("pipeline", "stage", "start")
+
+    def __init__(self, pipeline, stage):
+        self.pipeline = pipeline
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if _stage_collector is not None:
+            _stage_collector.append((self.pipeline, self.stage, time.perf_counter() - self.start))
+        return False
+
+
+def _stage_child(pipeline: str, stage: str):
+    key = (pipeline, stage)
+    child = _stage_children.get(key)
+    if child is None:
+        child = _stage_children[key] = STAGE_LATENCY.labels(pipeline, stage)
+    return child
+
+
+def stage_timer(pipeline: str, stage: str):
+    """
+    Context manager that records the time spent in a pipeline stage.
+
+    Args:
+        pipeline: Pipeline name, e.g. "recommendation" or "enrichment".
+        stage: Stage name within the pipeline.
+    """
+    if _stage_collector is not None:
+        return _CollectingTimer(pipeline, stage)
+    if not METRICS_ENABLED:
+        return nullcontext()
+    return _Timer(_stage_child(pipeline, stage))
+
+
+def start_stage_collection():
+    """
+    Makes stage_timer collect (pipeline, stage, seconds) tuples in this process instead of
+    observing them, until finish_stage_collection. Used by scoring pool workers, which hand the
+    timings back to the API process with their result.
+    """
+    global _stage_collector
+    _stage_collector = []
+
+
+def finish_stage_collection():
+    """Stops collecting stage timings and returns the ones collected"""
+    global _stage_collector
+    timings, _stage_collector = _stage_collector or [], None
+    return timings
+
+
+def observe_stage(pipeline: str, stage: str, seconds: float):
+    """Records a stage timing measured elsewhere, e.g. in a scoring pool worker"""
+    if METRICS_ENABLED:
+        _stage_child(pipeline, stage).observe(seconds)
+
+
+def observe_tmdb_request(outcome: str, seconds: float):
+    """Records one outbound TMDb request ('success', 'not_found', 'timeout' or 'error')"""
+    if METRICS_ENABLED:
+        TMDB_REQUESTS.labels(outcome).inc()
+        TMDB_REQUEST_LATENCY.observe(seconds)
+
+
+def observe_read_session(target: str):
+    """Records one session opened for a read-only path ('replica' or 'primary')"""
+    if METRICS_ENABLED:
+        DB_READ_SESSIONS.labels(target).inc()
+
+
+def observe_singleflight(group: str, outcome: str):
+    """Records one call through a singleflight.SingleFlight group ('executed' or 'coalesced')"""
+    if METRICS_ENABLED:
+        SINGLEFLIGHT_CALLS.labels(group, outcome).inc()
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording the latency of every HTTP request under its route template
+    (e.g. /recommendations), so path parameters don't create new series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # FastAPI puts the matched route in the scope while routing
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            REQUEST_LATENCY.labels(scope["method"], route_path, str(status)).observe(time.perf_counter() - start)
+
+
+def _sql_operation(statement: str) -> str:
+    keyword = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return keyword if keyword in _SQL_OPERATIONS else "OTHER"
+
+
+def instrument_engine(engine):
+    """Counts and times every SQL statement executed through the engine"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_metrics_start", None)
+        operation = _sql_operation(statement)
+        DB_QUERIES.labels(operation).inc()
+        if start is not None:
+            DB_QUERY_LATENCY.labels(operation).observe(time.perf_counter() - start)
+
+
+def asset_nbytes(value) -> int:
+    """Approximate memory held by a model asset (arrays, sparse matrices, DataFrames, indexes)"""
+    if hasattr(value, "memory_usage"):
+        # pandas; deep=True counts the Python strings in object columns
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum()) if hasattr(usage, "sum") else int(usage)
+    if all(hasattr(value, attr) for attr in ("data", "indices", "indptr")):
+        # scipy CSR/CSC matrix
+        return int(value.data.nbytes + value.indices.nbytes + value.indptr.nbytes)
+    if hasattr(value, "nbytes"):
+        return int(value.nbytes)
+    if isinstance(value, dict):
+        return sum(asset_nbytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(asset_nbytes(v) for v in value)
+    return sys.getsizeof(value)
+
+
+def record_model_asset_memory(loaded_assets):
+    """Sets the model_asset_bytes gauge for every loaded asset"""
+    if not METRICS_ENABLED:
+        return
+    for asset_key, value in loaded_assets.items():
+        if callable(value) or isinstance(value, str):
+            continue
+        try:
+            MODEL_ASSET_BYTES.labels(asset_key).set(asset_nbytes(value))
+        except Exception as e:
+            logger.warning(f"Could not measure memory of asset '{asset_key}': {str(e)}")
+
+
+def render_metrics():
+    """
+    Returns:
+        Tuple of (body bytes, content type) in the Prometheus text format.
+    """
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -1,15 +1,42 @@
 import os
-import joblib
+import hashlib
 import logging
-from huggingface_hub import hf_hub_download
+import time
+from . import catalog, cold_start, collaborative, filters, lazy, metrics, search, sharding
+
+# Only needed once the assets are loaded, not to import the app
+joblib = lazy.module("joblib")
+
+# Only needed when the assets come from the Hub
+huggingface_hub = lazy.module("huggingface_hub")
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def load_model_assets():
+# Load the asset files from this local directory instead of the Hugging Face Hub
+# (e.g. synthetic assets for load tests, or an offline copy of the hub files)
+MODEL_ASSETS_DIR = os.getenv("MODEL_ASSETS_DIR")
+
+# Seconds spent on each step of the last load, e.g. "download:movies_df.pkl",
+# "load:movies_df.pkl" or "build:search_index" (reported by `startup-report`)
+LOAD_TIMINGS = {}
+
+def _local_asset_path(filename):
+    """Path of an asset file in MODEL_ASSETS_DIR, used in place of hf_hub_download"""
+    file_path = os.path.join(MODEL_ASSETS_DIR, filename)
+    if not os.path.isfile(file_path):
+        raise FileNotFoundError(f"{filename} not found in MODEL_ASSETS_DIR ({MODEL_ASSETS_DIR})")
+    return file_path
+
+def load_model_assets(build_indexes: bool = True):
     """
-    Downloads and loads all necessary model assets from the Hugging Face Hub.
+    Downloads and loads all necessary model assets from the Hugging Face Hub,
+    or from MODEL_ASSETS_DIR when it is set.
+    
+    Args:
+        build_indexes: Whether to also build the in-memory indexes derived from the
+            assets (search, ...). One-off commands that only need the raw files can skip this.
     """
     logger.info("=== Starting model assets loading process ===")
     
@@ -19,7 +46,9 @@ def load_model_assets():
     # Get the Hugging Face token from environment variable
     hf_token = os.getenv('HUGGINGFACE_TOKEN')
     
-    if not hf_token:
+    if MODEL_ASSETS_DIR:
+        logger.info(f"Loading model assets from local directory {MODEL_ASSETS_DIR}")
+    elif not hf_token:
         logger.warning("HUGGINGFACE_TOKEN not found in environment variables. Proceeding without authentication.")
         logger.warning("This may cause issues if the repository is private or if you hit rate limits.")
     else:
@@ -33,10 +62,12 @@ def load_model_assets():
         'indices_map.pkl'
     ]
     
-    logger.info(f"Repository: {REPO_ID}")
+    if not MODEL_ASSETS_DIR:
+        logger.info(f"Repository: {REPO_ID}")
     logger.info(f"Files to download: {len(files_to_download)} files")
     
     loaded_assets = {}
+    loaded_paths = []
     successful_downloads = 0
     failed_downloads = 0
     
@@ -44,18 +75,27 @@ def load_model_assets():
         logger.info(f"[{i}/{len(files_to_download)}] Downloading {filename}...")
         
         try:
-            # Download the file from the Hub with authentication
-            file_path = hf_hub_download(
-                repo_id=REPO_ID, 
-                filename=filename,
-                token=hf_token  # Add the token here
-            )
+            start = time.perf_counter()
+            if MODEL_ASSETS_DIR:
+                file_path = _local_asset_path(filename)
+            else:
+                # Download the file from the Hub with authentication
+                file_path = huggingface_hub.hf_hub_download(
+                    repo_id=REPO_ID, 
+                    filename=filename,
+                    token=hf_token  # Add the token here
+                )
             
+            LOAD_TIMINGS[f"download:{filename}"] = time.perf_counter() - start
             logger.info(f"✓ Successfully downloaded {filename} to {file_path}")
             
             # Load the downloaded file into memory
             asset_key = filename.replace('.pkl', '') # e.g., 'movies_df'
+            start = time.perf_counter()
             loaded_assets[asset_key] = joblib.load(file_path)
+            LOAD_TIMINGS[f"load:{filename}"] = time.perf_counter() - start
+            # Local files have no revision in their path, so their mtime stands in for it
+            loaded_paths.append(f"{file_path}@{os.path.getmtime(file_path)}" if MODEL_ASSETS_DIR else file_path)
             
             # Log the loaded asset info
             if hasattr(loaded_assets[asset_key], 'shape'):
@@ -86,11 +126,58 @@ def load_model_assets():
     else:
         logger.warning("⚠️  Some model assets failed to load. Check the logs above for details.")
     
-    # Add the recommendation function to the loaded assets
-    from .recommender import get_recommendations_v_final
-    loaded_assets['recommendation_function'] = get_recommendations_v_final
+    # Identify this set of assets. Hub paths include the snapshot revision, so the
+    # version changes whenever a new revision of any file is published (or a local file is replaced).
+    loaded_assets['model_version'] = hashlib.sha1("|".join(loaded_paths).encode()).hexdigest()[:12]
+    logger.info(f"Model version: {loaded_assets['model_version']}")
+    
+    if build_indexes:
+        build_derived_assets(loaded_assets)
     
     logger.info(f"Loaded assets: {list(loaded_assets.keys())}")
     logger.info("=== Model assets loading process completed ===")
     
-    return loaded_assets
\ No newline at end of file
+    return loaded_assets
+
+
+def build_derived_assets(loaded_assets):
+    """
+    Builds the in-memory indexes derived from the loaded assets and adds them to the dict.
+    A failure in one index is logged and doesn't prevent the others from being built.
+    """
+    movies_df = loaded_assets.get('movies_df')
+    if movies_df is None:
+        logger.warning("movies_df not loaded, skipping derived indexes")
+        return
+    
+    derived = [
+        ('movie_catalog', lambda: catalog.MovieCatalog(movies_df, loaded_assets.get('indices_map'))),
+        ('search_index', lambda: search.build_search_index(movies_df)),
+        ('filter_index', lambda: filters.FilterIndex(movies_df)),
+    ]
+    genre_matrix = loaded_assets.get('genre_tfidf_matrix')
+    if genre_matrix is not None:
+        derived.append(('genre_rankings', lambda: cold_start.build_genre_rankings(movies_df, genre_matrix)))
+    people_matrix = loaded_assets.get('people_tfidf_matrix')
+    if sharding.SCORING_SHARDS > 1 and people_matrix is not None and genre_matrix is not None:
+        derived.append(('scoring_shards', lambda: sharding.build_sharded_scorer(people_matrix, genre_matrix)))
+    if collaborative.latest_model_path() is not None:
+        # Resolved against the catalog, which is built first
+        derived.append(('cf_model', lambda: collaborative.load_latest_model(loaded_assets['movie_catalog'])))
+    
+    for asset_key, build in derived:
+        try:
+            start = time.perf_counter()
+            loaded_assets[asset_key] = build()
+            LOAD_TIMINGS[f"build:{asset_key}"] = time.perf_counter() - start
+            logger.info(f"✓ Built '{asset_key}' in {LOAD_TIMINGS[f'build:{asset_key}']:.2f}s")
+        except Exception as e:
+            logger.error(f"✗ Failed to build '{asset_key}': {str(e)}")
+    
+    # The serving path only reads the columnar catalog, so the DataFrame (mostly per-row
+    # Python objects) is released once everything derived from it is built
+    if loaded_assets.get('movie_catalog') is not None:
+        catalog_bytes = loaded_assets['movie_catalog'].nbytes
+        df_bytes = metrics.asset_nbytes(loaded_assets.pop('movies_df'))
+        logger.info(f"Released movies_df ({df_bytes / 1e6:.1f} MB) in favour of the movie catalog "
+                    f"({catalog_bytes / 1e6:.1f} MB)")
@@ -1,5 +1,5 @@
 import uuid
-from sqlalchemy import Column, Integer, String, Boolean, TIMESTAMP, ForeignKey, text
+from sqlalchemy import Column, Integer, String, Boolean, TIMESTAMP, ForeignKey, Index, text
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 
@@ -26,19 +26,57 @@ class Movie(Base):
     genres = Column(String, nullable=True)
     numVotes = Column(Integer, server_default='0', nullable=False)
 
+    # Supports the trending query (recent years, most votes first)
+    __table_args__ = (
+        Index("ix_movies_startYear_numVotes", "startYear", "numVotes"),
+    )
+
 # --- Interaction Table ---
+# Range-partitioned by month on created_at (see app/partitions.py), so the primary key
+# has to include created_at as well
 class Interaction(Base):
     __tablename__ = "interactions"
 
-    id = Column(Integer, primary_key=True, nullable=False)
+    id = Column(Integer, primary_key=True, autoincrement=True, nullable=False)
     # Define the foreign key relationship to the users table
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     # Define the foreign key relationship to the movies table
     movie_id = Column(Integer, ForeignKey("movies.id", ondelete="CASCADE"), nullable=False)
     interaction_type = Column(String, nullable=False) # e.g., 'like', 'dislike'
-    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
+    created_at = Column(TIMESTAMP(timezone=True), primary_key=True, nullable=False, server_default=text('now()'))
     
     # These 'relationship' attributes are for the ORM. They help SQLAlchemy understand
     # how to join these tables and access related objects in our Python code.
     user = relationship("User")
-    movie = relationship("Movie")
\ No newline at end of file
+    movie = relationship("Movie")
+
+    __table_args__ = (
+        # A user's likes, most recent first (rollup refills, training reads)
+        Index("ix_interactions_user_id_interaction_type_created_at", "user_id", "interaction_type", "created_at"),
+        # The existing interaction for a user/movie pair, looked up on every write
+        Index("ix_interactions_user_id_movie_id", "user_id", "movie_id"),
+        # Incremental exports since a watermark (see app/export.py)
+        Index("ix_interactions_created_at", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+# --- Recent Likes Rollup ---
+# Most recent likes kept per user. Must match the trigger created in migration 8e4a1c7b3f52.
+RECENT_LIKES_PER_USER = 50
+
+class UserRecentLike(Base):
+    """
+    Each user's RECENT_LIKES_PER_USER most recent likes, maintained by a trigger on interactions.
+    Building a taste profile reads a few rows here instead of every partition of interactions.
+    """
+    __tablename__ = "user_recent_likes"
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True, nullable=False)
+    movie_id = Column(Integer, ForeignKey("movies.id", ondelete="CASCADE"), primary_key=True, nullable=False)
+    liked_at = Column(TIMESTAMP(timezone=True), nullable=False)
+
+    movie = relationship("Movie")
+
+    __table_args__ = (
+        Index("ix_user_recent_likes_user_id_liked_at", "user_id", "liked_at"),
+    )
\ No newline at end of file
@@ -0,0 +1,226 @@
+# Interactions partition management
+# interactions is range-partitioned on created_at, one partition per calendar month (UTC),
+# named interactions_yYYYYmMM, plus interactions_default for rows outside every partition.
+# This module creates partitions ahead of time, detaches or archives the ones past the
+# retention period, and rebuilds the user_recent_likes rollup. Run through the `partitions`
+# command, e.g. daily from cron; the migration creates the first few months ahead.
+import gzip
+import logging
+import os
+import re
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+# Monthly partitions kept ready ahead of the current month
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+# Months of interactions kept attached; older partitions are archived (0 keeps everything)
+PARTITION_RETENTION_MONTHS = int(os.getenv("PARTITION_RETENTION_MONTHS", "0"))
+# Where archived partitions are written, as gzipped CSV
+PARTITION_ARCHIVE_DIR = os.getenv("PARTITION_ARCHIVE_DIR", "interaction_archives")
+
+DEFAULT_PARTITION = "interactions_default"
+_NAME_PATTERN = re.compile(r"^interactions_y(\d{4})m(\d{2})$")
+
+
+# --- Months and names ---
+
+def month_start(moment: datetime) -> datetime:
+    """First instant (UTC) of the month containing `moment`"""
+    moment = moment.astimezone(timezone.utc) if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(month: datetime, n: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + n
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(month: datetime) -> str:
+    return f"interactions_y{month.year:04d}m{month.month:02d}"
+
+
+def partition_month(name: str):
+    """Month covered by a partition, from its name, or None for the default partition"""
+    match = _NAME_PATTERN.match(name)
+    if match is None:
+        return None
+    return datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=timezone.utc)
+
+
+def _bounds(month: datetime):
+    """FROM and TO literals of a month's partition"""
+    return f"'{month.isoformat()}'", f"'{add_months(month, 1).isoformat()}'"
+
+
+# --- Inspection ---
+
+def list_partitions(db: Session):
+    """
+    The partitions attached to interactions, oldest first.
+
+    Returns:
+        List of dicts with the partition name, its month (None for the default partition),
+        the planner's row estimate and its size on disk including indexes.
+    """
+    rows = db.execute(text("""
+        SELECT c.relname, c.reltuples::bigint, pg_total_relation_size(c.oid)
+        FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'interactions'::regclass
+        ORDER BY c.relname
+    """)).all()
+    return [
+        {"name": name, "month": partition_month(name), "estimated_rows": max(int(estimated_rows), 0),
+         "bytes": int(size)}
+        for name, estimated_rows, size in rows
+    ]
+
+
+def skip_rollup(db: Session):
+    """Turns the user_recent_likes trigger off until the end of the current transaction"""
+    db.execute(text("SET LOCAL interactions.skip_rollup = 'on'"))
+
+
+# --- Creating partitions ---
+
+def create_partition(db: Session, month: datetime):
+    """
+    Creates the partition for a month. Rows of that month that already landed in the default
+    partition are moved into it; the rollup is unaffected since the rows themselves don't change.
+
+    Returns:
+        Number of rows moved out of the default partition.
+    """
+    name = partition_name(month)
+    start, end = _bounds(month)
+    moved = db.execute(text(f"SELECT count(*) FROM {DEFAULT_PARTITION} "
+                            f"WHERE created_at >= {start} AND created_at < {end}")).scalar()
+    if not moved:
+        db.execute(text(f"CREATE TABLE {name} PARTITION OF interactions FOR VALUES FROM ({start}) TO ({end})"))
+        db.commit()
+        return 0
+
+    # A partition can't be created while the default partition holds rows in its range, so the
+    # rows go into a standalone table first, which is then attached
+    skip_rollup(db)
+    db.execute(text(f"CREATE TABLE {name} (LIKE interactions INCLUDING DEFAULTS)"))
+    db.execute(text(f"""
+        WITH moved AS (
+            DELETE FROM {DEFAULT_PARTITION} WHERE created_at >= {start} AND created_at < {end} RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved
+    """))
+    db.execute(text(f"ALTER TABLE interactions ATTACH PARTITION {name} FOR VALUES FROM ({start}) TO ({end})"))
+    db.commit()
+    logger.warning(f"Moved {moved} rows from {DEFAULT_PARTITION} into the new partition {name}")
+    return moved
+
+
+def ensure_partitions(db: Session, months_ahead: int = PARTITION_MONTHS_AHEAD, now: datetime = None):
+    """
+    Creates any missing partition from the current month to `months_ahead` months ahead.
+
+    Returns:
+        Names of the partitions created.
+    """
+    existing = {p["name"] for p in list_partitions(db)}
+    current = month_start(now or datetime.now(timezone.utc))
+    created = []
+    for n in range(months_ahead + 1):
+        month = add_months(current, n)
+        if partition_name(month) not in existing:
+            create_partition(db, month)
+            created.append(partition_name(month))
+            logger.info(f"Created partition {partition_name(month)}")
+    return created
+
+
+# --- Retiring partitions ---
+
+def expired_partitions(db: Session, retention_months: int = PARTITION_RETENTION_MONTHS, now: datetime = None):
+    """Names of the monthly partitions entirely older than the retention period"""
+    if retention_months <= 0:
+        return []
+    cutoff = add_months(month_start(now or datetime.now(timezone.utc)), -retention_months)
+    return [p["name"] for p in list_partitions(db) if p["month"] is not None and p["month"] < cutoff]
+
+
+def detach_partition(db: Session, name: str):
+    """
+    Detaches a monthly partition, keeping it as a standalone table. Its rows stop being visible
+    through interactions; likes already in user_recent_likes stay there until pushed out by newer ones.
+
+    Raises:
+        ValueError: If `name` isn't a monthly partition.
+    """
+    if partition_month(name) is None:
+        raise ValueError(f"{name} is not a monthly interactions partition")
+    db.execute(text(f"ALTER TABLE interactions DETACH PARTITION {name}"))
+    db.commit()
+    logger.info(f"Detached partition {name}")
+
+
+def archive_partition(db: Session, name: str, archive_dir: str = PARTITION_ARCHIVE_DIR):
+    """
+    Detaches a monthly partition (if still attached), writes its rows to
+    `archive_dir/<name>.csv.gz` and drops the table.
+
+    Returns:
+        Path of the archive.
+
+    Raises:
+        ValueError: If `name` isn't a monthly partition.
+    """
+    if partition_month(name) is None:
+        raise ValueError(f"{name} is not a monthly interactions partition")
+    if name in {p["name"] for p in list_partitions(db)}:
+        detach_partition(db, name)
+
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{name}.csv.gz")
+    tmp_path = f"{path}.tmp"
+    # COPY streams the table without holding it in memory; it needs the raw psycopg2 cursor
+    cursor = db.connection().connection.cursor()
+    try:
+        with gzip.open(tmp_path, "wt", newline="") as f:
+            cursor.copy_expert(f"COPY {name} TO STDOUT WITH (FORMAT csv, HEADER)", f)
+    finally:
+        cursor.close()
+    os.replace(tmp_path, path)
+
+    db.execute(text(f"DROP TABLE {name}"))
+    db.commit()
+    logger.info(f"Archived partition {name} to {path}")
+    return path
+
+
+# --- Rollup ---
+
+def rebuild_recent_likes(db: Session, user_ids=None):
+    """
+    Recomputes user_recent_likes from interactions, for every user or only `user_ids`.
+    Needed after writes made with skip_rollup, e.g. bulk loads.
+
+    Returns:
+        Number of rollup rows written.
+    """
+    user_filter = "AND user_id = ANY(CAST(:user_ids AS uuid[]))" if user_ids is not None else ""
+    params = {"user_ids": [str(user_id) for user_id in user_ids]} if user_ids is not None else {}
+    db.execute(text(f"DELETE FROM user_recent_likes WHERE true {user_filter}"), params)
+    written = db.execute(text(f"""
+        INSERT INTO user_recent_likes (user_id, movie_id, liked_at)
+        SELECT user_id, movie_id, liked_at FROM (
+            SELECT user_id, movie_id, max(created_at) AS liked_at,
+                   row_number() OVER (PARTITION BY user_id ORDER BY max(created_at) DESC, movie_id) AS recency
+            FROM interactions WHERE interaction_type = 'like' {user_filter}
+            GROUP BY user_id, movie_id
+        ) likes
+        WHERE recency <= {models.RECENT_LIKES_PER_USER}
+    """), params).rowcount
+    db.commit()
+    return written
@@ -0,0 +1,283 @@
+# Slow-request sampling profiler
+# Opt-in (PROFILING_ENABLED=true). While requests are in flight, a background thread samples
+# the stacks of the threads running route handlers every PROFILE_INTERVAL_MS into a ring buffer.
+# When a request finishes, the middleware keeps its samples if the request was picked by
+# PROFILE_SAMPLE_RATE or took longer than PROFILE_SLOW_THRESHOLD_MS, and writes them as a
+# collapsed-stack file (flamegraph.pl / speedscope / inferno input) to PROFILE_DIR.
+# Work done for a request in another process (the scoring pool) can't be sampled; the caller
+# reports its stage timings instead (record_worker_timings), and the capture shows them in
+# place of the samples spent waiting for it.
+import asyncio
+import contextvars
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+# Fraction of requests captured regardless of latency
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0.01"))
+# Requests slower than this are always captured; 0 disables latency-triggered captures
+PROFILE_SLOW_THRESHOLD_MS = float(os.getenv("PROFILE_SLOW_THRESHOLD_MS", "1000"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "10"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+# Oldest captures are deleted beyond this many files
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+# How far back the sample buffer reaches; requests longer than this are only partly captured
+PROFILE_BUFFER_SECONDS = float(os.getenv("PROFILE_BUFFER_SECONDS", "60"))
+
+CAPTURE_SUFFIX = ".collapsed"
+_CAPTURE_NAME = re.compile(r"^(\d{8}T\d{6}Z)_(sampled|slow)_(\d+)ms_(.+)_([0-9a-f]{8})\.collapsed$")
+_SLUG = re.compile(r"[^0-9A-Za-z]+")
+
+
+class StackSampler:
+    """
+    Samples the stacks of threads that are running a route handler.
+
+    Each sample is (time, thread id, endpoint code, endpoint frame id, code objects root-first
+    from the endpoint frame). The endpoint frame id tells apart concurrent calls of the same
+    route, since each call has its own frame while it runs.
+    """
+
+    def __init__(self, interval_seconds, buffer_seconds):
+        self.interval = interval_seconds
+        # Room for about four concurrently running handlers per tick over buffer_seconds
+        self.samples = deque(maxlen=max(1, int(buffer_seconds / interval_seconds)) * 4)
+        self.endpoint_codes = frozenset()
+        self._active = 0
+        self._active_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def request_started(self):
+        with self._active_lock:
+            self._active += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+                self._thread.start()
+            self._wakeup.set()
+
+    def request_finished(self):
+        with self._active_lock:
+            self._active -= 1
+            if self._active == 0:
+                self._wakeup.clear()
+
+    def _run(self):
+        own_ident = threading.get_ident()
+        while True:
+            # Idle (no overhead) while no request is in flight
+            self._wakeup.wait()
+            now = time.perf_counter()
+            endpoint_codes = self.endpoint_codes
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                codes = []
+                endpoint_index = endpoint_frame = None
+                while frame is not None:
+                    code = frame.f_code
+                    if code in endpoint_codes:
+                        endpoint_index, endpoint_frame = len(codes), id(frame)
+                    codes.append(code)
+                    frame = frame.f_back
+                if endpoint_frame is not None:
+                    # Keep the endpoint frame and everything it called, root first
+                    stack = tuple(reversed(codes[:endpoint_index + 1]))
+                    self.samples.append((now, ident, stack[0], endpoint_frame, stack))
+            time.sleep(self.interval)
+
+    def window(self, start, end, endpoint_code):
+        """
+        Stacks sampled between start and end for the call of the endpoint that best covers the
+        window (the one with the most samples in it).
+        """
+        calls = {}
+        for sampled_at, ident, code, endpoint_frame, stack in list(self.samples):
+            if start <= sampled_at <= end and code is endpoint_code:
+                calls.setdefault((ident, endpoint_frame), []).append(stack)
+        if not calls:
+            return []
+        return max(calls.values(), key=len)
+
+
+_sampler = None
+_labels = {}
+# (waiting code, [(label, seconds)]) reported for the current request by record_worker_timings.
+# The middleware sets a fresh list per request; the handler's thread shares it through the
+# context copied into the threadpool.
+_worker_timings = contextvars.ContextVar("profiling_worker_timings", default=None)
+
+
+def _frame_label(code):
+    label = _labels.get(code)
+    if label is None:
+        path = code.co_filename.replace("\\", "/").split("/")
+        label = _labels[code] = f"{code.co_name} ({'/'.join(path[-2:])}:{code.co_firstlineno})"
+    return label
+
+
+def collapse(stacks):
+    """Folds stacks into collapsed-stack lines ('root;child;leaf count'), most frequent first"""
+    counts = Counter(";".join(_frame_label(code) for code in stack) for stack in stacks)
+    return [f"{stack} {count}" for stack, count in counts.most_common()]
+
+
+def record_worker_timings(waiting_code, timings):
+    """
+    Reports work a worker process did for the current request, which the sampler can't see.
+    Does nothing unless the request is being profiled.
+
+    Args:
+        waiting_code: Code object of the function that waits for the worker; samples inside it
+            are replaced by the worker's timings in the capture.
+        timings: (label, seconds) pairs.
+    """
+    collected = _worker_timings.get()
+    if collected is not None:
+        collected.append((waiting_code, timings))
+
+
+def collapse_with_worker_timings(stacks, worker_timings, interval_seconds):
+    """
+    Like collapse, with the samples spent waiting for worker processes replaced by what the
+    workers spent that time on, as '[worker] <label>' frames under the waiting function.
+    """
+    waiting_codes = {code for code, _ in worker_timings}
+    kept = []
+    prefix = None
+    for stack in stacks:
+        cut = next((i for i, code in enumerate(stack) if code in waiting_codes), None)
+        if cut is None:
+            kept.append(stack)
+        elif prefix is None:
+            prefix = stack[:cut + 1]
+    # Fast calls may have no samples inside the waiting function; hang them off the endpoint
+    prefix_label = ";".join(_frame_label(code) for code in (prefix or stacks[0][:1]))
+
+    counts = Counter(";".join(_frame_label(code) for code in stack) for stack in kept)
+    for _, timings in worker_timings:
+        for label, seconds in timings:
+            counts[f"{prefix_label};[worker] {label}"] += max(1, round(seconds / interval_seconds))
+    return [f"{stack} {count}" for stack, count in counts.most_common()]
+
+
+def write_capture(lines, reason, duration_ms, method, route_path, profile_dir=PROFILE_DIR):
+    """
+    Writes a capture file and deletes the oldest ones beyond PROFILE_MAX_FILES.
+
+    Returns:
+        The file name of the capture.
+    """
+    os.makedirs(profile_dir, exist_ok=True)
+    timestamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    slug = _SLUG.sub("-", f"{method} {route_path}").strip("-")
+    name = f"{timestamp}_{reason}_{int(duration_ms)}ms_{slug}_{uuid.uuid4().hex[:8]}{CAPTURE_SUFFIX}"
+    with open(os.path.join(profile_dir, name), "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+    captures = sorted(
+        (entry for entry in os.scandir(profile_dir) if entry.name.endswith(CAPTURE_SUFFIX)),
+        key=lambda entry: entry.stat().st_mtime,
+    )
+    for entry in captures[:max(0, len(captures) - PROFILE_MAX_FILES)]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+    return name
+
+
+def list_captures(profile_dir=PROFILE_DIR, limit: int = 50):
+    """
+    Returns:
+        Metadata of the most recent captures, newest first.
+    """
+    if not os.path.isdir(profile_dir):
+        return []
+    captures = []
+    for entry in os.scandir(profile_dir):
+        match = _CAPTURE_NAME.match(entry.name)
+        if not match:
+            continue
+        captured_at, reason, duration_ms, route, _ = match.groups()
+        stat = entry.stat()
+        captures.append((stat.st_mtime, {
+            "name": entry.name,
+            "captured_at": datetime.strptime(captured_at, "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc),
+            "reason": reason,
+            "duration_ms": int(duration_ms),
+            "route": route,
+            "size_bytes": stat.st_size,
+        }))
+    captures.sort(key=lambda c: c[0], reverse=True)
+    return [capture for _, capture in captures[:limit]]
+
+
+def capture_path(name, profile_dir=PROFILE_DIR):
+    """Path of a capture file by name, or None if there is no such capture"""
+    if not _CAPTURE_NAME.match(name):
+        return None
+    path = os.path.join(profile_dir, name)
+    return path if os.path.isfile(path) else None
+
+
+class ProfilingMiddleware:
+    """ASGI middleware deciding which requests to capture; see the module comment"""
+
+    def __init__(self, app):
+        global _sampler
+        self.app = app
+        if _sampler is None:
+            _sampler = StackSampler(PROFILE_INTERVAL_MS / 1000.0, PROFILE_BUFFER_SECONDS)
+        self.sampler = _sampler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if not self.sampler.endpoint_codes:
+            self.sampler.endpoint_codes = frozenset(
+                route.endpoint.__code__ for route in scope["app"].routes
+                if hasattr(getattr(route, "endpoint", None), "__code__")
+            )
+
+        sampled = random.random() < PROFILE_SAMPLE_RATE
+        worker_timings = []
+        token = _worker_timings.set(worker_timings)
+        self.sampler.request_started()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            end = time.perf_counter()
+            self.sampler.request_finished()
+            _worker_timings.reset(token)
+            duration_ms = (end - start) * 1000
+            slow = PROFILE_SLOW_THRESHOLD_MS > 0 and duration_ms >= PROFILE_SLOW_THRESHOLD_MS
+            route = scope.get("route")
+            if (sampled or slow) and route is not None and hasattr(route.endpoint, "__code__"):
+                stacks = self.sampler.window(start, end, route.endpoint.__code__)
+                if stacks:
+                    reason = "slow" if slow else "sampled"
+                    try:
+                        # The response has been sent; write the file off the event loop
+                        lines = (collapse_with_worker_timings(stacks, worker_timings, self.sampler.interval)
+                                 if worker_timings else collapse(stacks))
+                        name = await asyncio.to_thread(
+                            write_capture, lines, reason, duration_ms, scope["method"], route.path
+                        )
+                        logger.info(f"Captured {len(stacks)} samples of {scope['method']} {route.path} "
+                                    f"({duration_ms:.0f} ms, {reason}) to {name}")
+                    except OSError as e:
+                        logger.warning(f"Could not write profile capture: {str(e)}")
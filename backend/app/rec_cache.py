@@ -0,0 +1,117 @@
+# Per-user cache of ranked recommendation candidates
+# The first /recommendations call ranks the whole candidate pool and stores the ranked row
+# positions here, so later pages are just slices that only need enriching.
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from . import cursors
+from .cursors import InvalidCursorError
+
+REC_CACHE_MAX_USERS = int(os.getenv("REC_CACHE_MAX_USERS", "10000"))
+REC_CACHE_TTL_SECONDS = float(os.getenv("REC_CACHE_TTL_SECONDS", "900"))
+# Distinct filter combinations kept per user
+REC_CACHE_MAX_VARIANTS = int(os.getenv("REC_CACHE_MAX_VARIANTS", "8"))
+
+# user_id -> (expires_at, model_version, profile_hash, {variant: positions}).
+# Ordered oldest use first (LRU). A variant is the filters.filter_key() of the request;
+# "" means unfiltered. profile_hash identifies the taste profile the rankings came from.
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def profile_hash(taste_profile, favorite_genres=None) -> str:
+    """A digest of everything about a user that their recommendations depend on"""
+    raw = "\n".join(taste_profile or []) + "\n#" + (favorite_genres or "")
+    return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+
+def get_ranked_positions(user_id, model_version, variant=""):
+    """
+    Get the cached ranked candidate positions for a user.
+
+    Returns:
+        Tuple of (profile_hash, positions array), or None if nothing is cached for this
+        user, model version and variant.
+    """
+    key = str(user_id)
+    with _lock:
+        entry = _cache.get(key)
+        if entry is None:
+            return None
+        expires_at, cached_version, cached_profile_hash, variants = entry
+        if expires_at < time.monotonic() or cached_version != model_version:
+            del _cache[key]
+            return None
+        _cache.move_to_end(key)
+        positions = variants.get(variant)
+        return None if positions is None else (cached_profile_hash, positions)
+
+
+def put_ranked_positions(user_id, model_version, profile_hash, positions, variant=""):
+    """Store a user's ranked candidate positions, evicting the least recently used users"""
+    if REC_CACHE_MAX_USERS <= 0:
+        return
+    key = str(user_id)
+    with _lock:
+        entry = _cache.get(key)
+        if (entry is None or entry[0] < time.monotonic() or entry[1] != model_version
+                or entry[2] != profile_hash):
+            entry = (time.monotonic() + REC_CACHE_TTL_SECONDS, model_version, profile_hash, {})
+            _cache[key] = entry
+        variants = entry[3]
+        variants.pop(variant, None)
+        variants[variant] = positions
+        while len(variants) > REC_CACHE_MAX_VARIANTS:
+            variants.pop(next(iter(variants)))
+        _cache.move_to_end(key)
+        while len(_cache) > REC_CACHE_MAX_USERS:
+            _cache.popitem(last=False)
+
+
+def invalidate(user_id):
+    """Drop a user's cached rankings, e.g. after they like or dislike a movie"""
+    with _lock:
+        _cache.pop(str(user_id), None)
+
+
+def clear():
+    with _lock:
+        _cache.clear()
+
+
+# --- Cursors ---
+# A recommendations cursor records the model version the ranking came from, a digest of the
+# filters it was requested with and the offset of the next page. A cursor from another
+# model version is stale; one from other filters is invalid.
+
+def _variant_digest(variant):
+    return hashlib.sha1(variant.encode()).hexdigest()[:8]
+
+
+def encode_cursor(model_version: str, offset: int, variant: str = "") -> str:
+    return cursors.encode_cursor({"v": model_version, "o": int(offset), "f": _variant_digest(variant)})
+
+
+def decode_cursor(cursor: str, variant: str = ""):
+    """
+    Returns:
+        Tuple of (model_version, offset).
+
+    Raises:
+        InvalidCursorError: If the cursor is malformed or was issued for different filters.
+    """
+    payload = cursors.decode_cursor(cursor)
+    try:
+        offset = int(payload["o"])
+        model_version = payload["v"]
+        digest = payload["f"]
+    except (KeyError, TypeError, ValueError):
+        raise InvalidCursorError(f"Invalid cursor: {cursor!r}")
+    if offset < 0:
+        raise InvalidCursorError(f"Invalid cursor: {cursor!r}")
+    if digest != _variant_digest(variant):
+        raise InvalidCursorError("Cursor was issued for different filters")
+    return model_version, offset
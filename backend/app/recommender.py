@@ -1,13 +1,54 @@
-import pandas as pd
+import os
+import weakref
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
+import scipy.sparse as sp
 import logging
+from . import catalog, collaborative, metrics
 
 logger = logging.getLogger(__name__)
 
+# Number of candidates kept after content scoring, and re-ranked
+N_CANDIDATES = 500
+# Content score weights of the people and genre similarities
+W_PEOPLE = 0.75
+W_GENRE = 0.25
+# Number of top positions picked by the diversity (MMR) stage; the candidates after them
+# keep their relevance order
+MMR_DEPTH = int(os.getenv("MMR_DEPTH", "100"))
+# Columns returned to the API layer
+RECOMMENDATION_COLUMNS = ['tconst', 'primaryTitle', 'startYear', 'averageRating', 'genres']
+
+_EMPTY_RANKING = (np.array([], dtype=np.int64), np.array([], dtype=np.float64))
+
+# id(matrix) -> (weak reference to the matrix, its inverse row norms); see inverse_row_norms
+_inverse_norms = {}
+# (id(df), id(indices_map)) -> (weak references to both, their MovieCatalog); see legacy_catalog
+_legacy_catalogs = {}
+
+
+def weighted_rating(v, R, m, C):
+    """
+    IMDb-style weighted rating: the average rating R shrunk towards the catalog mean C
+    for titles with few votes v, where m is the vote count at which both count equally.
+    Works element-wise on arrays and Series.
+    """
+    return (v / (v + m) * R) + (m / (v + m) * C)
+
+
+def popularity_scores(df):
+    """Weighted rating of every movie in df, scaled so the best is 1.0"""
+    m = df['numVotes'].quantile(0.70)
+    C = df['averageRating'].mean()
+    scores = np.asarray(weighted_rating(df['numVotes'], df['averageRating'], m, C), dtype=np.float64)
+    best = np.nanmax(scores) if len(scores) else 0
+    return scores / best if best > 0 else scores
+
+
 def get_recommendations_v_final(liked_movies_profile, df, people_matrix, genre_matrix, indices_map):
     """
     Generate recommendations based on a profile of liked movies.
+    The MovieCatalog of df is built on the first call and reused (see legacy_catalog); the
+    API uses rank_candidates on the catalog built at load time instead.
     
     Args:
         liked_movies_profile: List of movie titles in 'Title (Year)' format
@@ -19,93 +60,352 @@ def get_recommendations_v_final(liked_movies_profile, df, people_matrix, genre_m
     Returns:
         DataFrame with recommended movies including tconst
     """
+    movie_catalog = legacy_catalog(df, indices_map)
+    positions, _ = rank_candidates(liked_movies_profile, movie_catalog, people_matrix, genre_matrix)
+
+    # Return with tconst included for TMDb enrichment
+    return df.iloc[positions[:20]][RECOMMENDATION_COLUMNS]
+
+
+def legacy_catalog(df, indices_map):
+    """
+    MovieCatalog of a movies_df and indices_map, built once per pair of objects and kept for
+    as long as both are alive, so callers of get_recommendations_v_final pay for the ranking
+    and not for encoding the catalog on every call.
+    """
+    key = (id(df), id(indices_map))
+    cached = _legacy_catalogs.get(key)
+    if cached is not None and cached[0]() is df and cached[1]() is indices_map:
+        return cached[2]
+
+    movie_catalog = catalog.MovieCatalog(df, indices_map)
+    drop = lambda _, key=key: _legacy_catalogs.pop(key, None)
+    _legacy_catalogs[key] = (weakref.ref(df, drop), weakref.ref(indices_map, drop), movie_catalog)
+    return movie_catalog
+
+
+def rank_candidates(liked_movies_profile, movie_catalog, people_matrix, genre_matrix, n_candidates=N_CANDIDATES,
+                    candidate_mask=None, shards=None, cf_model=None, mmr_lambda=None):
+    """
+    Rank the full candidate pool for a profile of liked movies.
+    
+    Args:
+        liked_movies_profile: List of movie titles in 'Title (Year)' format
+        movie_catalog: catalog.MovieCatalog with the 'Title (Year)' keys resolved
+        people_matrix: People TF-IDF matrix
+        genre_matrix: Genre TF-IDF matrix
+        n_candidates: Number of candidates kept after content scoring
+        candidate_mask: Optional boolean array over catalog rows; only rows where it is True
+            can be recommended (see filters.FilterIndex)
+        shards: Optional sharding.ShardedScorer over the same matrices; similarity and
+            candidate selection then run per shard in parallel
+        cf_model: Optional collaborative.CFModel; its scores for the candidates are blended
+            into their content scores (hybrid ranking)
+        mmr_lambda: Optional trade-off between relevance and diversity in [0, 1]; when set,
+            the top of the ranking is re-ordered with maximal marginal relevance
+            (see diversify_candidates)
+    
+    Returns:
+        Tuple of (positions, final_scores) arrays, best first. Positions are row
+        positions in the catalog (and movies_df). Both arrays are empty if nothing could be recommended.
+    """
     if not liked_movies_profile:
         logger.warning("Empty liked movies profile provided")
-        return pd.DataFrame()
+        return _EMPTY_RANKING
     
-    # Find valid movies in the dataset
-    valid_indices = []
-    valid_movies = []
+    with metrics.stage_timer("recommendation", "lookup"):
+        valid_indices = lookup_profile(liked_movies_profile, movie_catalog)
+    if not valid_indices:
+        logger.error("No valid movies found in dataset from user's profile")
+        return _EMPTY_RANKING
+    
+    logger.info(f"Using {len(valid_indices)} movies from user's profile for recommendations")
     
+    with metrics.stage_timer("recommendation", "aggregation"):
+        avg_people_vector, avg_genre_vector = aggregate_profile(valid_indices, people_matrix, genre_matrix)
+    if shards is not None:
+        with metrics.stage_timer("recommendation", "sharded_similarity"):
+            movie_indices, content_scores = shards.top_candidates(avg_people_vector, avg_genre_vector,
+                                                                  valid_indices, n_candidates, candidate_mask)
+    else:
+        with metrics.stage_timer("recommendation", "similarity"):
+            combined_content_scores = content_similarity(avg_people_vector, avg_genre_vector, people_matrix,
+                                                         genre_matrix)
+        with metrics.stage_timer("recommendation", "candidate_selection"):
+            movie_indices, content_scores = select_candidates(combined_content_scores, valid_indices, n_candidates,
+                                                              candidate_mask)
+    if len(movie_indices) == 0:
+        logger.warning("No candidate movies left after filtering")
+        return _EMPTY_RANKING
+
+    cf_scores = None
+    if cf_model is not None:
+        with metrics.stage_timer("recommendation", "collaborative"):
+            user_vector = cf_model.fold_in(valid_indices)
+            if user_vector is not None:
+                cf_scores = cf_model.scores(movie_indices, user_vector)
+
+    with metrics.stage_timer("recommendation", "rerank"):
+        positions, final_scores = rerank_candidates(movie_catalog, movie_indices, content_scores, cf_scores,
+                                                    collaborative.CF_HYBRID_WEIGHT)
+
+    if mmr_lambda is not None:
+        with metrics.stage_timer("recommendation", "diversify"):
+            positions, final_scores = diversify_candidates(positions, final_scores, people_matrix, genre_matrix,
+                                                           mmr_lambda)
+    return positions, final_scores
+
+
+# --- Pipeline stages ---
+# rank_candidates runs these in order. They are separate functions so each stage can be
+# timed on its own (see benchmarks/bench_pipeline.py).
+
+def lookup_profile(liked_movies_profile, movie_catalog):
+    """
+    Resolves 'Title (Year)' keys to catalog row positions, skipping titles not in the dataset.
+
+    Returns:
+        List of row positions.
+    """
+    valid_indices = []
     for title_year in liked_movies_profile:
         try:
-            label_idx = indices_map[title_year]
-            position_idx = df.index.get_loc(label_idx)
-            valid_indices.append(position_idx)
-            valid_movies.append(title_year)
+            valid_indices.append(movie_catalog.position_of(title_year))
         except KeyError:
             logger.warning(f"Movie '{title_year}' not found in dataset, skipping")
             continue
-    
-    if not valid_indices:
-        logger.error("No valid movies found in dataset from user's profile")
-        return pd.DataFrame()
-    
-    logger.info(f"Using {len(valid_indices)} movies from user's profile for recommendations")
-    
-    # --- Aggregate Content Features ---
-    # Average the feature vectors of all liked movies
+    return valid_indices
+
+
+def aggregate_profile(valid_indices, people_matrix, genre_matrix):
+    """
+    Averages the feature vectors of all liked movies into one profile vector per matrix.
+
+    Returns:
+        Tuple of (avg_people_vector, avg_genre_vector) as 1 x n_features numpy arrays.
+    """
     people_vectors = people_matrix[valid_indices]
     genre_vectors = genre_matrix[valid_indices]
     
     # Create aggregate profile by averaging, and ensure it's a standard numpy array
     avg_people_vector = np.asarray(np.mean(people_vectors, axis=0))
     avg_genre_vector = np.asarray(np.mean(genre_vectors, axis=0))
-    
-    # --- Content Score Calculation ---
-    people_sim_scores = cosine_similarity(avg_people_vector, people_matrix)[0]
-    genre_sim_scores = cosine_similarity(avg_genre_vector, genre_matrix)[0]
-    
-    w_people = 0.75 
-    w_genre = 0.25
-    combined_content_scores = (w_people * people_sim_scores) + (w_genre * genre_sim_scores)
+    return avg_people_vector, avg_genre_vector
 
-    # Create similarity scores and exclude the movies the user already liked
-    sim_scores = list(enumerate(combined_content_scores))
-    
-    # Filter out movies the user has already liked
-    filtered_sim_scores = [(i, score) for i, score in sim_scores if i not in valid_indices]
-    filtered_sim_scores = sorted(filtered_sim_scores, key=lambda x: x[1], reverse=True)[:500]
-    
-    # Extract indices and scores
-    movie_indices = [i[0] for i in filtered_sim_scores]
-    content_scores_list = [i[1] for i in filtered_sim_scores]
 
-    # Build the recommendations DataFrame
-    recs_df = df.iloc[movie_indices].copy()
-    recs_df['content_score'] = content_scores_list
+def inverse_row_norms(matrix):
+    """
+    1 / L2 norm of each row, 0 for all-zero rows (whose cosine similarity is 0).
+    The feature matrices are read-only, so this is computed once per matrix object and
+    kept for as long as the matrix is alive.
+    """
+    key = id(matrix)
+    cached = _inverse_norms.get(key)
+    if cached is not None and cached[0]() is matrix:
+        return cached[1]
+
+    if sp.issparse(matrix):
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    else:
+        norms = np.linalg.norm(np.asarray(matrix), axis=1)
+    inverse = np.zeros_like(norms, dtype=np.float64)
+    np.divide(1.0, norms, out=inverse, where=norms > 0)
+    _inverse_norms[key] = (weakref.ref(matrix, lambda _, key=key: _inverse_norms.pop(key, None)), inverse)
+    return inverse
+
+
+def cosine_scores(profile_vector, matrix):
+    """Cosine similarity of a 1 x n_features profile vector to every row of the matrix"""
+    vector = np.asarray(profile_vector, dtype=np.float64).ravel()
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        return np.zeros(matrix.shape[0])
+    scores = np.asarray(matrix @ (vector / norm), dtype=np.float64).ravel()
+    scores *= inverse_row_norms(matrix)
+    return scores
+
+
+def content_similarity(avg_people_vector, avg_genre_vector, people_matrix, genre_matrix):
+    """
+    Content score of every movie: weighted cosine similarity to the profile vectors.
+
+    Returns:
+        Array of scores, one per df row.
+    """
+    people_sim_scores = cosine_scores(avg_people_vector, people_matrix)
+    genre_sim_scores = cosine_scores(avg_genre_vector, genre_matrix)
     
+    return (W_PEOPLE * people_sim_scores) + (W_GENRE * genre_sim_scores)
+
+
+def top_k(scores, k):
+    """
+    Positions of the k highest scores, best first. Ties are broken by position, including at
+    the k-th place, so the same scores always give the same selection (like a stable sort).
+    """
+    # Everything scoring at least the k-th best score (found without sorting the whole
+    # array), then the exact order of just those
+    kth_score = -np.partition(-scores, k - 1)[k - 1]
+    top = np.flatnonzero(scores >= kth_score)
+    return top[np.lexsort((top, -scores[top]))][:k]
+
+
+def select_candidates(content_scores, exclude_indices, n_candidates=N_CANDIDATES, candidate_mask=None):
+    """
+    Selects the n_candidates best-scoring movies.
+
+    Args:
+        content_scores: Score per df row.
+        exclude_indices: Row positions that can't be recommended (the liked movies).
+        n_candidates: Number of candidates to keep.
+        candidate_mask: Optional boolean array over df rows; rows where it is False are excluded.
+
+    Returns:
+        Tuple of (positions, content_scores) arrays, best first; empty if nothing is eligible.
+    """
+    # Exclude the movies the user already liked, and anything the filters rule out,
+    # before selecting candidates so filtered requests still get full pages
+    candidate_scores = np.asarray(content_scores, dtype=np.float64).copy()
+    candidate_scores[exclude_indices] = -np.inf
+    if candidate_mask is not None:
+        candidate_scores[~candidate_mask] = -np.inf
+
+    n_eligible = int(np.isfinite(candidate_scores).sum())
+    k = min(n_candidates, n_eligible)
+    if k == 0:
+        return _EMPTY_RANKING
+
+    # Top-k without sorting the whole catalog; ties keep catalog order
+    top = top_k(candidate_scores, k)
+    return top, candidate_scores[top]
+
+
+def rerank_candidates(movie_catalog, movie_indices, content_scores, cf_scores=None, cf_weight=0.0):
+    """
+    Re-ranks candidates by blending content score with popularity and recency.
+    Works on the candidates' catalog arrays only; nothing is copied beyond the candidates.
+    With cf_scores, the content score is first blended with the collaborative score,
+    cf_weight of the latter.
+
+    Returns:
+        Tuple of (positions, final_scores) arrays, best first.
+    """
+    movie_indices = np.asarray(movie_indices, dtype=np.int64)
+    content_scores = np.asarray(content_scores, dtype=np.float64)
+
     # --- Additional Scoring Logic ---
-    m = df['numVotes'].quantile(0.70)
-    C = df['averageRating'].mean()
-    
-    def weighted_rating(x, m=m, C=C):
-        v = x['numVotes']
-        R = x['averageRating']
-        return (v / (v + m) * R) + (m / (v + m) * C)
-    
-    recs_df['popularity_score'] = recs_df.apply(weighted_rating, axis=1)
+    m = movie_catalog.vote_quantile
+    C = movie_catalog.rating_mean
 
-    max_year = df['startYear'].max()
-    min_year = df['startYear'].min()
-    recs_df['recency_score'] = (recs_df['startYear'] - min_year) / (max_year - min_year)
+    # Missing vote counts stay NaN, so those movies get no popularity score and rank last
+    votes = movie_catalog.vote_counts(movie_indices)
+    ratings = movie_catalog.ratings(movie_indices)
+    popularity_scores = weighted_rating(votes, ratings, m, C)
+
+    max_year = movie_catalog.year_max
+    min_year = movie_catalog.year_min
+    recency_scores = (movie_catalog.years(movie_indices) - min_year) / (max_year - min_year)
     
-    # Normalize scores
-    if recs_df['content_score'].max() > 0:
-        recs_df['content_score'] = recs_df['content_score'] / recs_df['content_score'].max()
-    if recs_df['popularity_score'].max() > 0:
-        recs_df['popularity_score'] = recs_df['popularity_score'] / recs_df['popularity_score'].max()
+    # Normalize scores (ignoring movies without a rating, like pandas' max())
+    if content_scores.max() > 0:
+        content_scores = content_scores / content_scores.max()
+    if cf_scores is not None and cf_weight > 0:
+        # Min-max scaled over the candidates, so both parts span [0, 1]
+        cf_scores = np.asarray(cf_scores, dtype=np.float64)
+        spread = cf_scores.max() - cf_scores.min()
+        cf_scores = (cf_scores - cf_scores.min()) / spread if spread > 0 else np.zeros_like(cf_scores)
+        content_scores = (1 - cf_weight) * content_scores + cf_weight * cf_scores
+    max_popularity = np.nanmax(popularity_scores) if not np.isnan(popularity_scores).all() else np.nan
+    if max_popularity > 0:
+        popularity_scores = popularity_scores / max_popularity
     
     # Calculate final scores
     w_content = 0.60
     w_popularity = 0.25
     w_recency = 0.15
 
-    recs_df['final_score'] = (w_content * recs_df['content_score']) + \
-                             (w_popularity * recs_df['popularity_score']) + \
-                             (w_recency * recs_df['recency_score'])
+    final_scores = (w_content * content_scores) + \
+                   (w_popularity * popularity_scores) + \
+                   (w_recency * recency_scores)
     
-    final_recs = recs_df.sort_values('final_score', ascending=False).head(20)
+    # Best first; movies missing a rating, vote count or year have no final score and go last
+    order = np.argsort(-final_scores, kind='stable')
     
-    # Return with tconst included for TMDb enrichment
-    return final_recs[['tconst', 'primaryTitle', 'startYear', 'averageRating', 'genres']]
\ No newline at end of file
+    return movie_indices[order], final_scores[order]
+
+
+def _candidate_vectors(matrix, positions):
+    """
+    The candidates' rows of a feature matrix, L2-normalised, as CSR with the columns
+    renumbered to only those the rows use (so a dense buffer over them stays small).
+    """
+    rows = sp.csr_matrix(matrix[positions])
+    used_columns, local_columns = np.unique(rows.indices, return_inverse=True)
+    row_of_value = np.repeat(np.arange(rows.shape[0]), np.diff(rows.indptr))
+    norms = np.sqrt(np.bincount(row_of_value, weights=rows.data.astype(np.float64) ** 2, minlength=rows.shape[0]))
+    data = rows.data / norms[row_of_value]
+    return sp.csr_matrix((data, local_columns.astype(np.int32), rows.indptr), shape=(rows.shape[0], len(used_columns)))
+
+
+def _similarities_to_row(vectors, row, buffer):
+    """Cosine similarity of every candidate to candidate `row`; buffer is a zeroed dense row, left zeroed"""
+    start, end = vectors.indptr[row], vectors.indptr[row + 1]
+    columns = vectors.indices[start:end]
+    buffer[columns] = vectors.data[start:end]
+    similarities = vectors @ buffer
+    buffer[columns] = 0.0
+    return similarities
+
+
+def diversify_candidates(positions, final_scores, people_matrix, genre_matrix, mmr_lambda, depth=MMR_DEPTH):
+    """
+    Maximal marginal relevance: greedily picks the candidate with the best
+    mmr_lambda * relevance - (1 - mmr_lambda) * (max similarity to the candidates already picked),
+    so near-duplicates of earlier picks (same franchise, same director) move down.
+
+    Similarity is the weighted cosine of the content vectors, as in content_similarity. Each
+    pick costs one sparse matrix-vector product over the candidates, which updates a running
+    maximum; no all-pairs similarity matrix is built.
+
+    Args:
+        positions, final_scores: A ranking from rerank_candidates, best first.
+        mmr_lambda: 1 keeps the relevance order, 0 only looks at diversity.
+        depth: Number of top positions picked with MMR; the rest follow in relevance order.
+
+    Returns:
+        Tuple of (positions, final_scores) re-ordered; each movie keeps its own score.
+    """
+    positions = np.asarray(positions, dtype=np.int64)
+    final_scores = np.asarray(final_scores, dtype=np.float64)
+    # Candidates without a final score are already last and stay there
+    n_ranked = int(np.isfinite(final_scores).sum())
+    depth = min(depth, n_ranked)
+    if mmr_lambda >= 1 or depth < 2:
+        return positions, final_scores
+
+    pool = positions[:n_ranked]
+    relevance = final_scores[:n_ranked]
+    spread = relevance.max() - relevance.min()
+    relevance = (relevance - relevance.min()) / spread if spread > 0 else np.ones(n_ranked)
+
+    # Side by side and scaled by the square roots of the weights, so one dot product gives
+    # W_PEOPLE * people cosine + W_GENRE * genre cosine
+    vectors = sp.hstack([np.sqrt(W_PEOPLE) * _candidate_vectors(people_matrix, pool),
+                         np.sqrt(W_GENRE) * _candidate_vectors(genre_matrix, pool)], format='csr')
+    buffer = np.zeros(vectors.shape[1])
+
+    gain = mmr_lambda * relevance
+    penalty = 1.0 - mmr_lambda
+    max_similarity = np.zeros(n_ranked)
+    picked = np.empty(depth, dtype=np.int64)
+    for step in range(depth):
+        best = int(np.argmax(gain - penalty * max_similarity))
+        picked[step] = best
+        gain[best] = -np.inf
+        if step + 1 < depth:
+            np.maximum(max_similarity, _similarities_to_row(vectors, best, buffer), out=max_similarity)
+
+    rest = np.ones(len(positions), dtype=bool)
+    rest[picked] = False
+    order = np.concatenate([picked, np.flatnonzero(rest)])
+    return positions[order], final_scores[order]
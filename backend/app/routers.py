@@ -1,12 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import FileResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional
-from datetime import datetime
 import logging
-import pandas as pd
+import uuid
+import numpy as np
 from . import crud, schemas, database, models
 from fastapi.security import OAuth2PasswordRequestForm
-from . import auth, recommender, enricher, assets
+from . import auth, enricher, assets, trending, serialization, rec_cache, ingestion, cold_start, filters, http_cache, search, profiling, scoring_pool, singleflight
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +21,16 @@ movie_router = APIRouter(
     tags=["movies"] # Group these under "movies" in the API docs
 )
 
+# Operational endpoints, guarded by the ADMIN_TOKEN shared secret
+admin_router = APIRouter(
+    prefix="/admin",
+    tags=["admin"],
+    dependencies=[Depends(auth.require_admin_token)]
+)
+
+# Concurrent requests ranking the same profile (retries, several open tabs) share one ranking
+_ranking_flight = singleflight.SingleFlight("recommendations")
+
 
 
 @router.post("/register", response_model=schemas.UserResponse, status_code=201)
@@ -76,22 +87,68 @@ def read_users_me(current_user: models.User = Depends(auth.get_current_user)):
 # Movie-related routes 
 
 @movie_router.get("/onboarding/trending", response_model=List[schemas.MovieRecommendation])
-def get_trending_for_onboarding(db: Session = Depends(database.get_db)):
+def get_trending_for_onboarding(
+    request: Request,
+    limit: int = Query(trending.DEFAULT_PAGE_SIZE, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: Session = Depends(database.get_read_db)
+):
     """
     Returns a list of popular movies/shows from the last 3 years for the onboarding process.
+    Served from the precomputed, TMDb-enriched trending snapshot. Pass the value of the
+    X-Next-Cursor response header as `cursor` to get the next page.
     """
-    three_years_ago = datetime.now().year - 3
-    
-    trending_movies = db.query(models.Movie).filter(
-        models.Movie.startYear >= three_years_ago
-    ).order_by(
-        models.Movie.numVotes.desc() # We need to add numVotes to our model first!
-    ).limit(50).all()
+    try:
+        trending_movies, next_cursor, snapshot = trending.get_trending_page_with_snapshot(db, limit=limit, cursor=cursor)
+    except trending.InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Pages are versioned by the snapshot they come from. Pages read from the database have
+    # nothing to validate against, and a partly enriched snapshot is retried soon, so its
+    # pages aren't cached at all (like incomplete recommendation pages)
+    if snapshot is None:
+        headers = http_cache.caching_headers(cache_control=http_cache.UNVERSIONED_CACHE_CONTROL)
+    elif not snapshot["complete"]:
+        headers = http_cache.caching_headers(cache_control="no-store")
+    else:
+        etag = http_cache.make_etag(snapshot["version"], limit, cursor or "")
+        if http_cache.etag_matches(request, etag):
+            return http_cache.not_modified(etag, http_cache.TRENDING_CACHE_CONTROL)
+        headers = http_cache.caching_headers(etag, http_cache.TRENDING_CACHE_CONTROL)
+
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    return serialization.json_response(trending_movies, headers=headers)
+
+@movie_router.get("/movies/search", response_model=List[schemas.MovieRecommendation])
+def search_movies(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(10, ge=1, le=50)
+):
+    """
+    As-you-type title search for onboarding. Matches every word of `q` as a word prefix,
+    most popular titles first, backed by the in-memory search index.
+    """
+    model_assets = assets.get_model_assets()
+    search_index = model_assets.get('search_index')
+    movie_catalog = model_assets.get('movie_catalog')
+    if search_index is None or movie_catalog is None:
+        raise HTTPException(
+            status_code=500,
+            detail="Search index not loaded. Please check server logs."
+        )
 
-    # We use our MovieRecommendation schema, but poster_url and overview will be None
-    # The frontend can fetch these if needed, or we can enrich them here.
-    # For now, this is efficient.
-    return trending_movies
+    # Results only depend on the catalog and the normalized query
+    etag = http_cache.make_etag(assets.get_model_version(), search.normalize(q), limit)
+    if http_cache.etag_matches(request, etag):
+        return http_cache.not_modified(etag, http_cache.SEARCH_CACHE_CONTROL)
+
+    positions = search_index.search(q, limit=limit)
+    return serialization.json_response(
+        serialization.catalog_records(movie_catalog, positions),
+        headers=http_cache.caching_headers(etag, http_cache.SEARCH_CACHE_CONTROL)
+    )
 
 @router.post("/me/genres", response_model=schemas.UserResponse)
 def update_genres_for_user(
@@ -109,87 +166,241 @@ def update_genres_for_user(
 @movie_router.post("/interactions", status_code=201)
 def create_interaction(
     interaction: schemas.InteractionCreate,
+    # Writes check that the user still exists (served from the user cache), so a token of a
+    # deleted user gets a 401 rather than a failed write
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(database.get_db)
 ):
     """
     Protected endpoint to save a user's interaction (like/dislike) with a movie.
+    In queued ingestion mode the interaction is accepted (202) and written in the background.
+    Returns 404 for a movie that isn't in the database.
+    """
+    if ingestion.is_enabled() and ingestion.get_ingestor() is not None:
+        # Checked before enqueueing, as the worker could only drop the event without telling anyone
+        if not crud.movie_exists(db, interaction.tconst):
+            raise HTTPException(status_code=404, detail="Movie not found")
+        try:
+            ingestion.get_ingestor().submit(current_user.id, interaction.tconst, interaction.interaction_type)
+        except ingestion.QueueFullError:
+            raise HTTPException(
+                status_code=503,
+                detail="Too many interactions are being processed. Please retry shortly.",
+                headers={"Retry-After": "1"}
+            )
+        return serialization.json_response({"status": "queued", **interaction.model_dump()}, status_code=202)
+
+    db_interaction = crud.create_or_update_interaction(db=db, user_id=current_user.id, interaction=interaction)
+    if db_interaction is None:
+        raise HTTPException(status_code=404, detail="Movie not found")
+    return db_interaction
+
+
+def _cold_start_positions(user_id, favorite_genres, model_assets):
     """
-    return crud.create_or_update_interaction(db=db, user_id=current_user.id, interaction=interaction)
+    Ranked positions for a user with no usable likes, merged from the precomputed
+    per-genre lists of their favorite genres. Empty if they haven't picked any.
+    """
+    genre_rankings = model_assets.get('genre_rankings')
+    favorite_genres = cold_start.split_genres(favorite_genres)
+    if genre_rankings is None or not favorite_genres:
+        return np.array([], dtype=np.int64)
+
+    logger.info(f"Serving genre-based cold-start recommendations for user {user_id}")
+    return cold_start.recommend_for_genres(genre_rankings, favorite_genres)
 
 
 # --- Endpoint 4: The Main Recommendation Endpoint ---
 @movie_router.get("/recommendations", response_model=List[schemas.MovieRecommendation])
 def get_recommendations_for_user(
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    request: Request,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    genre: Optional[List[str]] = Query(None, description="Only movies with any of these genres"),
+    year_from: Optional[int] = Query(None, description="Only movies released in or after this year"),
+    year_to: Optional[int] = Query(None, description="Only movies released in or before this year"),
+    min_rating: Optional[float] = Query(None, ge=0, le=10, description="Only movies rated at least this"),
+    hybrid: bool = Query(False, description="Blend collaborative-filtering scores into the ranking"),
+    diversity: Optional[float] = Query(None, ge=0, le=1, description="Re-rank for variety with maximal marginal "
+                                       "relevance: 1 keeps the relevance order, lower values trade relevance for diversity"),
+    current_user_id: uuid.UUID = Depends(auth.get_current_user_id),
+    db: Session = Depends(auth.get_user_read_db)
 ):
     """
     Protected endpoint. Returns a personalized, enriched list of movie recommendations.
+    The full ranked candidate list is cached per user, so further pages are cheap:
+    pass the value of the X-Next-Cursor response header as `cursor` to get the next page.
+    Filters are applied before candidates are selected, so filtered pages are full pages.
+    With `hybrid`, the ranking also weighs in the collaborative-filtering model when one is loaded.
+    With `diversity`, near-duplicates (same franchise, same people) are spread out of the top of the ranking.
     """
-    # 1. Get user's taste profile
-    taste_profile = crud.get_user_liked_movies(db=db, user_id=current_user.id, limit=15)
-    
-    # 2. Handle insufficient data
-    if not taste_profile:
-        raise HTTPException(
-            status_code=404, 
-            detail="No liked movies found. Please like some movies first using the /interactions endpoint."
-        )
-    
-    # 3. Load model assets
     model_assets = assets.get_model_assets()
-    df = model_assets.get('movies_df')
-    people_matrix = model_assets.get('people_tfidf_matrix')
-    genre_matrix = model_assets.get('genre_tfidf_matrix')
-    indices_map = model_assets.get('indices_map')
-    
-    # Check if all required assets are loaded
-    if not all([df is not None, people_matrix is not None, genre_matrix is not None, indices_map is not None]):
-        raise HTTPException(
-            status_code=500,
-            detail="Model assets not properly loaded. Please check server logs."
-        )
-    
-    # 4. Generate recommendations using the recommendation engine
-    try:
-        recommendations_df = recommender.get_recommendations_v_final(
-            liked_movies_profile=taste_profile,
-            df=df,
-            people_matrix=people_matrix,
-            genre_matrix=genre_matrix,
-            indices_map=indices_map
-        )
+    model_version = assets.get_model_version()
+    filter_variant = filters.filter_key(genre, year_from, year_to, min_rating)
+    # Hybrid rankings are cached and paginated separately, per CF model version
+    cf_model = model_assets.get('cf_model') if hybrid else None
+    variant = f"{filter_variant};cf={cf_model.version}" if cf_model is not None else filter_variant
+    # So are diversified ones, per lambda
+    if diversity is not None:
+        variant = f"{variant};mmr={diversity:g}"
+
+    # 1. Resolve the page we're being asked for
+    offset = 0
+    if cursor:
+        try:
+            cursor_version, offset = rec_cache.decode_cursor(cursor, variant)
+        except rec_cache.InvalidCursorError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if cursor_version != model_version:
+            raise HTTPException(
+                status_code=409,
+                detail="Cursor is stale: the recommendation model has changed. Request the first page again."
+            )
+
+    cached = rec_cache.get_ranked_positions(current_user_id, model_version, variant)
+
+    if cached is not None:
+        profile_hash, ranked_positions = cached
+        # 2. Answer conditional requests before any enrichment work
+        etag = http_cache.make_etag(model_version, profile_hash, variant, offset, limit)
+        if http_cache.etag_matches(request, etag):
+            return http_cache.not_modified(etag, http_cache.RECOMMENDATIONS_CACHE_CONTROL, "Authorization")
+    else:
+        # 2. Get user's taste profile
+        taste_profile = crud.get_user_liked_movies(db=db, user_id=current_user_id, limit=15)
+        user = auth.get_user_by_id(db, current_user_id)
+        favorite_genres = user.favorite_genres if user else None
+        profile_hash = rec_cache.profile_hash(taste_profile, favorite_genres)
+
+        # Answer conditional requests before any scoring work
+        etag = http_cache.make_etag(model_version, profile_hash, variant, offset, limit)
+        if http_cache.etag_matches(request, etag):
+            return http_cache.not_modified(etag, http_cache.RECOMMENDATIONS_CACHE_CONTROL, "Authorization")
+
+        ranked_positions = np.array([], dtype=np.int64)
+
+        candidate_mask = None
+        if filter_variant:
+            filter_index = model_assets.get('filter_index')
+            if filter_index is None:
+                raise HTTPException(
+                    status_code=500,
+                    detail="Filter index not loaded. Please check server logs."
+                )
+            candidate_mask = filter_index.candidate_mask(genre, year_from, year_to, min_rating)
         
-        if recommendations_df.empty:
-            # Fallback to trending movies if recommendation engine returns empty
-            logger.warning(f"Recommendation engine returned no results for user {current_user.id}, falling back to trending")
-            return get_trending_for_onboarding(db)
+        if taste_profile:
+            # 3. Load model assets
+            movie_catalog = model_assets.get('movie_catalog')
+            people_matrix = model_assets.get('people_tfidf_matrix')
+            genre_matrix = model_assets.get('genre_tfidf_matrix')
+            indices_map = model_assets.get('indices_map')
             
-    except Exception as e:
-        logger.error(f"Recommendation engine failed for user {current_user.id}: {str(e)}")
-        raise HTTPException(
-            status_code=500,
-            detail="Failed to generate recommendations. Please try again later."
-        )
+            # Check if all required assets are loaded
+            if not all([movie_catalog is not None, people_matrix is not None, genre_matrix is not None, indices_map is not None]):
+                raise HTTPException(
+                    status_code=500,
+                    detail="Model assets not properly loaded. Please check server logs."
+                )
+            
+            # 4. Rank the candidate pool using the recommendation engine
+            #    (in the scoring pool's worker processes when it is enabled)
+            #    Identical rankings already in flight are awaited instead of recomputed. The
+            #    ranking only depends on the profile, the model and the variant, so those are the key.
+            flight_key = (model_version, variant, profile_hash)
+            try:
+                ranked_positions, _ = _ranking_flight.do(flight_key, lambda: scoring_pool.rank_candidates(
+                    taste_profile, model_assets, candidate_mask=candidate_mask, hybrid=cf_model is not None,
+                    mmr_lambda=diversity
+                ))
+            except (scoring_pool.PoolSaturatedError, scoring_pool.ScoringTimeoutError) as e:
+                logger.warning(f"Shedding recommendation request for user {current_user_id}: {str(e)}")
+                raise HTTPException(
+                    status_code=503,
+                    detail="Too many recommendation requests are being processed. Please retry shortly.",
+                    headers={"Retry-After": "1"}
+                )
+            except Exception as e:
+                logger.error(f"Recommendation engine failed for user {current_user_id}: {str(e)}")
+                raise HTTPException(
+                    status_code=500,
+                    detail="Failed to generate recommendations. Please try again later."
+                )
+
+        if len(ranked_positions) == 0:
+            # 5. Cold start: use the favorite genres picked during onboarding
+            ranked_positions = _cold_start_positions(current_user_id, favorite_genres, model_assets)
+            if candidate_mask is not None:
+                ranked_positions = ranked_positions[candidate_mask[ranked_positions]]
+
+        if len(ranked_positions) == 0:
+            # Handle insufficient data
+            if not taste_profile:
+                raise HTTPException(
+                    status_code=404, 
+                    detail="No liked movies found. Please like some movies first using the /interactions endpoint."
+                )
+            if filter_variant:
+                # Nothing matches the filters; trending wouldn't match them either
+                return serialization.json_response([])
+            # Fallback to trending movies if recommendation engine returns empty
+            logger.warning(f"Recommendation engine returned no results for user {current_user_id}, falling back to trending")
+            trending_movies, _ = trending.get_trending_page(db, limit=limit)
+            return serialization.json_response(trending_movies)
+
+        rec_cache.put_ranked_positions(current_user_id, model_version, profile_hash, ranked_positions, variant)
+
+    # 6. Slice out the requested page
+    page_positions = ranked_positions[offset:offset + limit]
+    movie_catalog = model_assets['movie_catalog']
+
+    headers = http_cache.caching_headers(etag, http_cache.RECOMMENDATIONS_CACHE_CONTROL, "Authorization")
+    # A page missing TMDb data mustn't be revalidated with the ETag of the complete page
+    degraded_headers = http_cache.caching_headers(None, "no-store", "Authorization")
+    if offset + limit < len(ranked_positions):
+        headers["X-Next-Cursor"] = degraded_headers["X-Next-Cursor"] = \
+            rec_cache.encode_cursor(model_version, offset + limit, variant)
     
-    # 5. Enrich with TMDb data
+    # 7. Enrich the new page with TMDb data
     try:
-        enriched_recommendations = enricher.enrich_recommendations(recommendations_df)
-        return enriched_recommendations
+        enriched_recommendations, complete = enricher.enrich_recommendations_with_status(movie_catalog, page_positions)
+        return serialization.json_response(enriched_recommendations, headers=headers if complete else degraded_headers)
         
     except Exception as e:
-        logger.error(f"TMDb enrichment failed for user {current_user.id}: {str(e)}")
+        logger.error(f"TMDb enrichment failed for user {current_user_id}: {str(e)}")
         # Return basic recommendations without enrichment as fallback
-        basic_recommendations = []
-        for _, row in recommendations_df.iterrows():
-            basic_recommendations.append({
-                "tconst": row['tconst'],
-                "primaryTitle": row['primaryTitle'],
-                "startYear": int(row['startYear']) if pd.notna(row['startYear']) else None,
-                "genres": row['genres'],
-                "averageRating": float(row['averageRating']) if pd.notna(row['averageRating']) else None,
-                "poster_url": None,
-                "overview": None
-            })
-        return basic_recommendations
\ No newline at end of file
+        return serialization.json_response(serialization.catalog_records(movie_catalog, page_positions),
+                                           headers=degraded_headers)
+
+
+# --- Admin: request coalescing ---
+@admin_router.get("/singleflight")
+def get_singleflight_stats():
+    """
+    Per-group counts of computations executed and of duplicate calls that waited for one
+    already in flight instead (this worker process only; /metrics aggregates all of them).
+    """
+    return {
+        "enabled": singleflight.SINGLEFLIGHT_ENABLED,
+        "groups": singleflight.get_stats()
+    }
+
+# --- Admin: slow-request profiles ---
+@admin_router.get("/profiles")
+def list_profiles(limit: int = Query(50, ge=1, le=500)):
+    """
+    Lists the most recent profiler captures, newest first.
+    Captures are written when PROFILING_ENABLED is set; see app/profiling.py.
+    """
+    return {
+        "enabled": profiling.PROFILING_ENABLED,
+        "captures": profiling.list_captures(limit=limit)
+    }
+
+@admin_router.get("/profiles/{name}")
+def get_profile(name: str):
+    """Downloads a capture in collapsed-stack format (open it with speedscope or flamegraph.pl)"""
+    path = profiling.capture_path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain", filename=name)
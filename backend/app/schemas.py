@@ -48,6 +48,7 @@ class MovieRecommendation(BaseModel):
     primaryTitle: str
     startYear: int
     genres: Optional[str] = None # Make genres optional in case some movies don't have them
+    averageRating: Optional[float] = None
     poster_url: Optional[str] = None # This will come from TMDb
     overview: Optional[str] = None   # This will come from TMDb
     
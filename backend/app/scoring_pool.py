@@ -0,0 +1,228 @@
+# Process pool for CPU-bound recommendation scoring
+# The pandas/NumPy scoring pipeline holds the GIL for most of a request, so running it in
+# FastAPI's shared threadpool stalls every other route during a burst of /recommendations.
+# With SCORING_POOL_WORKERS > 0, rank_candidates runs in dedicated worker processes instead.
+# The scoring assets are written once to a joblib file that every worker memory-maps, so the
+# arrays are loaded once and shared through the page cache rather than copied per worker.
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import numpy as np
+
+from . import lazy, metrics, profiling, recommender
+
+# Only needed once the pool starts
+joblib = lazy.module("joblib")
+
+logger = logging.getLogger(__name__)
+
+# 0 scores in the request thread, as before
+SCORING_POOL_WORKERS = int(os.getenv("SCORING_POOL_WORKERS", "0"))
+# Scoring requests allowed to wait or run at once; more are rejected with 503
+SCORING_POOL_MAX_PENDING = int(os.getenv("SCORING_POOL_MAX_PENDING", str(max(1, SCORING_POOL_WORKERS) * 4)))
+SCORING_TIMEOUT_SECONDS = float(os.getenv("SCORING_TIMEOUT_SECONDS", "10"))
+SCORING_POOL_START_METHOD = os.getenv("SCORING_POOL_START_METHOD", "spawn")
+
+
+class PoolSaturatedError(Exception):
+    """Raised when too many scoring requests are already waiting"""
+
+
+class ScoringTimeoutError(Exception):
+    """Raised when a scoring request doesn't finish within SCORING_TIMEOUT_SECONDS"""
+
+
+# --- Worker process side ---
+
+_worker_assets = None
+
+
+def _init_worker(asset_path):
+    global _worker_assets
+    _worker_assets = joblib.load(asset_path, mmap_mode='r')
+
+
+def _ping():
+    return os.getpid()
+
+
+def _score(liked_movies_profile, packed_mask, n_movies, hybrid, mmr_lambda, submitted_at):
+    started_at = time.time()
+    candidate_mask = None
+    if packed_mask is not None:
+        candidate_mask = np.unpackbits(packed_mask, count=n_movies).astype(bool)
+    # The stage timings go back to the API process, which records them
+    metrics.start_stage_collection()
+    try:
+        ranking = recommender.rank_candidates(
+            liked_movies_profile=liked_movies_profile,
+            movie_catalog=_worker_assets['movie_catalog'],
+            people_matrix=_worker_assets['people_tfidf_matrix'],
+            genre_matrix=_worker_assets['genre_tfidf_matrix'],
+            candidate_mask=candidate_mask,
+            cf_model=_worker_assets.get('cf_model') if hybrid else None,
+            mmr_lambda=mmr_lambda
+        )
+    finally:
+        stage_timings = metrics.finish_stage_collection()
+    return ranking, started_at - submitted_at, time.time() - started_at, stage_timings
+
+
+# --- API process side ---
+
+class ScoringPool:
+    """
+    A process pool running recommender.rank_candidates, with a bound on pending requests.
+
+    Args:
+        model_assets: Loaded model assets; the scoring ones are written to asset_dir.
+        workers: Number of worker processes.
+        max_pending: Requests allowed to wait or run at once before rejecting new ones.
+        asset_dir: Directory for the shared asset file (a temporary one by default).
+    """
+
+    def __init__(self, model_assets, workers, max_pending, asset_dir=None, start_method=SCORING_POOL_START_METHOD):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.n_movies = len(model_assets['movie_catalog'])
+        self._pending = 0
+        self._lock = threading.Lock()
+
+        self._asset_dir = asset_dir or tempfile.mkdtemp(prefix="scoring-assets-")
+        asset_path = os.path.join(self._asset_dir, "scoring_assets.joblib")
+        # The catalog's columns are plain arrays, so workers memory-map them too
+        joblib.dump({
+            'movie_catalog': model_assets['movie_catalog'],
+            'people_tfidf_matrix': model_assets['people_tfidf_matrix'],
+            'genre_tfidf_matrix': model_assets['genre_tfidf_matrix'],
+            'cf_model': model_assets.get('cf_model'),
+        }, asset_path)
+
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context(start_method),
+            initializer=_init_worker,
+            initargs=(asset_path,)
+        )
+
+    def warm_up(self):
+        """Starts every worker and waits for it to load the assets"""
+        pids = {f.result() for f in [self._executor.submit(_ping) for _ in range(self.workers * 2)]}
+        logger.info(f"Scoring pool ready with {len(pids)} worker processes")
+
+    def rank_candidates(self, liked_movies_profile, candidate_mask=None, hybrid=False, mmr_lambda=None,
+                        timeout=SCORING_TIMEOUT_SECONDS):
+        """
+        Runs recommender.rank_candidates in a worker process.
+
+        Raises:
+            PoolSaturatedError: If max_pending requests are already waiting or running.
+            ScoringTimeoutError: If the result isn't ready within `timeout` seconds.
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                metrics.SCORING_REJECTED.inc()
+                raise PoolSaturatedError(f"{self._pending} scoring requests already pending")
+            self._pending += 1
+            metrics.SCORING_PENDING.set(self._pending)
+
+        def release(_=None):
+            with self._lock:
+                self._pending -= 1
+                metrics.SCORING_PENDING.set(self._pending)
+
+        try:
+            packed_mask = np.packbits(candidate_mask) if candidate_mask is not None else None
+            future = self._executor.submit(_score, list(liked_movies_profile), packed_mask, self.n_movies, hybrid,
+                                           mmr_lambda, time.time())
+        except BaseException:
+            release()
+            raise
+        # The slot is freed when the work is done, not when the caller gives up on it: a timed-out
+        # job keeps its worker busy, and admission control has to keep counting it
+        future.add_done_callback(release)
+
+        try:
+            ranking, queue_seconds, exec_seconds, stage_timings = future.result(timeout=timeout)
+        except FutureTimeoutError:
+            # Only stops a job that hasn't started yet
+            future.cancel()
+            raise ScoringTimeoutError(f"Scoring didn't finish within {timeout}s")
+        metrics.SCORING_QUEUE_WAIT.observe(max(0.0, queue_seconds))
+        metrics.SCORING_EXECUTION.observe(exec_seconds)
+        for pipeline, stage, seconds in stage_timings:
+            metrics.observe_stage(pipeline, stage, seconds)
+        profiling.record_worker_timings(
+            ScoringPool.rank_candidates.__code__,
+            [("queue wait", max(0.0, queue_seconds))]
+            + [(f"{pipeline}:{stage}", seconds) for pipeline, stage, seconds in stage_timings]
+        )
+        return ranking
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        shutil.rmtree(self._asset_dir, ignore_errors=True)
+
+
+_pool = None
+
+
+def start_pool(model_assets):
+    """Starts the scoring pool if SCORING_POOL_WORKERS > 0 and the scoring assets are loaded"""
+    global _pool
+    if SCORING_POOL_WORKERS <= 0 or _pool is not None:
+        return
+    required = ['movie_catalog', 'people_tfidf_matrix', 'genre_tfidf_matrix']
+    if any(model_assets.get(key) is None for key in required):
+        logger.warning("Scoring assets not loaded, scoring pool not started")
+        return
+    pool = ScoringPool(model_assets, SCORING_POOL_WORKERS, SCORING_POOL_MAX_PENDING)
+    try:
+        pool.warm_up()
+    except BaseException:
+        # Requests keep scoring in their own threads rather than going to a broken pool
+        pool.shutdown()
+        raise
+    _pool = pool
+
+
+def stop_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
+
+
+def get_pool():
+    return _pool
+
+
+def rank_candidates(liked_movies_profile, model_assets, candidate_mask=None, hybrid=False, mmr_lambda=None):
+    """
+    Ranks candidates in the scoring pool when it is running, otherwise in the calling thread
+    (sharded across cores if SCORING_SHARDS is set; the two are alternative ways to use more cores).
+    With `hybrid`, the loaded CF model's scores are blended in, and with `mmr_lambda` the top of
+    the ranking is diversified (see recommender.rank_candidates).
+
+    Raises:
+        PoolSaturatedError, ScoringTimeoutError: See ScoringPool.rank_candidates.
+    """
+    if _pool is not None:
+        return _pool.rank_candidates(liked_movies_profile, candidate_mask, hybrid, mmr_lambda)
+    return recommender.rank_candidates(
+        liked_movies_profile=liked_movies_profile,
+        movie_catalog=model_assets['movie_catalog'],
+        people_matrix=model_assets['people_tfidf_matrix'],
+        genre_matrix=model_assets['genre_tfidf_matrix'],
+        candidate_mask=candidate_mask,
+        shards=model_assets.get('scoring_shards'),
+        cf_model=model_assets.get('cf_model') if hybrid else None,
+        mmr_lambda=mmr_lambda
+    )
@@ -0,0 +1,176 @@
+# In-memory title search / autocomplete index
+# Built from movies_df when the model assets load. Documents are numbered by popularity rank
+# (numVotes descending), so every postings list is already in result order and a query only
+# has to walk candidates until it has enough matches.
+import logging
+import os
+import re
+import unicodedata
+from collections import defaultdict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Token prefixes up to this length get their own postings list; longer query tokens
+# are matched against the postings of their first SEARCH_MAX_PREFIX_LEN characters.
+SEARCH_MAX_PREFIX_LEN = int(os.getenv("SEARCH_MAX_PREFIX_LEN", "6"))
+NGRAM_SIZE = 3
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+
+def normalize(text: str) -> str:
+    """Lowercases, strips accents and collapses punctuation/whitespace to single spaces"""
+    if not isinstance(text, str):
+        return ""
+    decomposed = unicodedata.normalize("NFKD", text)
+    ascii_text = decomposed.encode("ascii", "ignore").decode("ascii").lower()
+    return _NON_ALNUM.sub(" ", ascii_text).strip()
+
+
+def _ngrams(text: str):
+    padded = f" {text} "
+    return {padded[i:i + NGRAM_SIZE] for i in range(len(padded) - NGRAM_SIZE + 1)}
+
+
+def _intersect(postings_lists):
+    """Intersects sorted int32 postings lists, starting from the shortest"""
+    postings_lists = sorted(postings_lists, key=len)
+    result = postings_lists[0]
+    for other in postings_lists[1:]:
+        if result.size == 0:
+            break
+        idx = np.searchsorted(other, result)
+        idx[idx == other.size] = 0
+        result = result[other[idx] == result]
+    return result
+
+
+class SearchIndex:
+    """
+    Prefix and character n-gram postings over normalized titles.
+
+    Attributes:
+        rank_to_position: Maps a document (popularity rank) to its row position in movies_df.
+        titles: Normalized title of each document.
+    """
+
+    def __init__(self, rank_to_position, titles, prefix_postings, ngram_postings):
+        self.rank_to_position = rank_to_position
+        self.titles = titles
+        self.prefix_postings = prefix_postings
+        self.ngram_postings = ngram_postings
+
+    def __len__(self):
+        return len(self.titles)
+
+    @property
+    def nbytes(self):
+        """Approximate size of the postings arrays in bytes"""
+        return (self.rank_to_position.nbytes
+                + sum(p.nbytes for p in self.prefix_postings.values())
+                + sum(p.nbytes for p in self.ngram_postings.values()))
+
+    def search(self, query: str, limit: int = 10):
+        """
+        Finds titles where every query token is a prefix of a title token, most popular first.
+        If that gives fewer than `limit` results, titles that contain the query as a
+        substring (via n-gram postings) fill the rest.
+
+        Returns:
+            Array of row positions in movies_df.
+        """
+        text = normalize(query)
+        if not text:
+            return np.array([], dtype=np.int64)
+        tokens = text.split()
+
+        ranks = self._prefix_matches(tokens, limit)
+        if len(ranks) < limit and len(text) >= NGRAM_SIZE:
+            seen = set(ranks)
+            ranks += [r for r in self._substring_matches(text, limit) if r not in seen][:limit - len(ranks)]
+
+        return self.rank_to_position[np.asarray(ranks, dtype=np.int64)]
+
+    def _prefix_matches(self, tokens, limit):
+        postings = []
+        for token in tokens:
+            p = self.prefix_postings.get(token[:SEARCH_MAX_PREFIX_LEN])
+            if p is None:
+                return []
+            postings.append(p)
+        candidates = _intersect(postings)
+
+        long_tokens = [t for t in tokens if len(t) > SEARCH_MAX_PREFIX_LEN]
+        if not long_tokens:
+            return candidates[:limit].tolist()
+
+        # Postings only cover the first SEARCH_MAX_PREFIX_LEN characters; check the rest
+        matches = []
+        for rank in candidates:
+            title_tokens = self.titles[rank].split()
+            if all(any(tt.startswith(t) for tt in title_tokens) for t in long_tokens):
+                matches.append(int(rank))
+                if len(matches) == limit:
+                    break
+        return matches
+
+    def _substring_matches(self, text, limit):
+        postings = []
+        # Only inner n-grams: the query may start or end in the middle of a title word
+        for gram in _ngrams(text):
+            if gram.startswith(" ") or gram.endswith(" "):
+                continue
+            p = self.ngram_postings.get(gram)
+            if p is None:
+                return []
+            postings.append(p)
+        if not postings:
+            return []
+
+        matches = []
+        for rank in _intersect(postings):
+            if text in self.titles[rank]:
+                matches.append(int(rank))
+                if len(matches) == limit:
+                    break
+        return matches
+
+
+def build_search_index(movies_df) -> SearchIndex:
+    """
+    Builds the search index from the movies DataFrame.
+
+    Args:
+        movies_df: Movies DataFrame with 'primaryTitle' and 'numVotes' columns.
+
+    Returns:
+        SearchIndex over every title in movies_df.
+    """
+    votes = movies_df['numVotes'].fillna(0).to_numpy()
+    # Stable sort keeps catalog order among equally popular titles
+    rank_to_position = np.argsort(-votes, kind="stable")
+    raw_titles = movies_df['primaryTitle'].to_numpy()
+
+    titles = []
+    prefix_lists = defaultdict(list)
+    ngram_lists = defaultdict(list)
+    for rank, position in enumerate(rank_to_position):
+        title = normalize(raw_titles[position])
+        titles.append(title)
+
+        prefixes = set()
+        for token in title.split():
+            for length in range(1, min(len(token), SEARCH_MAX_PREFIX_LEN) + 1):
+                prefixes.add(token[:length])
+        for prefix in prefixes:
+            prefix_lists[prefix].append(rank)
+        for gram in _ngrams(title):
+            ngram_lists[gram].append(rank)
+
+    # Ranks were appended in increasing order, so every list is already sorted
+    prefix_postings = {k: np.asarray(v, dtype=np.int32) for k, v in prefix_lists.items()}
+    ngram_postings = {k: np.asarray(v, dtype=np.int32) for k, v in ngram_lists.items()}
+
+    return SearchIndex(rank_to_position.astype(np.int64), titles, prefix_postings, ngram_postings)
@@ -1,9 +1,20 @@
-import pandas as pd
 from sqlalchemy.orm import Session
-from . import models
+from . import lazy, models
+
+pd = lazy.module("pandas")
+
+def _movie_from_row(row) -> models.Movie:
+    return models.Movie(
+        tconst=row['tconst'],
+        primaryTitle=row['primaryTitle'],
+        startYear=int(row['startYear']), # Ensure startYear is an integer
+        genres=row['genres'],
+        # Titles without a vote count are stored with the column default
+        numVotes=0 if pd.isna(row['numVotes']) else int(row['numVotes'])
+    )
 
 # The function now accepts the DataFrame and the DB session as arguments
-def seed_movies_table(db: Session, movies_df: pd.DataFrame):
+def seed_movies_table(db: Session, movies_df: "pd.DataFrame"):
     """
     Populates the 'movies' table using a pre-loaded DataFrame.
     """
@@ -15,16 +26,7 @@ def seed_movies_table(db: Session, movies_df: pd.DataFrame):
 
         print(f"Seeding database with {len(movies_df)} movies...")
         
-        new_movies = []
-        for index, row in movies_df.iterrows():
-            movie_data = models.Movie(
-                tconst=row['tconst'],
-                primaryTitle=row['primaryTitle'],
-                startYear=int(row['startYear']), # Ensure startYear is an integer
-                genres=row['genres'],
-                numVotes=int(row['numVotes'])
-            )
-            new_movies.append(movie_data)
+        new_movies = [_movie_from_row(row) for index, row in movies_df.iterrows()]
         
         db.add_all(new_movies)
         db.commit()
@@ -36,4 +38,26 @@ def seed_movies_table(db: Session, movies_df: pd.DataFrame):
         db.rollback()
     finally:
         # The session will be closed by the code that calls this function.
-        pass
\ No newline at end of file
+        pass
+
+
+def seed_new_movies(db: Session, movies_df: "pd.DataFrame") -> int:
+    """
+    Inserts the movies of movies_df whose tconst isn't in the 'movies' table yet, e.g. the
+    titles added by `featurize --append`. Existing rows are left as they are.
+
+    Returns:
+        Number of movies inserted.
+
+    Raises:
+        SQLAlchemyError: If the insert fails (the transaction is rolled back).
+    """
+    existing = {tconst for (tconst,) in db.query(models.Movie.tconst)}
+    new_rows = movies_df[~movies_df['tconst'].isin(existing)]
+    try:
+        db.add_all([_movie_from_row(row) for index, row in new_rows.iterrows()])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return len(new_rows)
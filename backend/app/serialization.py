@@ -0,0 +1,100 @@
+# Fast response serialization
+# Recommendation payloads are built straight from the catalog's (or a DataFrame's) column arrays
+# and encoded with orjson, skipping per-row pandas access and response_model validation on the hot path.
+import os
+
+import numpy as np
+from fastapi.responses import ORJSONResponse
+
+from . import lazy
+
+pd = lazy.module("pandas")
+
+# Responses larger than this many bytes are gzip-compressed when the client accepts it.
+# Set to 0 to disable compression.
+GZIP_MINIMUM_SIZE = int(os.getenv("GZIP_MINIMUM_SIZE", "4096"))
+
+# Keys of a MovieRecommendation, in response order
+MOVIE_FIELDS = ("tconst", "primaryTitle", "startYear", "genres", "averageRating", "poster_url", "overview")
+
+
+def _nullable_ints(values):
+    arr = np.asarray(values, dtype=np.float64)
+    out = np.where(np.isnan(arr), 0, arr).astype(np.int64).astype(object)
+    out[np.isnan(arr)] = None
+    return out.tolist()
+
+
+def _nullable_floats(values):
+    arr = np.asarray(values, dtype=np.float64)
+    out = arr.astype(object)
+    out[np.isnan(arr)] = None
+    return out.tolist()
+
+
+def _nullable_objects(values):
+    arr = np.asarray(values, dtype=object)
+    out = arr.copy()
+    out[pd.isna(arr)] = None
+    return out.tolist()
+
+
+def movie_records(movies_df: "pd.DataFrame", positions=None):
+    """
+    Builds response-ready movie dicts from the DataFrame's column arrays.
+
+    Args:
+        movies_df: DataFrame with 'tconst', 'primaryTitle', 'startYear', 'genres' and 'averageRating' columns.
+        positions: Optional row positions to select. Defaults to every row, in order.
+
+    Returns:
+        List of dicts with the MovieRecommendation fields; poster_url and overview are None.
+    """
+    def column(name):
+        values = movies_df[name].to_numpy()
+        return values if positions is None else values[positions]
+
+    n = len(movies_df) if positions is None else len(positions)
+    columns = (
+        column('tconst').tolist(),
+        column('primaryTitle').tolist(),
+        _nullable_ints(column('startYear')),
+        _nullable_objects(column('genres')),
+        _nullable_floats(column('averageRating')),
+        [None] * n,
+        [None] * n,
+    )
+    return [dict(zip(MOVIE_FIELDS, row)) for row in zip(*columns)]
+
+
+def catalog_records(movie_catalog, positions):
+    """
+    Builds response-ready movie dicts for rows of the columnar catalog.
+
+    Args:
+        movie_catalog: catalog.MovieCatalog.
+        positions: Row positions to select, in response order.
+
+    Returns:
+        List of dicts with the MovieRecommendation fields; poster_url and overview are None.
+    """
+    positions = np.asarray(positions, dtype=np.int64)
+    n = len(positions)
+    columns = (
+        movie_catalog.tconst.take(positions),
+        movie_catalog.title.take(positions),
+        _nullable_ints(movie_catalog.years(positions)),
+        movie_catalog.genres(positions),
+        _nullable_floats(movie_catalog.ratings(positions)),
+        [None] * n,
+        [None] * n,
+    )
+    return [dict(zip(MOVIE_FIELDS, row)) for row in zip(*columns)]
+
+
+def json_response(content, status_code: int = 200, headers: dict = None):
+    """
+    Wraps already-serializable content in an orjson response.
+    Returning this from a route bypasses FastAPI's response_model validation.
+    """
+    return ORJSONResponse(content=content, status_code=status_code, headers=headers)
@@ -0,0 +1,143 @@
+# Sharded parallel similarity scoring
+# The feature matrices are split into contiguous row shards when the assets load, with each
+# row's L2 norm precomputed. A request then scores every shard on a thread pool: sparse
+# mat-vec products and NumPy array kernels release the GIL, so shards run on separate cores.
+# Each shard keeps only its own top-k, and the shard results are merged into the global top-k.
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import scipy.sparse as sp
+
+from . import recommender
+
+# Number of row shards; 0 or 1 keeps the single-pass recommender.content_similarity path
+SCORING_SHARDS = int(os.getenv("SCORING_SHARDS", "0"))
+# Threads scoring shards, shared by all requests (defaults to one per shard)
+SCORING_THREADS = int(os.getenv("SCORING_THREADS", "0")) or max(1, SCORING_SHARDS)
+
+
+def _row_slice(matrix, start, stop):
+    """Rows [start, stop) of a CSR matrix as a view on its data and indices (no copy)"""
+    if not sp.isspmatrix_csr(matrix) and not isinstance(matrix, sp.csr_array):
+        return matrix[start:stop]
+    begin, end = matrix.indptr[start], matrix.indptr[stop]
+    return sp.csr_matrix(
+        (matrix.data[begin:end], matrix.indices[begin:end], matrix.indptr[start:stop + 1] - begin),
+        shape=(stop - start, matrix.shape[1])
+    )
+
+
+class ShardedScorer:
+    """
+    Row shards of the people and genre matrices with precomputed inverse row norms.
+
+    Args:
+        people_matrix: People TF-IDF matrix.
+        genre_matrix: Genre TF-IDF matrix with the same rows.
+        n_shards: Number of contiguous row shards.
+    """
+
+    def __init__(self, people_matrix, genre_matrix, n_shards):
+        people_matrix = people_matrix.tocsr() if sp.issparse(people_matrix) else people_matrix
+        genre_matrix = genre_matrix.tocsr() if sp.issparse(genre_matrix) else genre_matrix
+        self.n_rows = people_matrix.shape[0]
+        self.people_inv_norms = recommender.inverse_row_norms(people_matrix)
+        self.genre_inv_norms = recommender.inverse_row_norms(genre_matrix)
+
+        bounds = np.linspace(0, self.n_rows, max(1, n_shards) + 1).astype(np.int64)
+        self.shards = [
+            (start, stop, _row_slice(people_matrix, start, stop), _row_slice(genre_matrix, start, stop))
+            for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start
+        ]
+
+    def __len__(self):
+        return len(self.shards)
+
+    @property
+    def nbytes(self):
+        """Memory held by the norms and shard index pointers (shard data is shared with the matrices)"""
+        return (self.people_inv_norms.nbytes + self.genre_inv_norms.nbytes
+                + sum(p.indptr.nbytes + g.indptr.nbytes for _, _, p, g in self.shards if sp.issparse(p)))
+
+    def _score_shard(self, shard, people_vector, genre_vector, exclude_indices, candidate_mask, k):
+        start, stop, people_shard, genre_shard = shard
+        scores = people_shard @ people_vector
+        scores *= self.people_inv_norms[start:stop]
+        scores *= recommender.W_PEOPLE
+        genre_scores = genre_shard @ genre_vector
+        genre_scores *= self.genre_inv_norms[start:stop]
+        scores += recommender.W_GENRE * genre_scores
+
+        local_exclude = exclude_indices[(exclude_indices >= start) & (exclude_indices < stop)] - start
+        scores[local_exclude] = -np.inf
+        if candidate_mask is not None:
+            scores[~candidate_mask[start:stop]] = -np.inf
+
+        k = min(k, int(np.isfinite(scores).sum()))
+        if k == 0:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float64)
+        # Ties are kept in catalog order, so the merged top-k matches select_candidates exactly
+        top = recommender.top_k(scores, k)
+        return top + start, scores[top]
+
+    def top_candidates(self, avg_people_vector, avg_genre_vector, exclude_indices, n_candidates=recommender.N_CANDIDATES,
+                       candidate_mask=None, executor=None):
+        """
+        Same result as recommender.content_similarity followed by recommender.select_candidates,
+        computed shard by shard in parallel.
+
+        Args:
+            avg_people_vector, avg_genre_vector: Profile vectors from recommender.aggregate_profile.
+            exclude_indices: Row positions that can't be recommended (the liked movies).
+            n_candidates: Number of candidates to keep.
+            candidate_mask: Optional boolean array over rows; rows where it is False are excluded.
+            executor: Thread pool to score shards on (defaults to the shared one).
+
+        Returns:
+            Tuple of (positions, content_scores) arrays, best first; empty if nothing is eligible.
+        """
+        people_vector = np.asarray(avg_people_vector, dtype=np.float64).ravel()
+        genre_vector = np.asarray(avg_genre_vector, dtype=np.float64).ravel()
+        # Cosine similarity normalizes the profile vectors too
+        for vector in (people_vector, genre_vector):
+            norm = np.linalg.norm(vector)
+            if norm > 0:
+                vector /= norm
+        exclude_indices = np.asarray(exclude_indices, dtype=np.int64)
+
+        executor = executor or get_executor()
+        results = list(executor.map(
+            lambda shard: self._score_shard(shard, people_vector, genre_vector, exclude_indices,
+                                            candidate_mask, n_candidates),
+            self.shards
+        ))
+
+        positions = np.concatenate([p for p, _ in results])
+        scores = np.concatenate([s for _, s in results])
+        if positions.size == 0:
+            return positions, scores
+        # Global top-k of the shard top-ks; ties keep catalog order, like select_candidates
+        order = np.lexsort((positions, -scores))[:n_candidates]
+        return positions[order], scores[order]
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """The thread pool shared by all requests for shard scoring"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=SCORING_THREADS, thread_name_prefix="shard-scoring")
+        return _executor
+
+
+def build_sharded_scorer(people_matrix, genre_matrix, n_shards=SCORING_SHARDS):
+    """Builds the ShardedScorer, or returns None when sharding is disabled"""
+    if n_shards <= 1:
+        return None
+    return ShardedScorer(people_matrix, genre_matrix, n_shards)
@@ -0,0 +1,102 @@
+# Request coalescing ("single flight")
+# When several threads ask for the same key at the same time, only the first runs the
+# computation; the others wait for it and share its result (or its exception). Nothing is
+# cached once the call returns; this only removes duplicate work that is in flight at the
+# same moment, e.g. a client retrying /recommendations or opening it in several tabs, or two
+# pages enriching the same popular movie from TMDb.
+import logging
+import os
+import threading
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+SINGLEFLIGHT_ENABLED = os.getenv("SINGLEFLIGHT_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Every group created in this process, by name, for get_stats()
+_groups = {}
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one execution.
+
+    Args:
+        name: Group name, used in metrics and stats.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.stats = {"executed": 0, "coalesced": 0, "failed": 0}
+        _groups[name] = self
+
+    def do(self, key, fn):
+        """
+        Returns fn(), running it only if no call with the same key is already in flight;
+        otherwise waits for that call and returns its result. Callers share the returned
+        object, so it must not be modified.
+
+        Raises:
+            Whatever fn raised, in the caller that ran it and in every caller that waited for it.
+        """
+        if not SINGLEFLIGHT_ENABLED:
+            return fn()
+
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                leader = True
+            else:
+                call.waiters += 1
+                self.stats["coalesced"] += 1
+                leader = False
+
+        if not leader:
+            metrics.observe_singleflight(self.name, "coalesced")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                self.stats["executed"] += 1
+                if call.error is not None:
+                    self.stats["failed"] += 1
+            call.done.set()
+            metrics.observe_singleflight(self.name, "executed")
+            if call.waiters:
+                logger.debug(f"{self.name}: {call.waiters} concurrent calls for {key!r} shared one execution")
+
+    def get_stats(self):
+        """Counters since startup, plus the number of keys in flight right now"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["in_flight"] = len(self._calls)
+        return stats
+
+
+def get_stats():
+    """Stats of every group in this process, by name"""
+    return {name: group.get_stats() for name, group in _groups.items()}
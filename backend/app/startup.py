@@ -0,0 +1,179 @@
+# Startup time report
+# Breaks a cold start down into the three places it spends time: importing app.main (measured
+# in a fresh interpreter with `python -X importtime`, per app module and per third-party
+# package), loading and indexing the model assets (model_loader.LOAD_TIMINGS), and the first
+# call into each serving module compared with the second (lazy imports, caches, page faults).
+# Used by the `startup-report` command, which fails when the import budget is exceeded.
+import logging
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Budget for `import app.main` in a fresh interpreter, in milliseconds
+STARTUP_IMPORT_BUDGET_MS = float(os.getenv("STARTUP_IMPORT_BUDGET_MS", "1200"))
+
+# Packages that are only imported on first use (see app/lazy.py). Finding one of them in the
+# import tree of app.main means an eager import crept back in.
+DEFERRED_MODULES = ("pandas", "sklearn", "huggingface_hub", "passlib", "jose", "joblib", "requests", "typer")
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_importtime(output: str):
+    """
+    Parses the stderr of `python -X importtime`.
+
+    Returns:
+        List of (module name, self microseconds, cumulative microseconds) tuples, in the order
+        the imports finished.
+    """
+    entries = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3:
+            continue
+        try:
+            self_us, cumulative_us = int(fields[0]), int(fields[1])
+        except ValueError:
+            # The header line
+            continue
+        entries.append((fields[2].strip(), self_us, cumulative_us))
+    return entries
+
+
+def measure_imports(target: str = "app.main", top: int = 10):
+    """
+    Imports `target` in a fresh interpreter and breaks the time down by module.
+
+    Args:
+        target: Module to import.
+        top: Number of app modules and of third-party packages to report.
+
+    Returns:
+        Dict with the total time, the app modules and the heaviest third-party packages (each
+        with its cumulative time in ms), and the deferred modules that were imported anyway.
+
+    Raises:
+        RuntimeError: If the import fails.
+    """
+    code = f"import time; start = time.perf_counter(); import {target}; print(time.perf_counter() - start)"
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [BACKEND_DIR, env.get("PYTHONPATH")]))
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {target} failed:\n{result.stderr[-2000:]}")
+    entries = parse_importtime(result.stderr)
+
+    app_modules = {}
+    packages = {}
+    for name, _, cumulative_us in entries:
+        if name == "app" or name.startswith("app."):
+            app_modules[name] = cumulative_us / 1000
+        elif "." not in name:
+            # A package's cumulative time is the one recorded for its top-level import
+            packages[name] = cumulative_us / 1000
+
+    imported = {name.split(".")[0] for name, _, _ in entries}
+    heaviest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {
+        "target": target,
+        "total_ms": float(result.stdout.strip().splitlines()[-1]) * 1000,
+        "app_modules_ms": dict(sorted(app_modules.items(), key=lambda item: item[1], reverse=True)[:top]),
+        "packages_ms": dict(heaviest),
+        "eager_deferred_modules": [name for name in DEFERRED_MODULES if name in imported],
+    }
+
+
+def _time_twice(fn):
+    """Seconds taken by the first and the second call of fn"""
+    timings = []
+    for _ in range(2):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def warm_up(loaded_assets):
+    """
+    Calls into each module on the serving path twice, the way the first request would.
+
+    Args:
+        loaded_assets: Assets returned by model_loader.load_model_assets().
+
+    Returns:
+        Dict of module -> {"first_ms", "second_ms"}. Modules whose assets aren't loaded are skipped.
+    """
+    from . import auth, recommender, serialization, trending
+
+    movie_catalog = loaded_assets.get('movie_catalog')
+    people_matrix = loaded_assets.get('people_tfidf_matrix')
+    genre_matrix = loaded_assets.get('genre_tfidf_matrix')
+
+    steps = []
+    if movie_catalog is not None and movie_catalog.key_positions is not None \
+            and people_matrix is not None and genre_matrix is not None:
+        profile = list(movie_catalog.key_positions.index[:10])
+        steps.append(("recommender", lambda: recommender.rank_candidates(
+            profile, movie_catalog, people_matrix, genre_matrix, shards=loaded_assets.get('scoring_shards'))))
+    if loaded_assets.get('filter_index') is not None:
+        steps.append(("filters", lambda: loaded_assets['filter_index'].candidate_mask(min_rating=7.0)))
+    if loaded_assets.get('search_index') is not None:
+        steps.append(("search", lambda: loaded_assets['search_index'].search("the", limit=10)))
+    if movie_catalog is not None:
+        positions = np.arange(min(20, len(movie_catalog)))
+        steps.append(("serialization", lambda: serialization.catalog_records(movie_catalog, positions)))
+        steps.append(("trending", lambda: trending.build_trending_snapshot(movie_catalog, enrich=False)))
+
+    def hash_and_verify():
+        # bcrypt is deliberately slow, so only the difference between the two calls is import cost
+        auth.verify_password("startup-report", auth.hash_password("startup-report"))
+
+    def encode_and_decode():
+        token = auth.create_access_token({"user_id": "00000000-0000-0000-0000-000000000000"})
+        auth.verify_access_token(token, RuntimeError("Invalid token"))
+
+    steps.append(("auth.password", hash_and_verify))
+    steps.append(("auth.jwt", encode_and_decode))
+
+    results = {}
+    for module, fn in steps:
+        try:
+            first, second = _time_twice(fn)
+        except Exception as e:
+            logger.error(f"Warm-up of {module} failed: {str(e)}")
+            continue
+        results[module] = {"first_ms": first * 1000, "second_ms": second * 1000}
+    return results
+
+
+def format_report(imports, load_timings=None, warm_up_timings=None, deferred_timings=None,
+                  budget_ms: float = STARTUP_IMPORT_BUDGET_MS):
+    """Plain-text report of measure_imports(), model_loader.LOAD_TIMINGS, warm_up() and lazy.import_timings"""
+    lines = [f"Import of {imports['target']}: {imports['total_ms']:.0f} ms (budget {budget_ms:.0f} ms)"]
+    lines.append("  app modules (cumulative):")
+    lines += [f"    {name:<32} {ms:8.1f} ms" for name, ms in imports["app_modules_ms"].items()]
+    lines.append("  heaviest packages (cumulative):")
+    lines += [f"    {name:<32} {ms:8.1f} ms" for name, ms in imports["packages_ms"].items()]
+    if imports["eager_deferred_modules"]:
+        lines.append(f"  imported eagerly but meant to be deferred: {', '.join(imports['eager_deferred_modules'])}")
+
+    if load_timings:
+        lines.append(f"Asset loading: {sum(load_timings.values()):.2f} s")
+        lines += [f"    {step:<32} {seconds * 1000:8.1f} ms" for step, seconds in load_timings.items()]
+    if deferred_timings:
+        lines.append("Deferred imports, paid on first use:")
+        lines += [f"    {name:<32} {seconds * 1000:8.1f} ms" for name, seconds in deferred_timings.items()]
+    if warm_up_timings:
+        lines.append("First request warm-up (first call / second call):")
+        lines += [f"    {module:<32} {t['first_ms']:8.1f} ms / {t['second_ms']:.1f} ms"
+                  for module, t in warm_up_timings.items()]
+    return "\n".join(lines)
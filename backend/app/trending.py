@@ -0,0 +1,247 @@
+# Precomputed trending list for onboarding
+# The trending set is rebuilt from the movie catalog on a background schedule and held in memory
+# as a ready-to-serve, pre-enriched snapshot. The database is only used for pages deeper
+# than the snapshot, or while no snapshot is available (e.g. the model assets failed to load).
+import asyncio
+import bisect
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from . import assets, cursors, enricher, models
+from .cursors import InvalidCursorError
+
+logger = logging.getLogger(__name__)
+
+TRENDING_YEARS = int(os.getenv("TRENDING_YEARS", "3"))
+TRENDING_SNAPSHOT_SIZE = int(os.getenv("TRENDING_SNAPSHOT_SIZE", "200"))
+TRENDING_REFRESH_SECONDS = int(os.getenv("TRENDING_REFRESH_SECONDS", "3600"))
+# Wait before the next attempt when a refresh couldn't build a fully enriched snapshot
+# (TMDb failing, catalog not loaded yet)
+TRENDING_RETRY_SECONDS = int(os.getenv("TRENDING_RETRY_SECONDS", "60"))
+DEFAULT_PAGE_SIZE = 50
+
+# The current snapshot. Replaced atomically by refresh_trending_snapshot().
+_snapshot = None
+_refresh_lock = threading.Lock()
+
+
+# --- Cursors ---
+# A cursor is the (numVotes, tconst) key of the last item on the previous page.
+# Items are ordered by numVotes descending, then tconst ascending, so the key is unique.
+
+def encode_cursor(num_votes: int, tconst: str) -> str:
+    return cursors.encode_cursor({"n": int(num_votes), "t": tconst})
+
+
+def decode_cursor(cursor: str):
+    payload = cursors.decode_cursor(cursor)
+    try:
+        return int(payload["n"]), str(payload["t"])
+    except (KeyError, TypeError, ValueError):
+        raise InvalidCursorError(f"Invalid cursor: {cursor!r}")
+
+
+# --- Snapshot ---
+
+def build_trending_snapshot(movie_catalog, size: int = TRENDING_SNAPSHOT_SIZE, enrich: bool = True):
+    """
+    Builds a trending snapshot from the movie catalog.
+
+    Args:
+        movie_catalog: catalog.MovieCatalog.
+        size: Number of movies kept in the snapshot.
+        enrich: Whether to enrich the snapshot with TMDb data.
+
+    Returns:
+        Dict with 'version', 'built_at', 'items' (response-ready dicts), 'keys' (sort keys
+        used for keyset pagination) and 'complete' (False if a TMDb lookup failed, so some
+        items are missing their poster and overview).
+    """
+    min_year = datetime.now().year - TRENDING_YEARS
+    recent = np.flatnonzero(movie_catalog.year >= min_year)
+    votes = movie_catalog.votes[recent].astype(np.int64)
+
+    # Keep the `size` most-voted movies (and any tied with the last one), then order
+    # them exactly by numVotes descending, tconst ascending
+    if len(recent) > size > 0:
+        cutoff = np.partition(votes, len(votes) - size)[len(votes) - size]
+        keep = votes >= cutoff
+        recent, votes = recent[keep], votes[keep]
+    tconsts = movie_catalog.tconst.take(recent)
+    order = sorted(range(len(recent)), key=lambda i: (-votes[i], tconsts[i]))[:size]
+    top = recent[order]
+
+    if enrich:
+        items, complete = enricher.enrich_recommendations_with_status(movie_catalog, top)
+    else:
+        items, complete = enricher._convert_to_basic_format(movie_catalog, top), True
+
+    keys = [(-int(votes[i]), tconsts[i]) for i in order]
+
+    digest = hashlib.sha1(json.dumps(items, sort_keys=True, default=str).encode()).hexdigest()
+    return {
+        "version": digest[:16],
+        "built_at": time.time(),
+        "items": items,
+        "keys": keys,
+        "complete": complete,
+    }
+
+
+def get_trending_snapshot():
+    """Get the current trending snapshot, or None if it hasn't been built yet"""
+    return _snapshot
+
+
+def refresh_trending_snapshot():
+    """
+    Rebuilds the trending snapshot from the loaded movie catalog and swaps it in.
+    A partly enriched snapshot only replaces another partly enriched one (or none), so a TMDb
+    outage doesn't take the posters off a snapshot that has them.
+
+    Returns:
+        True if a complete snapshot was installed, False otherwise (the refresh should be
+        retried sooner than usual).
+    """
+    global _snapshot
+
+    movie_catalog = assets.get_model_assets().get('movie_catalog')
+    if movie_catalog is None:
+        logger.warning("Movie catalog not loaded, trending snapshot not refreshed")
+        return False
+
+    # Only one refresh at a time; a concurrent caller just keeps the current snapshot.
+    if not _refresh_lock.acquire(blocking=False):
+        return False
+    try:
+        start = time.perf_counter()
+        snapshot = build_trending_snapshot(movie_catalog)
+        if not snapshot['complete']:
+            current = _snapshot
+            if current is None or not current['complete']:
+                _snapshot = snapshot
+            logger.warning(f"Trending snapshot {snapshot['version']} is partly unenriched (TMDb lookups failed); "
+                           f"{'serving it' if _snapshot is snapshot else 'keeping the previous one'} "
+                           f"until a retry succeeds")
+            return False
+        _snapshot = snapshot
+        logger.info(f"Trending snapshot {snapshot['version']} built with {len(snapshot['items'])} movies "
+                    f"in {time.perf_counter() - start:.2f}s")
+        return True
+    finally:
+        _refresh_lock.release()
+
+
+def clear_trending_snapshot():
+    global _snapshot
+    _snapshot = None
+
+
+async def run_refresh_loop(interval_seconds: int = TRENDING_REFRESH_SECONDS,
+                           retry_seconds: int = TRENDING_RETRY_SECONDS):
+    """
+    Background task that keeps the trending snapshot fresh.
+    The build runs in a worker thread so the event loop is never blocked. A refresh that
+    didn't install a complete snapshot is retried after retry_seconds instead of a full interval.
+    """
+    while True:
+        refreshed = False
+        try:
+            refreshed = await asyncio.to_thread(refresh_trending_snapshot)
+        except Exception as e:
+            logger.error(f"Failed to refresh trending snapshot: {str(e)}")
+        await asyncio.sleep(interval_seconds if refreshed else min(retry_seconds, interval_seconds))
+
+
+# --- Pages ---
+
+def _movie_to_item(movie: models.Movie):
+    return {
+        "tconst": movie.tconst,
+        "primaryTitle": movie.primaryTitle,
+        "startYear": movie.startYear,
+        "genres": movie.genres,
+        "averageRating": None,
+        "poster_url": None,
+        "overview": None,
+    }
+
+
+def _page_from_snapshot(snapshot, limit, after):
+    start = 0
+    if after is not None:
+        num_votes, tconst = after
+        start = bisect.bisect_right(snapshot['keys'], (-num_votes, tconst))
+    end = min(start + limit, len(snapshot['items']))
+    items = snapshot['items'][start:end]
+    last_key = (-snapshot['keys'][end - 1][0], snapshot['keys'][end - 1][1]) if items else after
+    return items, last_key
+
+
+def _page_from_db(db: Session, limit, after):
+    min_year = datetime.now().year - TRENDING_YEARS
+    query = db.query(models.Movie).filter(models.Movie.startYear >= min_year)
+    if after is not None:
+        num_votes, tconst = after
+        query = query.filter(or_(
+            models.Movie.numVotes < num_votes,
+            and_(models.Movie.numVotes == num_votes, models.Movie.tconst > tconst),
+        ))
+    # Uses ix_movies_startYear_numVotes
+    movies = query.order_by(models.Movie.numVotes.desc(), models.Movie.tconst).limit(limit).all()
+    last_key = (movies[-1].numVotes, movies[-1].tconst) if movies else after
+    return [_movie_to_item(movie) for movie in movies], last_key
+
+
+def get_trending_page(db: Session, limit: int = DEFAULT_PAGE_SIZE, cursor: str = None):
+    """
+    Returns one page of trending movies (see get_trending_page_with_snapshot).
+
+    Returns:
+        Tuple of (items, next_cursor). next_cursor is None on the last page.
+    """
+    items, next_cursor, _ = get_trending_page_with_snapshot(db, limit, cursor)
+    return items, next_cursor
+
+
+def get_trending_page_with_snapshot(db: Session, limit: int = DEFAULT_PAGE_SIZE, cursor: str = None):
+    """
+    Returns one page of trending movies, and the snapshot it was served from.
+    Pages are served from the in-memory snapshot; pages that run past the end of the
+    snapshot (or any page while no snapshot is available) come from the database.
+
+    Args:
+        db: Database session, only used for the fallback path.
+        limit: Page size.
+        cursor: Opaque cursor returned with the previous page, or None for the first page.
+
+    Returns:
+        Tuple of (items, next_cursor, snapshot). next_cursor is None on the last page;
+        snapshot is None when any item came from the database, as those aren't versioned.
+    """
+    after = decode_cursor(cursor) if cursor else None
+    items = []
+
+    snapshot = _snapshot
+    if snapshot is not None:
+        items, after = _page_from_snapshot(snapshot, limit, after)
+        # A snapshot smaller than its target size holds every trending movie
+        if len(items) < limit and len(snapshot['items']) < TRENDING_SNAPSHOT_SIZE:
+            return items, None, snapshot
+
+    if len(items) < limit:
+        db_items, after = _page_from_db(db, limit - len(items), after)
+        items = items + db_items
+        snapshot = None
+
+    next_cursor = encode_cursor(*after) if len(items) == limit else None
+    return items, next_cursor, snapshot
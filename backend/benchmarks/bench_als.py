@@ -0,0 +1,95 @@
+"""
+Training time and memory of the implicit-ALS collaborative model on synthetic likes.
+
+For each size, generates likes with Zipf-like user activity and item popularity, streams them
+into collaborative.InteractionMatrixBuilder in batches (as the train-cf command does with the
+interactions table), then trains and reports the time per ALS iteration and the peak memory
+traced during training:
+
+    python -m benchmarks.bench_als --sizes 100000,1000000,5000000 --threads 4
+"""
+import resource
+import time
+import tracemalloc
+
+import numpy as np
+import typer
+
+from app import collaborative
+
+from .common import Timer, summarize_latencies, write_report
+
+
+def synthetic_likes(n_likes: int, seed: int = 0):
+    """
+    (user, item) index pairs with heavy-tailed activity and popularity, like real feedback:
+    likes per user are log-normal, and item popularity falls off as rank^-0.8.
+    Users are about n_likes / 20 and items n_likes / 50.
+    """
+    rng = np.random.default_rng(seed)
+    n_users = max(100, n_likes // 20)
+    n_items = max(100, n_likes // 50)
+    activity = rng.lognormal(0.0, 1.0, n_users)
+    per_user = np.maximum(1, np.round(activity / activity.sum() * n_likes)).astype(np.int64)
+    users = np.repeat(np.arange(n_users), per_user)[:n_likes]
+    popularity = 1.0 / np.arange(1, n_items + 1) ** 0.8
+    items = rng.choice(n_items, len(users), p=popularity / popularity.sum())
+    return users, items
+
+
+def bench_size(n_likes, factors, iterations, threads, batch_size, seed):
+    users, items = synthetic_likes(n_likes, seed)
+
+    builder = collaborative.InteractionMatrixBuilder()
+    with Timer() as stream:
+        for start in range(0, n_likes, batch_size):
+            stop = start + batch_size
+            builder.add_batch(zip(users[start:stop].tolist(), items[start:stop].tolist()))
+        matrix, user_ids, item_ids = builder.build()
+    del users, items
+
+    iteration_times = []
+    tracemalloc.start()
+    with Timer() as train:
+        collaborative.train_als(matrix, factors=factors, iterations=iterations, threads=threads, seed=seed,
+                                on_iteration=lambda i, seconds: iteration_times.append(seconds))
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    factor_bytes = (matrix.shape[0] + matrix.shape[1]) * factors * 4
+    result = {
+        "likes": n_likes,
+        "users": matrix.shape[0],
+        "items": matrix.shape[1],
+        "nnz": int(matrix.nnz),
+        "matrix_bytes": int(matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes),
+        "factor_bytes": factor_bytes,
+        "stream_seconds": stream.elapsed,
+        "stream_likes_per_second": n_likes / stream.elapsed,
+        "train_seconds": train.elapsed,
+        "iteration": summarize_latencies(iteration_times),
+        "train_peak_traced_bytes": peak_bytes,
+    }
+    typer.echo(f"[{n_likes} likes] {result['users']} users x {result['items']} items, {result['nnz']} nnz: "
+               f"streamed in {stream.elapsed:.1f}s, trained in {train.elapsed:.1f}s "
+               f"({result['iteration']['p50_ms'] / 1000:.2f}s/iteration), "
+               f"peak {peak_bytes / 1e6:.0f} MB traced (factors {factor_bytes / 1e6:.0f} MB)")
+    return result
+
+
+def main(sizes: str = "100000,1000000,5000000", factors: int = 64, iterations: int = 5, threads: int = 0,
+         batch_size: int = collaborative.CF_BATCH_SIZE, seed: int = 0):
+    threads = threads or collaborative.CF_THREADS
+    results = {"factors": factors, "iterations": iterations, "threads": threads, "sizes": []}
+    start = time.perf_counter()
+    for n_likes in [int(s) for s in sizes.split(",") if s.strip()]:
+        results["sizes"].append(bench_size(n_likes, factors, iterations, threads, batch_size, seed))
+    results["total_seconds"] = time.perf_counter() - start
+    # Peak resident set size of the whole run (KiB on Linux)
+    results["max_rss_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    typer.echo(f"Max RSS {results['max_rss_bytes'] / 1e6:.0f} MB")
+    typer.echo(f"Report written to {write_report('als', results)}")
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,88 @@
+"""
+Measures DB queries per request with and without the authenticated-user cache.
+
+Runs a mixed workload of protected endpoints through the FastAPI app against the
+database configured in app/database.py (run it inside the `api` container):
+
+    python -m benchmarks.bench_auth_cache --requests 2000
+"""
+import random
+import uuid
+
+import typer
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app import auth, database
+from app.main import app
+
+from .common import Timer, summarize_latencies, write_report
+
+# (method, path, weight) - roughly what an onboarding-heavy client does
+WORKLOAD = [
+    ("GET", "/users/me", 3),
+    ("POST", "/users/me/genres", 1),
+    ("POST", "/interactions", 4),
+    ("GET", "/recommendations", 2),
+]
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args, **kwargs):
+        self.count += 1
+
+
+def _run_workload(client, headers, n_requests, counter, seed):
+    rng = random.Random(seed)
+    routes = [(m, p) for m, p, w in WORKLOAD for _ in range(w)]
+    latencies = []
+    queries_before = counter.count
+    for _ in range(n_requests):
+        method, path = rng.choice(routes)
+        with Timer() as t:
+            if path == "/users/me/genres":
+                client.post(path, json={"genres": ["Drama", "Sci-Fi"]}, headers=headers)
+            elif path == "/interactions":
+                client.post(path, json={"tconst": "tt0111161", "interaction_type": "like"}, headers=headers)
+            else:
+                client.request(method, path, headers=headers)
+        latencies.append(t.elapsed)
+    queries = counter.count - queries_before
+    return {
+        "requests": n_requests,
+        "db_queries": queries,
+        "db_queries_per_request": queries / n_requests,
+        "latency": summarize_latencies(latencies),
+    }
+
+
+def main(requests: int = 2000, seed: int = 42):
+    client = TestClient(app)
+    counter = QueryCounter(database.engine)
+
+    email = f"bench-{uuid.uuid4().hex[:8]}@example.com"
+    client.post("/users/register", json={"email": email, "password": "benchmark"})
+    token = client.post("/users/login", data={"username": email, "password": "benchmark"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    results = {}
+    original_ttl = auth.USER_CACHE_TTL_SECONDS
+    try:
+        for label, ttl in [("no_cache", 0), ("cached", original_ttl or 30)]:
+            auth.USER_CACHE_TTL_SECONDS = ttl
+            auth.clear_user_cache()
+            results[label] = _run_workload(client, headers, requests, counter, seed)
+            typer.echo(f"{label}: {results[label]['db_queries_per_request']:.2f} queries/request, "
+                       f"p50 {results[label]['latency']['p50_ms']:.2f} ms")
+    finally:
+        auth.USER_CACHE_TTL_SECONDS = original_ttl
+
+    typer.echo(f"Report written to {write_report('auth_cache', results)}")
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,117 @@
+"""
+Compares the columnar MovieCatalog with the pandas movies_df it replaces on the serving path.
+
+Reports the memory each takes, and the per-request cost of the two stages that used to go
+through the DataFrame (re-ranking the candidates and building the page records): latency,
+bytes allocated and number of allocations, measured with tracemalloc:
+
+    python -m benchmarks.bench_catalog --movies 1000000
+"""
+import tracemalloc
+
+import numpy as np
+import typer
+
+from app import catalog, metrics, recommender, serialization
+
+from .common import Timer, summarize_latencies, write_report
+from .synthetic import synthetic_feature_matrices, synthetic_indices_map, synthetic_movies_df
+
+PAGE_SIZE = 20
+
+
+def _legacy_rerank(df, movie_indices, content_scores):
+    # The DataFrame re-ranking stage the catalog replaced, kept here as the baseline
+    recs_df = df.iloc[movie_indices].copy()
+    recs_df['content_score'] = content_scores
+    recs_df['position'] = movie_indices
+    m = df['numVotes'].quantile(0.70)
+    C = df['averageRating'].mean()
+    recs_df['popularity_score'] = recommender.weighted_rating(recs_df['numVotes'], recs_df['averageRating'], m, C)
+    max_year = df['startYear'].max()
+    min_year = df['startYear'].min()
+    recs_df['recency_score'] = (recs_df['startYear'] - min_year) / (max_year - min_year)
+    if recs_df['content_score'].max() > 0:
+        recs_df['content_score'] = recs_df['content_score'] / recs_df['content_score'].max()
+    if recs_df['popularity_score'].max() > 0:
+        recs_df['popularity_score'] = recs_df['popularity_score'] / recs_df['popularity_score'].max()
+    recs_df['final_score'] = (0.60 * recs_df['content_score']) + (0.25 * recs_df['popularity_score']) + \
+                             (0.15 * recs_df['recency_score'])
+    ranked = recs_df.sort_values('final_score', ascending=False)
+    return ranked['position'].to_numpy(dtype=np.int64), ranked['final_score'].to_numpy(dtype=np.float64)
+
+
+def _legacy_request(df, movie_indices, content_scores):
+    positions, _ = _legacy_rerank(df, movie_indices, content_scores)
+    page = df.iloc[positions[:PAGE_SIZE]][recommender.RECOMMENDATION_COLUMNS]
+    return serialization.movie_records(page)
+
+
+def _catalog_request(movie_catalog, movie_indices, content_scores):
+    positions, _ = recommender.rerank_candidates(movie_catalog, movie_indices, content_scores)
+    return serialization.catalog_records(movie_catalog, positions[:PAGE_SIZE])
+
+
+def _allocations(fn, *args):
+    """Bytes and number of allocations made by one call (freed or not), and its peak traced memory"""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    fn(*args)
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    return {
+        "peak_bytes": peak,
+        "net_bytes": sum(s.size_diff for s in stats),
+        "allocations": sum(max(0, s.count_diff) for s in stats),
+    }
+
+
+def main(movies: int = 1000000, requests: int = 200, seed: int = 13):
+    df = synthetic_movies_df(movies, seed=seed)
+    people, genre = synthetic_feature_matrices(df, seed=seed)
+    indices_map = synthetic_indices_map(df)
+    with Timer() as build:
+        movie_catalog = catalog.MovieCatalog(df, indices_map)
+
+    df_bytes = metrics.asset_nbytes(df)
+    catalog_bytes = movie_catalog.nbytes
+    typer.echo(f"{movies} movies: movies_df {df_bytes / 1e6:.1f} MB, catalog {catalog_bytes / 1e6:.1f} MB "
+               f"({df_bytes / catalog_bytes:.1f}x smaller, built in {build.elapsed:.2f}s)")
+
+    # Candidate sets like the similarity stage produces
+    rng = np.random.default_rng(seed)
+    candidates = []
+    for _ in range(requests):
+        valid = recommender.lookup_profile(list(indices_map.index[rng.choice(len(indices_map), 15, replace=False)]),
+                                           movie_catalog)
+        scores = recommender.content_similarity(*recommender.aggregate_profile(valid, people, genre), people, genre)
+        candidates.append(recommender.select_candidates(scores, valid))
+
+    results = {"movies": movies, "movies_df_bytes": df_bytes, "catalog_bytes": catalog_bytes,
+               "catalog_build_seconds": build.elapsed}
+    for label, fn, source in [("dataframe", _legacy_request, df), ("catalog", _catalog_request, movie_catalog)]:
+        fn(source, *candidates[0])
+        timings = []
+        for movie_indices, content_scores in candidates:
+            with Timer() as t:
+                fn(source, movie_indices, content_scores)
+            timings.append(t.elapsed)
+        results[label] = {"latency": summarize_latencies(timings),
+                          "allocations": _allocations(fn, source, *candidates[0])}
+        r = results[label]
+        typer.echo(f"{label:>9}: rerank + page p50 {r['latency']['p50_ms']:.3f} ms, "
+                   f"peak {r['allocations']['peak_bytes'] / 1e3:.1f} KB, "
+                   f"{r['allocations']['allocations']} live allocations after the request")
+
+    results["p50_speedup"] = results["dataframe"]["latency"]["p50_ms"] / results["catalog"]["latency"]["p50_ms"]
+    results["peak_bytes_ratio"] = (results["dataframe"]["allocations"]["peak_bytes"]
+                                   / max(1, results["catalog"]["allocations"]["peak_bytes"]))
+    typer.echo(f"catalog is {results['p50_speedup']:.1f}x faster with {results['peak_bytes_ratio']:.1f}x "
+               f"less peak memory per request")
+    typer.echo(f"Report written to {write_report('catalog', results)}")
+
+
+if __name__ == "__main__":
+    typer.run(main)
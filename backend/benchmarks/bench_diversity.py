@@ -0,0 +1,91 @@
+"""
+Latency and effect of the MMR diversity stage (recommender.diversify_candidates).
+
+For each candidate pool size, ranks synthetic profiles without diversity, then times the
+diversity stage on the ranked pool for each lambda. It also reports what the stage changes in
+the first page: the mean pairwise content similarity (lower is more diverse) and the mean
+relevance (final score) given up. Exits non-zero if the p99 of a pool size exceeds its budget:
+
+    python -m benchmarks.bench_diversity --movies 200000 --candidates 500,5000 --budgets-ms 5,40
+"""
+import numpy as np
+import typer
+
+from app import catalog, recommender
+
+from .common import Timer, summarize_latencies, write_report
+from .synthetic import synthetic_feature_matrices, synthetic_indices_map, synthetic_movies_df
+
+PAGE_SIZE = 20
+
+
+def _page_similarity(positions, people, genre):
+    """Mean pairwise content similarity of a page (weighted cosine, as in content_similarity)"""
+    page = positions[:PAGE_SIZE]
+    people_vectors = recommender._candidate_vectors(people, page)
+    genre_vectors = recommender._candidate_vectors(genre, page)
+    similarity = (recommender.W_PEOPLE * (people_vectors @ people_vectors.T).toarray()
+                  + recommender.W_GENRE * (genre_vectors @ genre_vectors.T).toarray())
+    upper = np.triu_indices(len(page), k=1)
+    return float(similarity[upper].mean())
+
+
+def main(movies: int = 200000, candidates: str = "500,5000", budgets_ms: str = "5,40",
+         lambdas: str = "0.5,0.7,0.9", depth: int = recommender.MMR_DEPTH, profiles: int = 100, seed: int = 7):
+    pool_sizes = [int(c) for c in candidates.split(",") if c.strip()]
+    budgets = [float(b) for b in budgets_ms.split(",") if b.strip()]
+    if len(budgets) != len(pool_sizes):
+        raise typer.BadParameter("Give one budget per candidate pool size")
+    lambda_values = [float(v) for v in lambdas.split(",") if v.strip()]
+
+    df = synthetic_movies_df(movies, seed=seed)
+    people, genre = synthetic_feature_matrices(df, seed=seed)
+    indices_map = synthetic_indices_map(df)
+    movie_catalog = catalog.MovieCatalog(df, indices_map)
+    rng = np.random.default_rng(seed)
+    profile_keys = [list(indices_map.index[rng.choice(len(indices_map), 15, replace=False)])
+                    for _ in range(profiles)]
+
+    results = {"movies": movies, "depth": depth, "profiles": profiles, "pools": []}
+    over_budget = []
+    for n_candidates, budget_ms in zip(pool_sizes, budgets):
+        rankings = [recommender.rank_candidates(keys, movie_catalog, people, genre, n_candidates=n_candidates)
+                    for keys in profile_keys]
+        baseline_similarity = np.mean([_page_similarity(p, people, genre) for p, _ in rankings])
+        baseline_relevance = np.mean([s[:PAGE_SIZE].mean() for _, s in rankings])
+        pool = {"candidates": n_candidates, "budget_ms": budget_ms, "page_similarity": baseline_similarity,
+                "page_relevance": baseline_relevance, "lambdas": []}
+        typer.echo(f"[{n_candidates} candidates] relevance order: page similarity {baseline_similarity:.3f}, "
+                   f"relevance {baseline_relevance:.3f}")
+
+        for mmr_lambda in lambda_values:
+            timings, similarity, relevance = [], [], []
+            recommender.diversify_candidates(*rankings[0], people, genre, mmr_lambda, depth)
+            for positions, final_scores in rankings:
+                with Timer() as t:
+                    diversified, diversified_scores = recommender.diversify_candidates(
+                        positions, final_scores, people, genre, mmr_lambda, depth)
+                timings.append(t.elapsed)
+                similarity.append(_page_similarity(diversified, people, genre))
+                relevance.append(diversified_scores[:PAGE_SIZE].mean())
+            latency = summarize_latencies(timings)
+            within_budget = latency["p99_ms"] <= budget_ms
+            if not within_budget:
+                over_budget.append((n_candidates, mmr_lambda))
+            pool["lambdas"].append({"lambda": mmr_lambda, "latency": latency, "within_budget": within_budget,
+                                    "page_similarity": float(np.mean(similarity)),
+                                    "page_relevance": float(np.mean(relevance))})
+            typer.echo(f"  lambda {mmr_lambda:.2f}: p50 {latency['p50_ms']:.2f} ms, p99 {latency['p99_ms']:.2f} ms "
+                       f"(budget {budget_ms:g} ms{'' if within_budget else ', EXCEEDED'}), page similarity "
+                       f"{np.mean(similarity):.3f}, relevance {np.mean(relevance):.3f}")
+        results["pools"].append(pool)
+
+    results["within_budget"] = not over_budget
+    typer.echo(f"Report written to {write_report('diversity', results)}")
+    if over_budget:
+        typer.echo("Over budget: " + ", ".join(f"{n} candidates at lambda {v:g}" for n, v in over_budget))
+        raise typer.Exit(code=1)
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,137 @@
+"""
+Throughput and memory of the interaction export (app/export.py).
+
+With --source synthetic (the default), streams generated interaction batches spread over
+--days days into export.ShardWriter for each size, and reports rows/s and the peak memory
+traced while writing. Memory is bounded by --shard-rows and --batch-size, not by the number of
+rows exported: it grows with the size only while a day holds fewer than --shard-rows rows, and
+stays flat beyond that.
+
+    python -m benchmarks.bench_export --sizes 1000000,4000000,12000000 --days 30 --shard-rows 100000
+
+With --source db, runs a full export of the interactions table (e.g. after
+`python -m benchmarks.bench_partitions --keep`) through the read session into a temporary
+directory, and reports rows/s and the growth of the resident set size:
+
+    python -m benchmarks.bench_export --source db
+"""
+import os
+import resource
+import shutil
+import tempfile
+import tracemalloc
+
+import numpy as np
+import typer
+
+from app import database, export
+
+from .common import Timer, write_report
+
+_HEX = np.frombuffer(b"0123456789abcdef", dtype="S1")
+
+
+def synthetic_batches(n_rows: int, batch_size: int, days: int, n_users: int = 200_000,
+                      n_movies: int = 50_000, seed: int = 0):
+    """
+    Batches shaped like the ones export.stream_interactions yields, generated one at a time so the generator
+    itself holds only one batch. created_at grows evenly over `days` days.
+    """
+    rng = np.random.default_rng(seed)
+    user_bytes = rng.integers(0, 256, (n_users, 16), dtype=np.uint8)
+    # Hex-encode each UUID's 16 bytes into 32 characters
+    user_hex = np.stack([_HEX[user_bytes >> 4], _HEX[user_bytes & 15]], axis=2).reshape(n_users, 32)
+    user_ids = user_hex.view("S32").ravel()
+    tconsts = np.char.add(b"tt", np.char.zfill(np.arange(n_movies).astype("S7"), 7))
+    interaction_types = np.array([b"like", b"dislike"])
+    start_us = 1_700_000_000 * 1_000_000
+    span_us = days * 86_400_000_000
+
+    for offset in range(0, n_rows, batch_size):
+        ids = np.arange(offset, min(offset + batch_size, n_rows), dtype=np.int64)
+        yield {
+            "id": ids,
+            "user_id": user_ids[rng.integers(0, n_users, len(ids))],
+            "tconst": tconsts[rng.integers(0, n_movies, len(ids))],
+            "interaction_type": interaction_types[(rng.random(len(ids)) < 0.33).astype(np.int64)],
+            "created_at_us": start_us + ids * span_us // n_rows,
+        }
+
+
+def bench_synthetic_size(n_rows, batch_size, shard_rows, days, compress, seed):
+    output_dir = tempfile.mkdtemp(prefix="bench-export-")
+    try:
+        # Throughput without tracing, then the same export again under tracemalloc
+        writer = export.ShardWriter(output_dir, "throughput", shard_rows, compress)
+        with Timer() as t:
+            for batch in synthetic_batches(n_rows, batch_size, days, seed=seed):
+                writer.write(batch)
+            writer.flush()
+        bytes_written = sum(os.path.getsize(path) for path in writer.paths)
+
+        traced = export.ShardWriter(os.path.join(output_dir, "traced"), "traced", shard_rows, compress)
+        tracemalloc.start()
+        for batch in synthetic_batches(n_rows, batch_size, days, seed=seed):
+            traced.write(batch)
+        traced.flush()
+        _, peak_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        shutil.rmtree(output_dir)
+
+    result = {
+        "rows": n_rows, "shards": len(writer.paths), "seconds": t.elapsed,
+        "rows_per_second": n_rows / t.elapsed, "bytes_written": bytes_written,
+        "bytes_per_row": bytes_written / max(n_rows, 1), "peak_traced_bytes": peak_bytes,
+    }
+    typer.echo(f"{n_rows:>12,} rows: {result['rows_per_second']:>12,.0f} rows/s, {len(writer.paths)} shards, "
+               f"{result['bytes_per_row']:.1f} B/row, peak traced {peak_bytes / 1e6:.0f} MB")
+    return result
+
+
+def bench_db(batch_size, shard_rows, compress):
+    output_dir = tempfile.mkdtemp(prefix="bench-export-")
+    db = database.ReadSessionLocal()
+    try:
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        with Timer() as t:
+            run = export.export_interactions(db, output_dir, batch_size, shard_rows, lag_seconds=0,
+                                             compress=compress, full=True)
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        bytes_written = sum(os.path.getsize(os.path.join(output_dir, path)) for path in run["files"])
+    finally:
+        db.close()
+        shutil.rmtree(output_dir)
+
+    result = {
+        "rows": run["rows"], "shards": len(run["files"]), "seconds": t.elapsed,
+        "rows_per_second": run["rows"] / t.elapsed, "bytes_written": bytes_written,
+        "replica": database.has_replica(), "max_rss_growth_bytes": rss_after - rss_before,
+    }
+    typer.echo(f"{run['rows']:,} rows from the {'replica' if result['replica'] else 'primary'}: "
+               f"{result['rows_per_second']:,.0f} rows/s, {len(run['files'])} shards, "
+               f"max RSS grew by {result['max_rss_growth_bytes'] / 1e6:.0f} MB")
+    return result
+
+
+def main(source: str = "synthetic", sizes: str = "1000000,10000000", batch_size: int = export.EXPORT_BATCH_SIZE,
+         shard_rows: int = export.EXPORT_SHARD_ROWS, days: int = 365, compress: bool = False, seed: int = 0):
+    results = {"source": source, "batch_size": batch_size, "shard_rows": shard_rows, "compress": compress}
+    if source == "db":
+        results["export"] = bench_db(batch_size, shard_rows, compress)
+    elif source == "synthetic":
+        results["days"] = days
+        results["sizes"] = [bench_synthetic_size(int(n), batch_size, shard_rows, days, compress, seed)
+                            for n in sizes.split(",")]
+        peaks = [size["peak_traced_bytes"] for size in results["sizes"]]
+        results["peak_growth"] = max(peaks) / min(peaks)
+        typer.echo(f"Peak traced memory varies by {results['peak_growth']:.2f}x across sizes")
+    else:
+        typer.echo("--source must be 'synthetic' or 'db'")
+        raise typer.Exit(code=1)
+    results["max_rss_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    typer.echo(f"Report written to {write_report('export', results)}")
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,134 @@
+"""
+Full versus incremental catalog featurization on synthetic IMDb-style TSVs.
+
+For each size, writes title.basics, title.ratings and title.principals for a catalog of that
+many movies and times a full build. Then adds `--new` releases and times:
+
+- appending them from a delta directory holding only the new titles,
+- appending them from a full snapshot of the dumps (the existing titles are skipped),
+- a full rebuild of the grown catalog, which is what adding titles used to require.
+
+    python -m benchmarks.bench_featurization --sizes 100000,500000 --new 2000
+"""
+import copy
+import csv
+import os
+import resource
+import tempfile
+
+import numpy as np
+import pandas as pd
+import typer
+
+from app import featurization
+
+from .common import Timer, write_report
+from .synthetic import synthetic_movies_df
+
+CATEGORIES = ["actor", "actress", "director", "writer", "producer", "composer", "self"]
+
+
+def write_imdb_tsvs(directory, movies_df, people_per_movie: int = 10, n_people: int = 0, seed: int = 0):
+    """Writes movies_df as title.basics/title.ratings TSVs, plus Zipf-distributed credits in title.principals"""
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+    options = dict(sep="\t", index=False, na_rep="\\N", quoting=csv.QUOTE_NONE)
+
+    basics = pd.DataFrame({
+        "tconst": movies_df["tconst"],
+        "titleType": np.where(rng.random(len(movies_df)) < 0.9, "movie", "tvEpisode"),
+        "primaryTitle": movies_df["primaryTitle"],
+        "originalTitle": movies_df["primaryTitle"],
+        "isAdult": 0,
+        "startYear": movies_df["startYear"],
+        "endYear": None,
+        "runtimeMinutes": rng.integers(60, 180, len(movies_df)),
+        "genres": movies_df["genres"],
+    })
+    basics.to_csv(os.path.join(directory, featurization.BASICS_FILE), **options)
+    movies_df[["tconst", "averageRating", "numVotes"]].to_csv(
+        os.path.join(directory, featurization.RATINGS_FILE), **options)
+
+    n_people = n_people or max(1000, len(movies_df) // 2)
+    per_movie = np.clip(rng.poisson(people_per_movie, len(movies_df)), 1, None)
+    tconsts = np.repeat(movies_df["tconst"].to_numpy(), per_movie)
+    people = (rng.zipf(1.3, len(tconsts)) - 1) % n_people
+    pd.DataFrame({
+        "tconst": tconsts,
+        "ordering": np.concatenate([np.arange(1, n + 1) for n in per_movie]),
+        "nconst": [f"nm{p:07d}" for p in people],
+        "category": rng.choice(CATEGORIES, len(tconsts)),
+        "job": None,
+        "characters": None,
+    }).to_csv(os.path.join(directory, featurization.PRINCIPALS_FILE), **options)
+
+
+def _releases(n_new, offset, seed):
+    """New synthetic titles with tconsts after the first `offset`"""
+    new_df = synthetic_movies_df(n_new, seed=seed)
+    new_df["tconst"] = [f"tt{offset + i:08d}" for i in range(n_new)]
+    return new_df
+
+
+def bench_size(n_movies, n_new, chunk_size, people_features, root, seed):
+    base_df = synthetic_movies_df(n_movies, seed=seed)
+    new_df = _releases(n_new, n_movies, seed + 1)
+    base_dir, delta_dir, snapshot_dir = (os.path.join(root, name) for name in ("base", "delta", "snapshot"))
+    write_imdb_tsvs(base_dir, base_df, seed=seed)
+    write_imdb_tsvs(delta_dir, new_df, seed=seed + 1)
+    write_imdb_tsvs(snapshot_dir, pd.concat([base_df, new_df], ignore_index=True), seed=seed)
+    input_bytes = sum(os.path.getsize(os.path.join(base_dir, f)) for f in os.listdir(base_dir))
+
+    with Timer() as full:
+        assets, vocabulary = featurization.build_assets(base_dir, chunk_size, min_votes=0,
+                                                        n_people_features=people_features)
+    n_built = len(assets['movies_df'])
+
+    timings = {}
+    for label, input_dir in [("append_delta", delta_dir), ("append_snapshot", snapshot_dir)]:
+        # Each append starts from the vocabulary of the full build
+        with Timer() as t:
+            grown, n_appended = featurization.append_assets(assets, copy.deepcopy(vocabulary), input_dir,
+                                                            chunk_size, min_votes=0)
+        timings[label] = t.elapsed
+        # Existing rows must come out unchanged
+        unchanged = (grown['people_tfidf_matrix'][:n_built] != assets['people_tfidf_matrix']).nnz == 0
+        typer.echo(f"[{n_movies}] {label}: {n_appended} titles in {t.elapsed:.2f}s (existing rows unchanged: "
+                   f"{unchanged})")
+
+    with Timer() as rebuild:
+        featurization.build_assets(snapshot_dir, chunk_size, min_votes=0,
+                                   n_people_features=people_features)
+
+    result = {
+        "movies": n_built,
+        "new_movies": n_appended,
+        "input_bytes": input_bytes,
+        "people_nnz": int(assets['people_tfidf_matrix'].nnz),
+        "full_build_seconds": full.elapsed,
+        "full_build_movies_per_second": n_built / full.elapsed,
+        "append_delta_seconds": timings["append_delta"],
+        "append_snapshot_seconds": timings["append_snapshot"],
+        "full_rebuild_seconds": rebuild.elapsed,
+        "rebuild_over_delta_append": rebuild.elapsed / timings["append_delta"],
+    }
+    typer.echo(f"[{n_movies}] full build {full.elapsed:.1f}s ({input_bytes / 1e6:.0f} MB of TSV), rebuild with "
+               f"{n_new} new titles {rebuild.elapsed:.1f}s vs delta append {timings['append_delta']:.2f}s "
+               f"({result['rebuild_over_delta_append']:.0f}x)")
+    return result
+
+
+def main(sizes: str = "100000,500000", new: int = 2000, chunk_size: int = featurization.FEATURIZE_CHUNK_SIZE,
+         people_features: int = featurization.PEOPLE_HASH_FEATURES, seed: int = 0):
+    results = {"new_titles": new, "chunk_size": chunk_size, "people_features": people_features, "sizes": []}
+    for n_movies in [int(s) for s in sizes.split(",") if s.strip()]:
+        with tempfile.TemporaryDirectory() as root:
+            results["sizes"].append(bench_size(n_movies, new, chunk_size, people_features, root, seed))
+    # Peak resident set size of the whole run (KiB on Linux)
+    results["max_rss_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    typer.echo(f"Max RSS {results['max_rss_bytes'] / 1e6:.0f} MB")
+    typer.echo(f"Report written to {write_report('featurization', results)}")
+
+
+if __name__ == "__main__":
+    typer.run(main)
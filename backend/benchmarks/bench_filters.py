@@ -0,0 +1,60 @@
+"""
+Compares the cost of filtered and unfiltered candidate ranking.
+
+Filters are combined from the bitset index into a candidate mask that rank_candidates
+applies before top-k selection:
+
+    python -m benchmarks.bench_filters --movies 100000
+"""
+import numpy as np
+import typer
+
+from app import catalog, filters, recommender
+
+from .common import Timer, summarize_latencies, write_report
+from .synthetic import synthetic_feature_matrices, synthetic_indices_map, synthetic_movies_df
+
+FILTER_CASES = {
+    "unfiltered": {},
+    "genre": {"genres": ["Drama"]},
+    "genre_years": {"genres": ["Sci-Fi", "Thriller"], "year_from": 1990, "year_to": 2010},
+    "narrow": {"genres": ["Western"], "year_from": 1950, "year_to": 1960, "min_rating": 7.5},
+}
+
+
+def main(movies: int = 100000, requests: int = 100, profile_size: int = 15, seed: int = 11):
+    df = synthetic_movies_df(movies, seed=seed)
+    people, genre = synthetic_feature_matrices(df, seed=seed)
+    indices_map = synthetic_indices_map(df)
+    movie_catalog = catalog.MovieCatalog(df, indices_map)
+
+    with Timer() as build:
+        filter_index = filters.FilterIndex(df)
+    typer.echo(f"Built filter index in {build.elapsed:.2f}s ({filter_index.nbytes / 1e6:.1f} MB)")
+
+    rng = np.random.default_rng(seed)
+    profiles = [list(indices_map.index[rng.choice(len(indices_map), profile_size, replace=False)]) for _ in range(requests)]
+
+    results = {"movies": movies, "index_build_seconds": build.elapsed, "index_bytes": filter_index.nbytes}
+    for name, case in FILTER_CASES.items():
+        mask_times, rank_times = [], []
+        for profile in profiles:
+            with Timer() as t_mask:
+                mask = filter_index.candidate_mask(**case)
+            with Timer() as t_rank:
+                recommender.rank_candidates(profile, movie_catalog, people, genre, candidate_mask=mask)
+            mask_times.append(t_mask.elapsed)
+            rank_times.append(t_rank.elapsed)
+        results[name] = {
+            "mask": summarize_latencies(mask_times),
+            "rank": summarize_latencies(rank_times),
+            "eligible": int(mask.sum()) if mask is not None else movies,
+        }
+        typer.echo(f"{name:>11}: mask p50 {results[name]['mask']['p50_ms']:.3f} ms, "
+                   f"rank p50 {results[name]['rank']['p50_ms']:.2f} ms ({results[name]['eligible']} eligible)")
+
+    typer.echo(f"Report written to {write_report('filters', results)}")
+
+
+if __name__ == "__main__":
+    typer.run(main)
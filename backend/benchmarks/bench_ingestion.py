@@ -0,0 +1,113 @@
+"""
+Measures interaction write throughput and end-to-end visibility latency,
+per-request transactions versus the write-behind ingestion queue.
+
+Needs a seeded database (run it inside the `api` container):
+
+    python -m benchmarks.bench_ingestion --events 20000 --producers 8
+"""
+import random
+import threading
+import uuid
+
+import typer
+
+from app import crud, database, ingestion, models, schemas
+
+from .common import Timer, summarize_latencies, write_report
+
+
+def _make_users(n_users):
+    db = database.SessionLocal()
+    try:
+        users = [
+            crud.create_user(db, schemas.UserCreate(email=f"ingest-{uuid.uuid4().hex[:10]}@example.com",
+                                                    password="benchmark"))
+            for _ in range(n_users)
+        ]
+        tconsts = [t for (t,) in db.query(models.Movie.tconst).order_by(models.Movie.numVotes.desc()).limit(500)]
+        return [u.id for u in users], tconsts
+    finally:
+        db.close()
+
+
+def _events(user_ids, tconsts, n_events, seed):
+    rng = random.Random(seed)
+    return [(rng.choice(user_ids), rng.choice(tconsts), rng.choice(["like", "like", "dislike"]))
+            for _ in range(n_events)]
+
+
+def _run_producers(events, producers, handle):
+    chunks = [events[i::producers] for i in range(producers)]
+    threads = [threading.Thread(target=lambda c=c: [handle(*e) for e in c]) for c in chunks]
+    with Timer() as t:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return t.elapsed
+
+
+def bench_sync(events, producers):
+    latencies = []
+
+    def handle(user_id, tconst, interaction_type):
+        db = database.SessionLocal()
+        try:
+            with Timer() as t:
+                crud.create_or_update_interaction(db, user_id, schemas.InteractionCreate(
+                    tconst=tconst, interaction_type=interaction_type))
+            latencies.append(t.elapsed)
+        finally:
+            db.close()
+
+    elapsed = _run_producers(events, producers, handle)
+    return {
+        "events_per_second": len(events) / elapsed,
+        "visibility_latency": summarize_latencies(latencies),
+    }
+
+
+def bench_queued(events, producers, batch_size, flush_interval_ms):
+    ingestor = ingestion.InteractionIngestor(batch_size=batch_size, flush_interval_ms=flush_interval_ms)
+    ingestor.start()
+    enqueue_latencies = []
+
+    def handle(user_id, tconst, interaction_type):
+        with Timer() as t:
+            ingestor.submit(user_id, tconst, interaction_type, timeout=30)
+        enqueue_latencies.append(t.elapsed)
+
+    with Timer() as total:
+        accept_elapsed = _run_producers(events, producers, handle)
+        ingestor.stop()
+    stats = ingestor.get_stats()
+    return {
+        "accepted_events_per_second": len(events) / accept_elapsed,
+        "committed_events_per_second": len(events) / total.elapsed,
+        "enqueue_latency": summarize_latencies(enqueue_latencies),
+        "visibility_latency": summarize_latencies(stats.pop("visibility_latencies")),
+        "stats": stats,
+    }
+
+
+def main(events: int = 20000, producers: int = 8, users: int = 200, batch_size: int = 500,
+         flush_interval_ms: int = 200, seed: int = 7):
+    user_ids, tconsts = _make_users(users)
+    workload = _events(user_ids, tconsts, events, seed)
+
+    results = {
+        "config": {"events": events, "producers": producers, "users": users,
+                   "batch_size": batch_size, "flush_interval_ms": flush_interval_ms},
+        "sync": bench_sync(workload, producers),
+        "queued": bench_queued(workload, producers, batch_size, flush_interval_ms),
+    }
+    typer.echo(f"sync:   {results['sync']['events_per_second']:.0f} events/s, visibility p99 "
+               f"{results['sync']['visibility_latency']['p99_ms']:.1f} ms")
+    typer.echo(f"queued: {results['queued']['committed_events_per_second']:.0f} events/s, visibility p99 "
+               f"{results['queued']['visibility_latency']['p99_ms']:.1f} ms")
+    typer.echo(f"Report written to {write_report('ingestion', results)}")
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,219 @@
+"""
+Interactions query latency at scale: the month-partitioned table and the user_recent_likes
+rollup versus a single unpartitioned table.
+
+Loads `--rows` synthetic interactions spread over the last `--months` months into the
+partitioned interactions table (creating the monthly partitions it needs), and copies the same
+rows into a single table with the same indexes. Then times:
+
+- the taste-profile read: crud.get_user_liked_movies (served from the rollup) against the same
+  "latest likes" query on the partitioned table and on the single table,
+- a training-style read of the last 30 days of likes (partition pruning versus an index range
+  scan), with the number of partitions the plan touches,
+- retiring the oldest month: DETACH PARTITION versus DELETE on the single table (both rolled back).
+
+Needs a migrated and seeded database (run it inside the `api` container). The synthetic users
+and their interactions are removed at the end unless --keep is given:
+
+    python -m benchmarks.bench_partitions --rows 10000000 --users 200000 --months 24
+"""
+import json
+import random
+from datetime import datetime, timezone
+
+import typer
+from sqlalchemy import text
+
+from app import crud, database, partitions
+
+from .common import Timer, summarize_latencies, write_report
+
+EMAIL_PREFIX = "bench-partitions-"
+FLAT_TABLE = "bench_interactions_flat"
+
+LATEST_LIKES_SQL = """
+    SELECT m."primaryTitle", m."startYear" FROM {table} i JOIN movies m ON m.id = i.movie_id
+    WHERE i.user_id = CAST(:user_id AS uuid) AND i.interaction_type = 'like'
+    ORDER BY i.created_at DESC LIMIT :limit
+"""
+WINDOW_SQL = "SELECT count(*) FROM {table} WHERE interaction_type = 'like' AND created_at >= now() - interval '30 days'"
+
+
+def _create_users(db, n_users):
+    db.execute(text("""
+        INSERT INTO users (id, email, hashed_password)
+        SELECT gen_random_uuid(), :prefix || n || '@example.com', 'benchmark' FROM generate_series(1, :n) n
+    """), {"prefix": EMAIL_PREFIX, "n": n_users})
+    db.execute(text("DROP TABLE IF EXISTS bench_users"))
+    db.execute(text("""
+        CREATE TABLE bench_users AS
+        SELECT row_number() OVER (ORDER BY id) AS n, id FROM users WHERE email LIKE :pattern
+    """), {"pattern": f"{EMAIL_PREFIX}%"})
+    db.execute(text("CREATE INDEX ON bench_users (n)"))
+    db.commit()
+
+
+def _load_month(db, month, rows, n_users, like_share):
+    """Inserts `rows` interactions dated within `month`; activity is skewed towards low user numbers"""
+    partitions.skip_rollup(db)
+    db.execute(text("""
+        INSERT INTO interactions (user_id, movie_id, interaction_type, created_at)
+        SELECT bu.id, m.ids[1 + floor(random() * m.n)::int],
+               CASE WHEN random() < :like_share THEN 'like' ELSE 'dislike' END,
+               CAST(:start AS timestamptz) + random() * (CAST(:end AS timestamptz) - CAST(:start AS timestamptz))
+        FROM (SELECT 1 + floor(:users * power(random(), 2))::bigint AS n FROM generate_series(1, :rows)) g
+        JOIN bench_users bu ON bu.n = g.n
+        CROSS JOIN (SELECT array_agg(id) AS ids, count(*) AS n FROM movies) m
+    """), {"like_share": like_share, "start": month, "end": partitions.add_months(month, 1),
+           "users": n_users, "rows": rows})
+    db.commit()
+
+
+def _build_flat_copy(db):
+    db.execute(text(f"DROP TABLE IF EXISTS {FLAT_TABLE}"))
+    db.execute(text(f"""
+        CREATE TABLE {FLAT_TABLE} AS
+        SELECT i.* FROM interactions i JOIN bench_users bu ON bu.id = i.user_id
+    """))
+    db.execute(text(f"ALTER TABLE {FLAT_TABLE} ADD PRIMARY KEY (id)"))
+    db.execute(text(f"CREATE INDEX ON {FLAT_TABLE} (user_id, interaction_type, created_at)"))
+    db.execute(text(f"CREATE INDEX ON {FLAT_TABLE} (user_id, movie_id)"))
+    db.execute(text(f"CREATE INDEX ON {FLAT_TABLE} (created_at)"))
+    db.commit()
+    db.execute(text(f"ANALYZE {FLAT_TABLE}"))
+    db.execute(text("ANALYZE interactions"))
+    db.execute(text("ANALYZE user_recent_likes"))
+    db.commit()
+
+
+def _time_queries(db, user_ids, limit):
+    timings = {"rollup": [], "partitioned": [], "single_table": []}
+    for user_id in user_ids:
+        with Timer() as t:
+            crud.get_user_liked_movies(db, user_id, limit)
+        timings["rollup"].append(t.elapsed)
+        for label, table in [("partitioned", "interactions"), ("single_table", FLAT_TABLE)]:
+            with Timer() as t:
+                db.execute(text(LATEST_LIKES_SQL.format(table=table)), {"user_id": user_id, "limit": limit}).all()
+            timings[label].append(t.elapsed)
+    db.rollback()
+    return {label: summarize_latencies(samples) for label, samples in timings.items()}
+
+
+def _scanned_relations(db, sql):
+    """Names of the tables or partitions a query's plan reads"""
+    plan = db.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+    plan = json.loads(plan) if isinstance(plan, str) else plan
+    relations = set()
+
+    def visit(node):
+        if "Relation Name" in node:
+            relations.add(node["Relation Name"])
+        for child in node.get("Plans", []):
+            visit(child)
+
+    visit(plan[0]["Plan"])
+    return sorted(relations)
+
+
+def _time_window(db, repeats):
+    result = {}
+    for label, table in [("partitioned", "interactions"), ("single_table", FLAT_TABLE)]:
+        samples = []
+        for _ in range(repeats):
+            with Timer() as t:
+                db.execute(text(WINDOW_SQL.format(table=table))).scalar()
+            samples.append(t.elapsed)
+        result[label] = summarize_latencies(samples)
+        result[label]["relations_scanned"] = len(_scanned_relations(db, WINDOW_SQL.format(table=table)))
+    db.rollback()
+    return result
+
+
+def _time_retire(db, oldest_month):
+    """Seconds to drop the oldest month from each layout, rolled back afterwards"""
+    name = partitions.partition_name(oldest_month)
+    start, end = oldest_month, partitions.add_months(oldest_month, 1)
+    with Timer() as detach:
+        db.execute(text(f"ALTER TABLE interactions DETACH PARTITION {name}"))
+    db.rollback()
+    with Timer() as delete:
+        deleted = db.execute(text(f"DELETE FROM {FLAT_TABLE} WHERE created_at >= :start AND created_at < :end"),
+                             {"start": start, "end": end}).rowcount
+    db.rollback()
+    return {"partition": name, "rows": deleted, "detach_seconds": detach.elapsed, "delete_seconds": delete.elapsed}
+
+
+def _cleanup(db):
+    typer.echo("Removing the synthetic users and their interactions...")
+    partitions.skip_rollup(db)
+    db.execute(text("DELETE FROM interactions i USING bench_users bu WHERE i.user_id = bu.id"))
+    db.execute(text("DELETE FROM users u USING bench_users bu WHERE u.id = bu.id"))
+    db.execute(text(f"DROP TABLE IF EXISTS {FLAT_TABLE}"))
+    db.execute(text("DROP TABLE IF EXISTS bench_users"))
+    db.commit()
+
+
+def main(rows: int = 10_000_000, users: int = 200_000, months: int = 24, like_share: float = 0.67,
+         samples: int = 500, limit: int = 15, repeats: int = 5, keep: bool = False, seed: int = 0):
+    db = database.SessionLocal()
+    users_created = False
+    try:
+        if not db.execute(text("SELECT count(*) FROM movies")).scalar():
+            typer.echo("The movies table is empty; run seed-db-command first.")
+            raise typer.Exit(code=1)
+
+        current = partitions.month_start(datetime.now(timezone.utc))
+        month_list = [partitions.add_months(current, -n) for n in range(months - 1, -1, -1)]
+        existing = {p["name"] for p in partitions.list_partitions(db)}
+        with Timer() as create:
+            for month in month_list:
+                if partitions.partition_name(month) not in existing:
+                    partitions.create_partition(db, month)
+        typer.echo(f"Partitions ready for {months} months in {create.elapsed:.2f}s")
+
+        _create_users(db, users)
+        users_created = True
+        with Timer() as load:
+            for month in month_list:
+                _load_month(db, month, rows // months, users, like_share)
+        loaded = (rows // months) * months
+        typer.echo(f"Loaded {loaded:,} interactions in {load.elapsed:.0f}s ({loaded / load.elapsed:,.0f} rows/s)")
+
+        user_ids = [str(u) for (u,) in db.execute(text("SELECT id FROM bench_users"))]
+        with Timer() as rollup:
+            rollup_rows = partitions.rebuild_recent_likes(db, user_ids)
+        typer.echo(f"Built user_recent_likes ({rollup_rows:,} rows) in {rollup.elapsed:.1f}s")
+        with Timer() as flat:
+            _build_flat_copy(db)
+        typer.echo(f"Built the single-table copy in {flat.elapsed:.0f}s")
+
+        sample = random.Random(seed).sample(user_ids, min(samples, len(user_ids)))
+        profile_reads = _time_queries(db, sample, limit)
+        for label, latency in profile_reads.items():
+            typer.echo(f"taste profile via {label}: p50 {latency['p50_ms']:.2f} ms, p99 {latency['p99_ms']:.2f} ms")
+        window_reads = _time_window(db, repeats)
+        for label, latency in window_reads.items():
+            typer.echo(f"last-30-days likes via {label}: p50 {latency['p50_ms']:.0f} ms "
+                       f"({latency['relations_scanned']} relations scanned)")
+        retire = _time_retire(db, month_list[0])
+        typer.echo(f"retiring {retire['partition']} ({retire['rows']:,} rows): detach {retire['detach_seconds']:.3f}s, "
+                   f"single-table delete {retire['delete_seconds']:.1f}s")
+
+        results = {
+            "rows": loaded, "users": users, "months": months, "like_share": like_share, "limit": limit,
+            "load_seconds": load.elapsed, "load_rows_per_second": loaded / load.elapsed,
+            "rollup_rows": rollup_rows, "rollup_build_seconds": rollup.elapsed,
+            "profile_reads": profile_reads, "window_reads": window_reads, "retire_oldest_month": retire,
+            "partitions": [{k: v for k, v in p.items() if k != "month"} for p in partitions.list_partitions(db)],
+        }
+        typer.echo(f"Report written to {write_report('partitions', results)}")
+    finally:
+        if users_created and not keep:
+            db.rollback()
+            _cleanup(db)
+        db.close()
+
+
+if __name__ == "__main__":
+    typer.run(main)
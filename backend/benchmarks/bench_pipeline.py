@@ -0,0 +1,149 @@
+"""
+Stage-by-stage benchmark of the recommendation pipeline.
+
+Runs the stages of recommender.rank_candidates (lookup, aggregation, similarity, candidate
+selection, re-rank) on synthetic catalogs of several sizes, plus TMDb enrichment of a
+20-movie page against a local stub server, and writes p50/p95/p99 latency, throughput and
+peak memory per catalog size to a JSON report:
+
+    python -m benchmarks.bench_pipeline --sizes 10000,100000,1000000
+
+Compare reports from two runs to see whether a change made /recommendations faster or slower.
+"""
+import resource
+import time
+import tracemalloc
+
+import numpy as np
+import typer
+
+from app import catalog, enricher, recommender
+
+from .common import Timer, summarize_latencies, write_report
+from .loadtest.fake_tmdb import start_fake_tmdb
+from .synthetic import synthetic_feature_matrices, synthetic_indices_map, synthetic_movies_df
+
+STAGES = ["lookup", "aggregation", "similarity", "candidate_selection", "rerank"]
+PAGE_SIZE = 20
+
+
+def run_pipeline(profile, movie_catalog, people, genre, timings=None):
+    """
+    Runs the rank_candidates stages in order, recording each stage's wall time in `timings`.
+
+    Returns:
+        Tuple of (positions, final_scores), like rank_candidates.
+    """
+    def timed(stage, fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        if timings is not None:
+            timings[stage].append(time.perf_counter() - start)
+        return result
+
+    valid = timed("lookup", recommender.lookup_profile, profile, movie_catalog)
+    avg_people, avg_genre = timed("aggregation", recommender.aggregate_profile, valid, people, genre)
+    scores = timed("similarity", recommender.content_similarity, avg_people, avg_genre, people, genre)
+    positions, content_scores = timed("candidate_selection", recommender.select_candidates, scores, valid)
+    return timed("rerank", recommender.rerank_candidates, movie_catalog, positions, content_scores)
+
+
+def bench_catalog(n_movies, requests, profile_size, seed):
+    with Timer() as gen:
+        df = synthetic_movies_df(n_movies, seed=seed)
+        people, genre = synthetic_feature_matrices(df, seed=seed)
+        indices_map = synthetic_indices_map(df)
+        movie_catalog = catalog.MovieCatalog(df, indices_map)
+    typer.echo(f"[{n_movies}] generated catalog in {gen.elapsed:.1f}s "
+               f"(people {people.shape[1]} cols, {people.nnz / n_movies:.1f} nnz/row)")
+
+    rng = np.random.default_rng(seed)
+    profiles = [list(indices_map.index[rng.choice(len(indices_map), profile_size, replace=False)])
+                for _ in range(requests)]
+
+    # Warm-up, so one-off allocations and lazy imports don't land in the first sample
+    run_pipeline(profiles[0], movie_catalog, people, genre)
+
+    timings = {stage: [] for stage in STAGES}
+    totals = []
+    with Timer() as wall:
+        for profile in profiles:
+            with Timer() as t:
+                run_pipeline(profile, movie_catalog, people, genre, timings)
+            totals.append(t.elapsed)
+
+    # Peak memory is measured in a separate pass because tracing slows allocation down
+    tracemalloc.start()
+    run_pipeline(profiles[0], movie_catalog, people, genre)
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = {
+        "movies": n_movies,
+        "people_nnz": int(people.nnz),
+        "stages": {stage: summarize_latencies(samples) for stage, samples in timings.items()},
+        "total": summarize_latencies(totals),
+        "throughput_rps": requests / wall.elapsed,
+        "peak_request_memory_bytes": peak_bytes,
+    }
+    typer.echo(f"[{n_movies}] total p50 {result['total']['p50_ms']:.2f} ms, "
+               f"p99 {result['total']['p99_ms']:.2f} ms, {result['throughput_rps']:.1f} req/s, "
+               f"peak {peak_bytes / 1e6:.1f} MB per request")
+    for stage in STAGES:
+        s = result["stages"][stage]
+        typer.echo(f"    {stage:>19}: p50 {s['p50_ms']:8.3f} ms  p95 {s['p95_ms']:8.3f} ms  p99 {s['p99_ms']:8.3f} ms")
+    return result, movie_catalog
+
+
+def bench_enrichment(movie_catalog, requests, latency_ms):
+    server, base_url = start_fake_tmdb(latency_ms)
+    saved = enricher.TMDB_API_KEY, enricher.TMDB_API_URL
+    enricher.TMDB_API_KEY, enricher.TMDB_API_URL = "benchmark", base_url
+    try:
+        rng = np.random.default_rng(0)
+        samples = []
+        with Timer() as wall:
+            for _ in range(requests):
+                page = rng.choice(len(movie_catalog), PAGE_SIZE, replace=False)
+                with Timer() as t:
+                    enricher.enrich_recommendations(movie_catalog, page)
+                samples.append(t.elapsed)
+    finally:
+        enricher.TMDB_API_KEY, enricher.TMDB_API_URL = saved
+        server.shutdown()
+
+    result = {
+        "page_size": PAGE_SIZE,
+        "stub_latency_ms": latency_ms,
+        "latency": summarize_latencies(samples),
+        "throughput_rps": requests / wall.elapsed,
+    }
+    typer.echo(f"enrichment ({PAGE_SIZE} movies, stub latency {latency_ms} ms): "
+               f"p50 {result['latency']['p50_ms']:.1f} ms, p99 {result['latency']['p99_ms']:.1f} ms")
+    return result
+
+
+def main(
+    sizes: str = "10000,100000,1000000",
+    requests: int = 50,
+    profile_size: int = 15,
+    enrich_requests: int = 20,
+    stub_latency_ms: float = 0.0,
+    seed: int = 7,
+):
+    results = {"requests": requests, "profile_size": profile_size, "catalogs": []}
+    movie_catalog = None
+    for n_movies in [int(s) for s in sizes.split(",") if s.strip()]:
+        catalog_result, movie_catalog = bench_catalog(n_movies, requests, profile_size, seed)
+        results["catalogs"].append(catalog_result)
+
+    if movie_catalog is not None and enrich_requests > 0:
+        results["enrichment"] = bench_enrichment(movie_catalog, enrich_requests, stub_latency_ms)
+
+    # Peak resident set size of the whole run (KiB on Linux)
+    results["max_rss_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    typer.echo(f"Report written to {write_report('pipeline', results)}")
+
+
+if __name__ == "__main__":
+    typer.run(main)
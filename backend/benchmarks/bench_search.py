@@ -0,0 +1,71 @@
+"""
+Benchmarks the in-memory title search index.
+
+By default runs over the full catalog from the Hugging Face Hub; pass --synthetic N to
+use a generated catalog of N movies instead:
+
+    python -m benchmarks.bench_search
+    python -m benchmarks.bench_search --synthetic 1000000
+"""
+import random
+
+import typer
+
+from app import search
+from app.model_loader import load_model_assets
+
+from .common import Timer, summarize_latencies, write_report
+from .synthetic import synthetic_movies_df
+
+
+def _keystroke_queries(movies_df, n_queries, seed):
+    # Simulate typing: random prefixes of popular titles, weighted towards short ones
+    rng = random.Random(seed)
+    popular = movies_df.nlargest(min(len(movies_df), 20000), 'numVotes')['primaryTitle'].tolist()
+    queries = []
+    for _ in range(n_queries):
+        title = search.normalize(rng.choice(popular))
+        if not title:
+            continue
+        queries.append(title[:rng.randint(1, min(len(title), 20))])
+    return queries
+
+
+def main(synthetic: int = 0, queries: int = 20000, limit: int = 10, seed: int = 3):
+    if synthetic:
+        movies_df = synthetic_movies_df(synthetic, seed=seed)
+    else:
+        movies_df = load_model_assets(build_indexes=False)['movies_df']
+
+    with Timer() as build:
+        index = search.build_search_index(movies_df)
+    typer.echo(f"Built index over {len(index)} titles in {build.elapsed:.1f}s "
+               f"({index.nbytes / 1e6:.1f} MB of postings)")
+
+    workload = _keystroke_queries(movies_df, queries, seed)
+    for q in workload[:200]:
+        index.search(q, limit=limit)  # warm-up
+
+    latencies = []
+    for q in workload:
+        with Timer() as t:
+            index.search(q, limit=limit)
+        latencies.append(t.elapsed)
+
+    results = {
+        "catalog_size": len(index),
+        "source": f"synthetic:{synthetic}" if synthetic else "hub",
+        "build_seconds": build.elapsed,
+        "postings_bytes": index.nbytes,
+        "prefix_keys": len(index.prefix_postings),
+        "ngram_keys": len(index.ngram_postings),
+        "query_latency": summarize_latencies(latencies),
+    }
+    lat = results["query_latency"]
+    typer.echo(f"{lat['count']} queries: p50 {lat['p50_ms']:.3f} ms, p95 {lat['p95_ms']:.3f} ms, "
+               f"p99 {lat['p99_ms']:.3f} ms")
+    typer.echo(f"Report written to {write_report('search', results)}")
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,82 @@
+"""
+Measures how sharded similarity scoring scales with threads.
+
+Compares the single-pass path (content_similarity + select_candidates) with
+sharding.ShardedScorer on 1, 2, 4, ... threads up to --max-threads, and checks that both
+select the same candidates:
+
+    python -m benchmarks.bench_sharding --movies 1000000 --shards 8 --max-threads 8
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import typer
+
+from app import catalog, recommender, sharding
+
+from .common import Timer, summarize_latencies, write_report
+from .synthetic import synthetic_feature_matrices, synthetic_indices_map, synthetic_movies_df
+
+
+def _thread_counts(max_threads):
+    counts = []
+    n = 1
+    while n < max_threads:
+        counts.append(n)
+        n *= 2
+    return counts + [max_threads]
+
+
+def main(movies: int = 1000000, shards: int = 0, max_threads: int = 0, requests: int = 30,
+         profile_size: int = 15, seed: int = 5):
+    max_threads = max_threads or os.cpu_count() or 1
+    shards = shards or max_threads
+
+    df = synthetic_movies_df(movies, seed=seed)
+    people, genre = synthetic_feature_matrices(df, seed=seed)
+    indices_map = synthetic_indices_map(df)
+    movie_catalog = catalog.MovieCatalog(df, indices_map)
+    rng = np.random.default_rng(seed)
+    profiles = [list(indices_map.index[rng.choice(len(indices_map), profile_size, replace=False)])
+                for _ in range(requests)]
+    vectors = []
+    for profile in profiles:
+        valid = recommender.lookup_profile(profile, movie_catalog)
+        vectors.append((valid, *recommender.aggregate_profile(valid, people, genre)))
+
+    with Timer() as build:
+        scorer = sharding.ShardedScorer(people, genre, shards)
+    typer.echo(f"{movies} movies, {len(scorer)} shards built in {build.elapsed:.2f}s, host has {os.cpu_count()} cores")
+
+    baseline_times, baseline_results = [], []
+    for valid, avg_people, avg_genre in vectors:
+        with Timer() as t:
+            scores = recommender.content_similarity(avg_people, avg_genre, people, genre)
+            baseline_results.append(recommender.select_candidates(scores, valid)[0])
+        baseline_times.append(t.elapsed)
+    baseline = summarize_latencies(baseline_times)
+    typer.echo(f"single pass        : p50 {baseline['p50_ms']:8.2f} ms  p99 {baseline['p99_ms']:8.2f} ms")
+
+    results = {"movies": movies, "shards": len(scorer), "build_seconds": build.elapsed,
+               "single_pass": baseline, "sharded": []}
+    for threads in _thread_counts(max_threads):
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            times, overlaps = [], []
+            for (valid, avg_people, avg_genre), expected in zip(vectors, baseline_results):
+                with Timer() as t:
+                    positions, _ = scorer.top_candidates(avg_people, avg_genre, valid, executor=executor)
+                times.append(t.elapsed)
+                overlaps.append(len(np.intersect1d(positions, expected)) / max(1, len(expected)))
+        latency = summarize_latencies(times)
+        speedup = baseline["p50_ms"] / latency["p50_ms"]
+        results["sharded"].append({"threads": threads, "latency": latency, "speedup_p50": speedup,
+                                   "min_candidate_overlap": float(min(overlaps))})
+        typer.echo(f"sharded, {threads:>2} threads: p50 {latency['p50_ms']:8.2f} ms  p99 {latency['p99_ms']:8.2f} ms  "
+                   f"speedup {speedup:5.2f}x  candidate overlap {min(overlaps):.3f}")
+
+    typer.echo(f"Report written to {write_report('sharding', results)}")
+
+
+if __name__ == "__main__":
+    typer.run(main)
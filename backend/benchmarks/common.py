@@ -0,0 +1,69 @@
+# Shared helpers for the benchmark scripts in this package.
+import json
+import os
+import platform
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+
+def summarize_latencies(samples_seconds):
+    """
+    Summarizes a list of latency samples (in seconds).
+
+    Returns:
+        Dict with count, mean and p50/p95/p99/max in milliseconds.
+    """
+    if not samples_seconds:
+        return {"count": 0}
+    values = np.asarray(samples_seconds, dtype=np.float64) * 1000.0
+    return {
+        "count": int(values.size),
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "max_ms": float(values.max()),
+    }
+
+
+def write_report(name, results, output_dir=None):
+    """
+    Writes a benchmark report as JSON so runs can be compared over time.
+
+    Args:
+        name: Short benchmark name, used as the file name prefix.
+        results: JSON-serialisable dict of results.
+        output_dir: Directory for the report (defaults to $BENCHMARK_OUTPUT_DIR or ./benchmark_results).
+
+    Returns:
+        The path of the written file.
+    """
+    output_dir = output_dir or os.getenv("BENCHMARK_OUTPUT_DIR", "benchmark_results")
+    os.makedirs(output_dir, exist_ok=True)
+    timestamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    path = os.path.join(output_dir, f"{name}_{timestamp}.json")
+    report = {
+        "benchmark": name,
+        "timestamp": timestamp,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+    return path
+
+
+class Timer:
+    """Context manager that records the elapsed wall time in seconds."""
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+        return False
@@ -0,0 +1,6 @@
+# End-to-end load harness: replays a mix of user sessions against the whole FastAPI app,
+# backed by a local Postgres, synthetic model assets and a fake TMDb server.
+#
+#     docker compose -f benchmarks/loadtest/docker-compose.yml up -d
+#     python -m benchmarks.loadtest.prepare --movies 50000
+#     python -m benchmarks.loadtest.run --rates 1,2,4,8 --stage-seconds 60
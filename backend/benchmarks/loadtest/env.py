@@ -0,0 +1,25 @@
+# Environment for the app and the harness during load tests.
+# Matches benchmarks/loadtest/docker-compose.yml; any variable already set in the
+# environment wins, so the harness can also target another Postgres.
+import os
+
+DEFAULTS = {
+    "POSTGRES_USER": "loadtest",
+    "POSTGRES_PASSWORD": "loadtest",
+    "POSTGRES_DB": "loadtest",
+    "POSTGRES_HOST": "127.0.0.1",
+    "POSTGRES_PORT": "55432",
+    "SECRET_KEY": "loadtest-secret",
+    "ALGORITHM": "HS256",
+    "ACCESS_TOKEN_EXPIRE_MINUTES": "120",
+    "TMDB_API_KEY": "loadtest",
+}
+
+
+def loadtest_env(**overrides):
+    """The current environment with the load-test defaults filled in, plus overrides"""
+    env = dict(os.environ)
+    for key, value in DEFAULTS.items():
+        env.setdefault(key, value)
+    env.update({k: str(v) for k, v in overrides.items()})
+    return env
@@ -0,0 +1,87 @@
+"""
+Fake TMDb API for benchmarks and load tests.
+
+Answers /find/<tconst> like TMDb does, after an injectable delay, and fails a configurable
+fraction of requests, so enrichment can be exercised without calling the real API:
+
+    python -m benchmarks.loadtest.fake_tmdb --port 8901 --latency-ms 80 --jitter-ms 40 --error-rate 0.01
+
+Point the app at it with TMDB_API_URL=http://127.0.0.1:8901 and any TMDB_API_KEY.
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import typer
+
+
+class _FakeTMDbHandler(BaseHTTPRequestHandler):
+    latency_seconds = 0.0
+    jitter_seconds = 0.0
+    error_rate = 0.0
+
+    def do_GET(self):
+        delay = self.latency_seconds + random.uniform(0, self.jitter_seconds)
+        if delay:
+            time.sleep(delay)
+
+        if self.error_rate and random.random() < self.error_rate:
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        tconst = self.path.split("?")[0].rsplit("/", 1)[-1]
+        body = json.dumps({"movie_results": [
+            {"poster_path": f"/{tconst}.jpg", "overview": f"Overview of {tconst}."}
+        ]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fake_tmdb(latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0,
+                    host: str = "127.0.0.1", port: int = 0):
+    """
+    Starts the fake TMDb server in a background thread.
+
+    Args:
+        latency_ms: Fixed delay added to every response.
+        jitter_ms: Extra uniformly random delay, up to this much.
+        error_rate: Fraction of requests answered with 503.
+        port: Port to listen on; 0 picks a free one.
+
+    Returns:
+        Tuple of (server, base_url). Call server.shutdown() when done.
+    """
+    handler = type("Handler", (_FakeTMDbHandler,), {
+        "latency_seconds": latency_ms / 1000.0,
+        "jitter_seconds": jitter_ms / 1000.0,
+        "error_rate": error_rate,
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main(port: int = 8901, latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0):
+    server, base_url = start_fake_tmdb(latency_ms, jitter_ms, error_rate, port=port)
+    typer.echo(f"Fake TMDb listening on {base_url} (latency {latency_ms}+{jitter_ms} ms, "
+               f"error rate {error_rate:.1%}). Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,69 @@
+"""
+Prepares a load-test environment: writes synthetic model assets for MODEL_ASSETS_DIR,
+migrates the local Postgres and seeds its movies table from the same catalog.
+
+    python -m benchmarks.loadtest.prepare --movies 50000 --assets-dir loadtest_assets
+"""
+import os
+import subprocess
+import sys
+
+import joblib
+import typer
+
+from ..synthetic import synthetic_feature_matrices, synthetic_indices_map, synthetic_movies_df
+from .env import loadtest_env
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def write_assets(assets_dir: str, movies: int, seed: int = 0):
+    """
+    Writes synthetic movies_df, TF-IDF matrices and indices_map as the .pkl files
+    model_loader expects.
+
+    Returns:
+        The movies DataFrame that was written.
+    """
+    os.makedirs(assets_dir, exist_ok=True)
+    movies_df = synthetic_movies_df(movies, seed=seed)
+    people_matrix, genre_matrix = synthetic_feature_matrices(movies_df, seed=seed)
+    indices_map = synthetic_indices_map(movies_df)
+
+    for name, value in [
+        ("movies_df", movies_df),
+        ("people_tfidf_matrix", people_matrix),
+        ("genre_tfidf_matrix", genre_matrix),
+        ("indices_map", indices_map),
+    ]:
+        joblib.dump(value, os.path.join(assets_dir, f"{name}.pkl"))
+    return movies_df
+
+
+def main(movies: int = 50000, assets_dir: str = "loadtest_assets", seed: int = 0, skip_db: bool = False):
+    assets_dir = os.path.abspath(assets_dir)
+    typer.echo(f"Writing {movies} synthetic movies to {assets_dir}...")
+    movies_df = write_assets(assets_dir, movies, seed)
+
+    if skip_db:
+        return
+
+    env = loadtest_env()
+    typer.echo(f"Migrating Postgres at {env['POSTGRES_HOST']}:{env['POSTGRES_PORT']}...")
+    subprocess.run([sys.executable, "-m", "alembic", "upgrade", "head"], cwd=BACKEND_DIR, env=env, check=True)
+
+    # The app reads its database settings at import time
+    os.environ.update(env)
+    from app import database, seed_db
+
+    db = database.SessionLocal()
+    try:
+        seed_db.seed_movies_table(db, movies_df)
+    finally:
+        db.close()
+
+    typer.echo(f"Done. Run the harness with --assets-dir {assets_dir}")
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,287 @@
+"""
+Replays a mix of user sessions against the whole FastAPI app at increasing arrival rates
+and reports latency percentiles, error rates and the saturation point per route.
+
+Starts the app (uvicorn) with the local assets written by `prepare` and a fake TMDb server,
+unless --base-url points at an app that is already running:
+
+    python -m benchmarks.loadtest.run --rates 1,2,4,8 --stage-seconds 60 \
+        --mix new_user=0.2,returning_user=0.5,multi_tab=0.1,browser=0.2 --tmdb-latency-ms 80
+
+Sessions arrive as a Poisson process at each rate (sessions per second) for --stage-seconds.
+A rate saturates a route when the route's p99 exceeds --slo-p99-ms or its error rate
+(transport errors and 5xx) exceeds --max-error-rate. Each stage also reports how many
+recommendation rankings and TMDb lookups were coalesced with an identical one in flight.
+"""
+import asyncio
+import os
+import random
+import re
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+import httpx
+import joblib
+import typer
+
+from ..common import summarize_latencies, write_report
+from ..synthetic import GENRES
+from .env import loadtest_env
+from .fake_tmdb import start_fake_tmdb
+from .prepare import BACKEND_DIR
+from .scenarios import SCENARIOS, Catalog, Recorder, Session
+
+# Scenarios that log in as one of the users onboarded before the run
+RETURNING_SCENARIOS = {"returning_user", "multi_tab"}
+
+
+def parse_mix(mix: str):
+    """Parses 'new_user=0.2,returning_user=0.8' into normalized weights"""
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise typer.BadParameter(f"Unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}")
+        weights[name] = float(weight or 1)
+    total = sum(weights.values())
+    if total <= 0:
+        raise typer.BadParameter("Scenario weights must add up to more than 0")
+    return {name: weight / total for name, weight in weights.items()}
+
+
+def start_app(port: int, workers: int, assets_dir: str, tmdb_url: str, log_path: str):
+    env = loadtest_env(MODEL_ASSETS_DIR=assets_dir, TMDB_API_URL=tmdb_url)
+    log = open(log_path, "w")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--no-access-log"],
+        cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    return process, log
+
+
+def wait_until_ready(base_url: str, process=None, timeout: float = 600.0):
+    """Polls /health until the model assets are loaded"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"App exited during startup with code {process.returncode}")
+        try:
+            if httpx.get(f"{base_url}/health", timeout=2).json().get("model_assets_loaded"):
+                return
+        except (httpx.HTTPError, ValueError):
+            pass
+        time.sleep(1)
+    raise TimeoutError(f"App at {base_url} wasn't ready after {timeout:.0f}s")
+
+
+async def onboard_returning_users(client, catalog, count, swipes, seed):
+    """Creates the pool of onboarded users that returning_user sessions log in as"""
+    recorder = Recorder()
+    recorder.stage = "setup"
+    semaphore = asyncio.Semaphore(10)
+
+    async def onboard(i):
+        async with semaphore:
+            session = Session(client, recorder, catalog, think_ms=0, rng=random.Random(seed + i))
+            if await session.register_and_login():
+                await session.swipe(swipes)
+                return session.token
+
+    tokens = await asyncio.gather(*(onboard(i) for i in range(count)))
+    return [t for t in tokens if t]
+
+
+async def run_stage(client, recorder, catalog, rate, seconds, mix, tokens, think_ms, swipes, pages, rng):
+    """
+    Starts sessions as a Poisson process at `rate` per second for `seconds`, then waits for
+    them to finish.
+
+    Returns:
+        Tuple of (sessions started, wall time including the drain).
+    """
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    tasks = []
+    start = time.perf_counter()
+    next_arrival = start
+    while True:
+        next_arrival += rng.expovariate(rate)
+        if next_arrival - start > seconds:
+            break
+        await asyncio.sleep(max(0.0, next_arrival - time.perf_counter()))
+
+        name = rng.choices(names, weights)[0]
+        session = Session(client, recorder, catalog, think_ms, random.Random(rng.random()))
+        if name in RETURNING_SCENARIOS:
+            if not tokens:
+                continue
+            session.token = rng.choice(tokens)
+        tasks.append(asyncio.create_task(SCENARIOS[name](session, swipes, pages)))
+
+    await asyncio.gather(*tasks)
+    return len(tasks), time.perf_counter() - start
+
+
+async def scrape_singleflight(client):
+    """
+    The app's singleflight_calls_total counters as {group: {outcome: count}}, summed over its
+    workers, or None if /metrics isn't available.
+    """
+    try:
+        response = await client.get("/metrics")
+    except httpx.HTTPError:
+        return None
+    if response.status_code != 200:
+        return None
+    counts = defaultdict(dict)
+    for line in response.text.splitlines():
+        if line.startswith("singleflight_calls_total{"):
+            labels, _, value = line.rpartition(" ")
+            label_values = dict(re.findall(r'(\w+)="([^"]*)"', labels))
+            counts[label_values["group"]][label_values["outcome"]] = float(value)
+    return dict(counts)
+
+
+def singleflight_delta(before, after):
+    """Calls executed and coalesced per group between two scrapes"""
+    if before is None or after is None:
+        return None
+    return {
+        group: {outcome: count - before.get(group, {}).get(outcome, 0.0) for outcome, count in outcomes.items()}
+        for group, outcomes in after.items()
+    }
+
+
+def summarize_stage(samples, wall_seconds, slo_p99_ms, max_error_rate):
+    by_route = defaultdict(list)
+    for _, route, status, seconds, error in samples:
+        by_route[route].append((status, seconds, error))
+    by_route["ALL"] = [s for route_samples in list(by_route.values()) for s in route_samples]
+
+    routes = {}
+    for route, route_samples in sorted(by_route.items()):
+        statuses = defaultdict(int)
+        errors = 0
+        client_errors = 0
+        for status, _, error in route_samples:
+            statuses[str(status) if status is not None else error] += 1
+            if status is None or status >= 500:
+                errors += 1
+            elif status >= 400:
+                client_errors += 1
+        latency = summarize_latencies([seconds for _, seconds, _ in route_samples])
+        error_rate = errors / len(route_samples)
+        routes[route] = {
+            "latency": latency,
+            "throughput_rps": len(route_samples) / wall_seconds,
+            "error_rate": error_rate,
+            "client_error_rate": client_errors / len(route_samples),
+            "statuses": dict(statuses),
+            "saturated": latency["p99_ms"] > slo_p99_ms or error_rate > max_error_rate,
+        }
+    return routes
+
+
+def main(
+    base_url: str = typer.Option(None, help="Target an already running app instead of starting one"),
+    assets_dir: str = "loadtest_assets",
+    port: int = 8900,
+    workers: int = 1,
+    rates: str = "0.5,1,2,4,8",
+    stage_seconds: float = 60.0,
+    mix: str = "new_user=0.2,returning_user=0.6,browser=0.2",
+    returning_users: int = 50,
+    think_ms: float = 500.0,
+    swipes: int = 10,
+    pages: int = 3,
+    tmdb_latency_ms: float = 50.0,
+    tmdb_jitter_ms: float = 50.0,
+    tmdb_error_rate: float = 0.0,
+    max_connections: int = 500,
+    request_timeout: float = 30.0,
+    slo_p99_ms: float = 1000.0,
+    max_error_rate: float = 0.01,
+    seed: int = 0,
+):
+    weights = parse_mix(mix)
+    stage_rates = [float(r) for r in rates.split(",") if r.strip()]
+    assets_dir = os.path.abspath(assets_dir)
+    catalog = Catalog(joblib.load(os.path.join(assets_dir, "movies_df.pkl")), GENRES)
+
+    tmdb_server, tmdb_url = start_fake_tmdb(tmdb_latency_ms, tmdb_jitter_ms, tmdb_error_rate)
+    process = log = None
+    if base_url is None:
+        base_url = f"http://127.0.0.1:{port}"
+        log_path = os.path.abspath("loadtest_app.log")
+        typer.echo(f"Starting app on {base_url} ({workers} worker(s)); logs in {log_path}")
+        process, log = start_app(port, workers, assets_dir, tmdb_url, log_path)
+
+    try:
+        wait_until_ready(base_url, process)
+        results = asyncio.run(_run(
+            base_url, catalog, weights, stage_rates, stage_seconds, returning_users, think_ms, swipes,
+            pages, max_connections, request_timeout, slo_p99_ms, max_error_rate, seed,
+        ))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+            log.close()
+        tmdb_server.shutdown()
+
+    results["config"] = {
+        "mix": weights, "stage_seconds": stage_seconds, "think_ms": think_ms, "swipes": swipes,
+        "pages": pages, "workers": workers, "tmdb_latency_ms": tmdb_latency_ms,
+        "tmdb_jitter_ms": tmdb_jitter_ms, "tmdb_error_rate": tmdb_error_rate,
+        "slo_p99_ms": slo_p99_ms, "max_error_rate": max_error_rate, "movies": len(catalog.tconsts),
+    }
+    typer.echo(f"Report written to {write_report('loadtest', results)}")
+
+
+async def _run(base_url, catalog, weights, stage_rates, stage_seconds, returning_users, think_ms, swipes, pages,
+               max_connections, request_timeout, slo_p99_ms, max_error_rate, seed):
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=request_timeout) as client:
+        tokens = []
+        if RETURNING_SCENARIOS & set(weights):
+            typer.echo(f"Onboarding {returning_users} returning users...")
+            tokens = await onboard_returning_users(client, catalog, returning_users, swipes, seed)
+
+        rng = random.Random(seed)
+        stages = []
+        saturation = {}
+        for rate in stage_rates:
+            recorder = Recorder()
+            recorder.stage = rate
+            flights_before = await scrape_singleflight(client)
+            sessions, wall = await run_stage(client, recorder, catalog, rate, stage_seconds, weights, tokens,
+                                             think_ms, swipes, pages, rng)
+            routes = summarize_stage(recorder.samples, wall, slo_p99_ms, max_error_rate) if recorder.samples else {}
+            # Duplicate computations the app avoided by coalescing concurrent identical calls
+            flights = singleflight_delta(flights_before, await scrape_singleflight(client))
+            stages.append({"rate": rate, "sessions": sessions, "wall_seconds": wall, "routes": routes,
+                           "singleflight": flights})
+
+            typer.echo(f"--- {rate:g} sessions/s: {sessions} sessions in {wall:.0f}s ---")
+            for route, r in routes.items():
+                flag = "  SATURATED" if r["saturated"] else ""
+                typer.echo(f"  {route:<28} {r['throughput_rps']:7.1f} req/s  p50 {r['latency']['p50_ms']:7.1f}  "
+                           f"p95 {r['latency']['p95_ms']:7.1f}  p99 {r['latency']['p99_ms']:7.1f} ms  "
+                           f"errors {r['error_rate']:.1%}{flag}")
+                if r["saturated"]:
+                    saturation.setdefault(route, rate)
+            for group, counts in (flights or {}).items():
+                executed, coalesced = counts.get("executed", 0.0), counts.get("coalesced", 0.0)
+                typer.echo(f"  singleflight {group:<15} {coalesced:.0f} of {executed + coalesced:.0f} calls coalesced")
+
+    typer.echo("Saturation points (sessions/s): " +
+               (", ".join(f"{route} @ {rate:g}" for route, rate in saturation.items()) or "none reached"))
+    return {"stages": stages, "saturation_points": saturation}
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,168 @@
+# User sessions replayed by the load harness.
+# Each scenario is a coroutine that plays one user's visit through a Session, which times
+# every request under a route name so results can be broken down per route.
+import asyncio
+import random
+import time
+import uuid
+
+import httpx
+
+PASSWORD = "loadtest-password"
+
+
+class Catalog:
+    """The slice of the catalog sessions pick movies and search queries from"""
+
+    def __init__(self, movies_df, genres):
+        self.tconsts = movies_df['tconst'].tolist()
+        self.titles = movies_df['primaryTitle'].tolist()
+        self.genres = list(genres)
+
+
+class Recorder:
+    """Collects (stage, route, status, seconds, error) samples; status is None for transport errors"""
+
+    def __init__(self):
+        self.samples = []
+        self.stage = None
+
+    def record(self, route, status, seconds, error=None):
+        self.samples.append((self.stage, route, status, seconds, error))
+
+
+class Session:
+    def __init__(self, client: httpx.AsyncClient, recorder: Recorder, catalog: Catalog,
+                 think_ms: float, rng: random.Random):
+        self.client = client
+        self.recorder = recorder
+        self.catalog = catalog
+        self.think_ms = think_ms
+        self.rng = rng
+        self.token = None
+
+    @property
+    def auth_headers(self):
+        return {"Authorization": f"Bearer {self.token}"} if self.token else {}
+
+    async def request(self, method, route, url, **kwargs):
+        """
+        Sends a request and records its latency under `route`.
+
+        Returns:
+            The response, or None if the request failed before getting one.
+        """
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            self.recorder.record(route, None, time.perf_counter() - start, type(e).__name__)
+            return None
+        self.recorder.record(route, response.status_code, time.perf_counter() - start)
+        return response
+
+    async def think(self, scale=1.0):
+        """Pauses like a user would between actions (exponentially distributed)"""
+        if self.think_ms > 0:
+            await asyncio.sleep(self.rng.expovariate(1000.0 / (self.think_ms * scale)))
+
+    async def register_and_login(self):
+        email = f"load-{uuid.uuid4().hex[:16]}@example.com"
+        response = await self.request("POST", "POST /users/register", "/users/register",
+                                      json={"email": email, "password": PASSWORD})
+        if response is None or response.status_code != 201:
+            return False
+        await self.think()
+        response = await self.request("POST", "POST /users/login", "/users/login",
+                                      data={"username": email, "password": PASSWORD})
+        if response is None or response.status_code != 200:
+            return False
+        self.token = response.json()["access_token"]
+        return True
+
+    async def swipe(self, n):
+        for tconst in self.rng.sample(self.catalog.tconsts, n):
+            interaction_type = "like" if self.rng.random() < 0.6 else "dislike"
+            await self.request("POST", "POST /interactions", "/interactions", headers=self.auth_headers,
+                               json={"tconst": tconst, "interaction_type": interaction_type})
+            await self.think()
+
+    async def browse_recommendations(self, pages, params=None):
+        cursor = None
+        for _ in range(pages):
+            query = dict(params or {})
+            if cursor:
+                query["cursor"] = cursor
+            response = await self.request("GET", "GET /recommendations", "/recommendations",
+                                          headers=self.auth_headers, params=query)
+            if response is None or response.status_code != 200:
+                return
+            cursor = response.headers.get("x-next-cursor")
+            await self.think()
+            if not cursor:
+                return
+
+
+async def new_user(session: Session, swipes: int, pages: int):
+    """Registers, onboards (genres, trending, swipes) and then browses recommendations"""
+    if not await session.register_and_login():
+        return
+    await session.think()
+    genres = session.rng.sample(session.catalog.genres, session.rng.randint(1, 3))
+    await session.request("POST", "POST /users/me/genres", "/users/me/genres",
+                          headers=session.auth_headers, json={"genres": genres})
+    await session.think()
+    await session.request("GET", "GET /onboarding/trending", "/onboarding/trending")
+    await session.think()
+    await session.swipe(swipes)
+    await session.browse_recommendations(pages)
+
+
+async def returning_user(session: Session, swipes: int, pages: int):
+    """
+    An already onboarded user who browses recommendations, sometimes filtered, and likes a few movies.
+    The harness gives the session the token of a user it onboarded before the run.
+    """
+    if session.rng.random() < 0.25:
+        params = {"genre": session.rng.choice(session.catalog.genres)}
+    else:
+        params = None
+    await session.browse_recommendations(pages, params)
+    await session.swipe(max(1, swipes // 5))
+    await session.browse_recommendations(1)
+
+
+async def multi_tab(session: Session, swipes: int, pages: int, tabs: int = 3):
+    """
+    A returning user who likes a movie and then opens recommendations in several tabs at once
+    (or whose client retries), so identical rankings and TMDb lookups arrive concurrently.
+    """
+    await session.swipe(1)
+    await asyncio.gather(*[
+        session.request("GET", "GET /recommendations", "/recommendations", headers=session.auth_headers)
+        for _ in range(tabs)
+    ])
+    await session.think()
+    await session.browse_recommendations(pages)
+
+
+async def browser(session: Session, swipes: int, pages: int):
+    """An anonymous visitor paging through trending and typing a title into search"""
+    response = await session.request("GET", "GET /onboarding/trending", "/onboarding/trending")
+    if response is not None and response.headers.get("x-next-cursor"):
+        await session.think()
+        await session.request("GET", "GET /onboarding/trending", "/onboarding/trending",
+                              params={"cursor": response.headers["x-next-cursor"]})
+    title = session.rng.choice(session.catalog.titles)
+    # As-you-type: one request per keystroke after the second character
+    for end in range(2, min(len(title), 8) + 1):
+        await session.request("GET", "GET /movies/search", "/movies/search", params={"q": title[:end]})
+        await session.think(scale=0.2)
+
+
+SCENARIOS = {
+    "new_user": new_user,
+    "returning_user": returning_user,
+    "multi_tab": multi_tab,
+    "browser": browser,
+}
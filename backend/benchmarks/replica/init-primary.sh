@@ -0,0 +1,7 @@
+#!/bin/bash
+# Runs once when the primary's data directory is created (docker-entrypoint-initdb.d)
+set -e
+
+psql -v ON_ERROR_STOP=1 --username "$POSTGRES_USER" --dbname "$POSTGRES_DB" \
+    -c "CREATE ROLE replicator WITH REPLICATION LOGIN PASSWORD 'replicator';"
+echo "host replication replicator all md5" >> "$PGDATA/pg_hba.conf"
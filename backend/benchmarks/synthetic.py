@@ -0,0 +1,94 @@
+# Synthetic stand-ins for the model assets, so benchmarks can run at any catalog size
+# without downloading anything.
+import numpy as np
+import pandas as pd
+
+GENRES = [
+    "Action", "Adventure", "Animation", "Biography", "Comedy", "Crime", "Documentary", "Drama",
+    "Family", "Fantasy", "History", "Horror", "Music", "Musical", "Mystery", "Romance",
+    "Sci-Fi", "Sport", "Thriller", "War", "Western",
+]
+
+_WORDS = (
+    "the of and a in to love night last dark man woman story life dead house city war day "
+    "king girl boy time world black blue red secret return lost home road star dream blood "
+    "little big great american french summer winter shadow fire ice heart river golden "
+    "silent wild final first new old journey legend empire rise fall ghost island moon sun"
+).split()
+
+
+def synthetic_movies_df(n_movies: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Generates a movies DataFrame shaped like movies_df.
+
+    Votes follow a heavy-tailed (log-normal) distribution like IMDb's, ratings are roughly
+    normal around 6.5 and each movie has one to three genres.
+    """
+    rng = np.random.default_rng(seed)
+
+    words = np.array(_WORDS)
+    n_words = rng.integers(1, 5, n_movies)
+    word_ids = rng.integers(0, len(words), n_words.sum())
+    splits = np.cumsum(n_words)[:-1]
+    titles = [" ".join(w).title() for w in np.split(words[word_ids], splits)]
+    # Make most titles unique, like real catalogs
+    titles = [f"{t} {i}" if i % 3 else t for i, t in enumerate(titles)]
+
+    genre_names = np.array(GENRES)
+    n_genres = rng.integers(1, 4, n_movies)
+    genre_ids = rng.integers(0, len(genre_names), n_genres.sum())
+    genres = [",".join(sorted(set(g))) for g in np.split(genre_names[genre_ids], np.cumsum(n_genres)[:-1])]
+
+    return pd.DataFrame({
+        "tconst": [f"tt{i:08d}" for i in range(n_movies)],
+        "primaryTitle": titles,
+        "startYear": rng.integers(1920, 2026, n_movies).astype(np.int64),
+        "genres": genres,
+        "averageRating": np.clip(rng.normal(6.5, 1.2, n_movies), 1.0, 10.0).round(1),
+        "numVotes": np.maximum(rng.lognormal(6.0, 2.0, n_movies), 5).astype(np.int64),
+    })
+
+
+def synthetic_feature_matrices(movies_df, people_per_movie: int = 10, seed: int = 0):
+    """
+    Generates people and genre TF-IDF-like matrices for a synthetic movies_df.
+
+    The people matrix has about `people_per_movie` non-zeros per row over a vocabulary that
+    grows with the catalog, with Zipf-like reuse of popular people. The genre matrix has one
+    column per genre. Rows are L2-normalised like scikit-learn's TfidfVectorizer output.
+
+    Returns:
+        Tuple of (people_matrix, genre_matrix) as float64 CSR matrices.
+    """
+    import scipy.sparse as sp
+    from sklearn.preprocessing import normalize
+
+    rng = np.random.default_rng(seed)
+    n_movies = len(movies_df)
+
+    n_people = max(1000, n_movies // 2)
+    nnz_per_row = np.clip(rng.poisson(people_per_movie, n_movies), 1, None)
+    rows = np.repeat(np.arange(n_movies), nnz_per_row)
+    cols = (rng.zipf(1.3, rows.size) - 1) % n_people
+    people = sp.csr_matrix((rng.uniform(0.5, 1.5, rows.size), (rows, cols)), shape=(n_movies, n_people))
+    people.sum_duplicates()
+
+    genre_index = {g: i for i, g in enumerate(GENRES)}
+    g_rows, g_cols = [], []
+    for i, value in enumerate(movies_df['genres'].to_numpy()):
+        for g in value.split(","):
+            g_rows.append(i)
+            g_cols.append(genre_index[g])
+    genre = sp.csr_matrix((np.ones(len(g_rows)), (g_rows, g_cols)), shape=(n_movies, len(GENRES)))
+    # Rarer genres weigh more, like IDF
+    idf = np.log((1 + n_movies) / (1 + np.asarray((genre > 0).sum(axis=0)).ravel())) + 1
+    genre = genre @ sp.diags(idf)
+
+    return normalize(people).tocsr(), normalize(genre).tocsr()
+
+
+def synthetic_indices_map(movies_df) -> pd.Series:
+    """'Title (Year)' -> index label, like indices_map (one label per key)"""
+    keys = movies_df['primaryTitle'] + " (" + movies_df['startYear'].astype(str) + ")"
+    indices_map = pd.Series(movies_df.index, index=keys)
+    return indices_map[~indices_map.index.duplicated()]
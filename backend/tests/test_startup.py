@@ -0,0 +1,24 @@
+# Import budget of app.main (see app/startup.py): fails when `import app.main` in a fresh
+# interpreter exceeds STARTUP_IMPORT_BUDGET_MS or pulls in a module meant to be deferred.
+import os
+
+import pytest
+
+from app import startup
+
+
+@pytest.fixture(autouse=True)
+def auth_settings(monkeypatch):
+    # app.auth reads these at import time; values already set in the environment are kept
+    for name, value in (("SECRET_KEY", "startup-test"), ("ALGORITHM", "HS256"), ("ACCESS_TOKEN_EXPIRE_MINUTES", "30")):
+        monkeypatch.setenv(name, os.environ.get(name, value))
+
+
+def test_import_within_budget():
+    imports = startup.measure_imports()
+    assert imports["total_ms"] <= startup.STARTUP_IMPORT_BUDGET_MS, startup.format_report(imports)
+
+
+def test_no_deferred_module_imported_eagerly():
+    imports = startup.measure_imports()
+    assert imports["eager_deferred_modules"] == [], startup.format_report(imports)